@@ -0,0 +1,221 @@
+""" CONTAINS
+        ParticleBackend interface and the vectorized NumPy CPU backend """
+
+import numpy as np
+
+MAX_POSSIBLE_TYPES = 30
+
+
+def spawn_particles(count, half_extents, numTypes):
+    """ Uniform box spawn with zero velocity, draws from np.random so a seeded run respawns identically. """
+    half_extents = np.asarray(half_extents, dtype=np.float32)
+    positions = np.random.uniform(low=-half_extents, high=half_extents, size=(count, 3)).astype(np.float32)
+    types = np.random.randint(0, numTypes, size=(count, 1)).astype(np.float32)
+    particle_data = np.zeros((count, 8), dtype=np.float32)
+    particle_data[:, 0:3] = positions
+    particle_data[:, 7] = types.flatten()
+    return particle_data
+
+
+def hashed_force_matrix(randomSeed, numTypes, gridSize):
+    """ Interaction strength indexed [acting type, receiving type], the hash the kernel used to evaluate per invocation. """
+    types = np.arange(MAX_POSSIBLE_TYPES, dtype=np.float32)
+    acting, receiving = np.meshgrid(types, types, indexing="ij")
+    phase = acting * np.float32(12.9898) + receiving * np.float32(78.233) + np.float32(randomSeed) * np.float32(45.164)
+    noise = np.sin(phase) * np.float32(43758.5453)
+    noise -= np.floor(noise)
+    force_scaling = np.float32(gridSize ** 3)
+    matrix = noise * force_scaling - force_scaling / 2
+    return mask_force_matrix(matrix, numTypes)
+
+
+def mask_force_matrix(matrix, numTypes):
+    matrix = np.array(matrix, dtype=np.float32)
+    matrix[numTypes:, :] = 0.0
+    matrix[:, numTypes:] = 0.0
+    return matrix
+
+
+class ParticleBackend:
+    """ One simulation step over (N, 8) float32 particle rows: position.xyz, stress, velocity.xyz, type. """
+    name = None
+
+    def load(self, particle_data):
+        raise NotImplementedError
+
+    def read(self):
+        raise NotImplementedError
+
+    def step(self, params, force_matrix):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CPUBackend(ParticleBackend):
+    """ NumPy port of particles.comp, cell list built with argsort, neighbour pairs evaluated in batches. """
+    name = "cpu"
+    MAX_POSSIBLE_TYPES = MAX_POSSIBLE_TYPES
+    MAX_ADJUSTMENT = 25.0
+    BASE_DAMPING = 0.93
+
+    def __init__(self, batchParticles=8192):
+        self.batchParticles = batchParticles
+        self.particle_data = np.zeros((0, 8), dtype=np.float32)
+
+    def load(self, particle_data):
+        self.particle_data = np.array(particle_data, dtype=np.float32, copy=True)
+
+    def read(self):
+        return self.particle_data.copy()
+
+    @staticmethod
+    def wrap_cell(cell, gridDims):
+        return cell - gridDims * np.floor_divide(cell, gridDims)
+
+    @staticmethod
+    def grid_dims(params):
+        """ Cells per axis (x, y, z), the cell grid wraps independently of the world. """
+        return np.asarray(params["gridDims"], dtype=np.int64)
+
+    @staticmethod
+    def search_span(params):
+        if params["cellSize"] > 0.0001:
+            return int(np.ceil(np.float32(params["DETECTION_RADIUS"]) / np.float32(params["cellSize"])))
+        if params["DETECTION_RADIUS"] > 0.0001:
+            return 1
+        return 0
+
+    def build_cell_list(self, cells, gridDims):
+        keys = self.cell_keys(self.wrap_cell(cells, gridDims), gridDims)
+        cellCount = int(np.prod(gridDims))
+        order = np.argsort(keys, kind="stable")
+        counts = np.bincount(keys, minlength=cellCount)
+        cell_start = np.zeros(cellCount + 1, dtype=np.int64)
+        np.cumsum(counts, out=cell_start[1:])
+        return order, cell_start
+
+    @staticmethod
+    def cell_keys(cells, gridDims):
+        return (cells[..., 2] * gridDims[1] + cells[..., 1]) * gridDims[0] + cells[..., 0]
+
+    def step(self, params, force_matrix):
+        count = min(int(params["PARTICLE_COUNT"]), len(self.particle_data))
+        self.advance(self.particle_data, count, params, force_matrix)
+
+    def advance(self, data, count, params, force_matrix, source_count=None):
+        """ Steps rows [0, count) in place, neighbours come from rows [0, source_count). """
+        source_count = count if source_count is None else source_count
+        if count == 0:
+            return
+
+        gridDims = self.grid_dims(params)
+        cellSize = np.float32(params["cellSize"])
+        positions = data[:source_count, 0:3]
+        types = data[:source_count, 7]
+
+        cells = np.floor((positions + np.float32(1.0)) / cellSize).astype(np.int64)
+        order, cell_start = self.build_cell_list(cells, gridDims)
+
+        span = self.search_span(params)
+        axis = np.arange(-span, span + 1)
+        # same dz, dy, dx nesting as the kernel, so the interaction cap cuts at the same neighbours
+        offsets = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)[:, ::-1]
+
+        adjustment = np.zeros((count, 3), dtype=np.float64)
+        interactions = np.zeros(count, dtype=np.int64)
+        for begin in range(0, count, self.batchParticles):
+            end = min(begin + self.batchParticles, count)
+            neighbor_keys = self.cell_keys(self.wrap_cell(cells[begin:end, None, :] + offsets[None, :, :], gridDims), gridDims)
+            self.accumulate_batch(begin, end, positions, types, order,
+                                  cell_start[neighbor_keys], cell_start[neighbor_keys + 1] - cell_start[neighbor_keys],
+                                  params, force_matrix, adjustment, interactions)
+
+        self.integrate(data, count, adjustment.astype(np.float32), interactions, params)
+
+    def accumulate_batch(self, begin, end, positions, types, order, neighbor_begin, neighbor_count,
+                         params, force_matrix, adjustment, interactions):
+        batch_count = neighbor_count.ravel()
+        total = int(batch_count.sum())
+        if total == 0:
+            return
+        offsets_per_particle = neighbor_count.shape[1]
+
+        # one entry per (particle, neighbour cell, occupant), in the kernel's traversal order
+        group = np.repeat(np.arange(batch_count.size), batch_count)
+        group_first = np.cumsum(batch_count) - batch_count
+        within = np.arange(total) - group_first[group]
+        other = order[neighbor_begin.ravel()[group] + within]
+        particle = begin + group // offsets_per_particle
+
+        not_self = other != particle
+        group, other, particle = group[not_self], other[not_self], particle[not_self]
+        first_in_cell = np.ones(group.size, dtype=bool)
+        first_in_cell[1:] = group[1:] != group[:-1]
+
+        relative = positions[other] - positions[particle]
+        dist = np.sqrt(np.einsum("ij,ij->i", relative, relative))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            direction = relative / dist[:, None]
+            forceMag = np.float32(1.0) / (dist * dist)
+
+        activeTypes = int(params["ACTIVE_TYPES"])
+        tooClose = np.float32(params["TOO_CLOSE_RADIUS"])
+        detection = np.float32(params["DETECTION_RADIUS"])
+        otherType = np.rint(types[other]).astype(np.int64)
+        otherValid = (otherType >= 0) & (otherType < activeTypes)
+        inRange = otherValid & (dist > tooClose) & (dist < detection)
+        close = otherValid & ~inRange & (dist < tooClose)
+        interacting = (inRange | close).astype(np.int64)
+
+        # the kernel leaves a neighbour cell once the count passes the cap, so past it
+        # only the first occupant of each further cell is still evaluated
+        before = np.cumsum(interacting) - interacting
+        before -= before[np.searchsorted(particle, particle)]
+        kept = (before <= int(params["MAX_PARTICLE_INTERACTIONS"])) | first_in_cell
+        inRange &= kept
+        close &= kept
+
+        selfType = np.clip(np.rint(types[particle]).astype(np.int64), 0, self.MAX_POSSIBLE_TYPES - 1)
+        strength = force_matrix[np.clip(otherType, 0, self.MAX_POSSIBLE_TYPES - 1), selfType]
+        with np.errstate(invalid="ignore", over="ignore"):
+            strongRepel = np.float32(1.0) / (dist * dist * dist + np.float32(0.00001))
+            contribution = np.where(inRange[:, None], (strength * forceMag)[:, None] * direction, 0.0)
+            contribution -= np.where(close[:, None], direction * strongRepel[:, None], 0.0)
+
+        local = particle - begin
+        for axis in range(3):
+            adjustment[begin:end, axis] += np.bincount(local, weights=contribution[:, axis], minlength=end - begin)
+        interactions[begin:end] += np.bincount(local, minlength=end - begin, weights=inRange | close).astype(np.int64)
+
+    def integrate(self, data, count, adjustment, interactions, params):
+        gridSize = np.float32(params["gridSize"])
+        stepSize = np.float32(params["stepSize"])
+        dt = np.float32(params["deltaTime"]) * stepSize
+        positions = data[:count, 0:3]
+        velocities = data[:count, 4:7]
+        types = data[:count, 7]
+
+        selfType = np.rint(types).astype(np.int64)
+        adjustment[(selfType < 0) | (selfType >= int(params["ACTIVE_TYPES"]))] = 0.0
+
+        length = np.sqrt(np.einsum("ij,ij->i", adjustment, adjustment))
+        capped = length > self.MAX_ADJUSTMENT
+        adjustment[capped] *= (np.float32(self.MAX_ADJUSTMENT) / length[capped])[:, None]
+        adjustment[~np.isfinite(adjustment).all(axis=1)] = 0.0
+
+        damping = np.float32(np.clip(np.float32(self.BASE_DAMPING) ** stepSize, 0.6, 0.99))
+        new_velocity = velocities * damping + adjustment * dt
+        stress = np.sqrt(np.einsum("ij,ij->i", adjustment * np.float32(0.001), adjustment * np.float32(0.001)))
+        new_position = positions + new_velocity * dt
+
+        half = gridSize / np.float32(2.0)
+        outside = (np.abs(new_position) >= half).any(axis=1)
+        shifted = new_position[outside] + half
+        new_position[outside] = (shifted - gridSize * np.floor(shifted / gridSize) - half) * np.float32(0.95)
+        new_velocity[outside] *= np.float32(0.95)
+
+        data[:count, 0:3] = new_position
+        data[:count, 3] = stress * np.float32(25.0) * (interactions.astype(np.float32) / np.float32(params["MAX_PARTICLE_INTERACTIONS"]))
+        data[:count, 4:7] = new_velocity
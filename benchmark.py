@@ -0,0 +1,588 @@
+""" Benchmarks, all headless, each writes a JSON report.
+
+    python benchmark.py suite --tag quick --baseline config/benchmark_baseline.json
+    python benchmark.py suite --save-baseline config/benchmark_baseline.json
+    python benchmark.py scaling --particles 50000 --workers 1 2 4 8 16 32 64 --steps 5
+    python benchmark.py readback --particles 1000000 --frames 60
+    python benchmark.py layout --particles 1000000 --steps 30 --partition-mode counting_sort
+    python benchmark.py kernel --particles 500000 --densities 2 8 32 64
+    python benchmark.py sparse --particles 1000000 --world-size 1000 --clusters 64
+    python benchmark.py universes --particles 5000 --universes 1 8 32 128
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure simulation throughput.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    suite = commands.add_parser("suite", help="per-pass GPU timings of the fixed scenarios")
+    suite.add_argument("--scenarios", default="config/benchmark_scenarios.json")
+    suite.add_argument("--only", nargs="+", default=None, help="scenario names to run")
+    suite.add_argument("--tag", default=None, help="only scenarios carrying this tag")
+    suite.add_argument("--frames", type=int, default=60)
+    suite.add_argument("--warmup", type=int, default=10)
+    suite.add_argument("--backend", default="egl", help="offscreen GL backend")
+    suite.add_argument("--width", type=int, default=900)
+    suite.add_argument("--height", type=int, default=900)
+    suite.add_argument("--baseline", default=None, help="compare against this report")
+    suite.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown over the baseline, 0.15 = 15%%")
+    suite.add_argument("--save-baseline", default=None, help="also write the report here")
+    suite.add_argument("--out", default="out/benchmark")
+
+    scaling = commands.add_parser("scaling", help="cpu_sharded steps/s against worker count")
+    scaling.add_argument("--particles", type=int, default=50_000)
+    scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    scaling.add_argument("--steps", type=int, default=5)
+    scaling.add_argument("--grid-size", type=int, default=100, help="world edge")
+    scaling.add_argument("--spawn-size", type=float, default=15.0, help="spawn cube edge, Particles.spawnGridSize")
+    scaling.add_argument("--fixed-grid", action="store_true",
+                         help="grid-size^3 cells of 1.0 instead of the grid autoGrid derives from radius and bounds")
+    scaling.add_argument("--types", type=int, default=4)
+    scaling.add_argument("--seed", type=int, default=0)
+    scaling.add_argument("--check", action="store_true", help="also step the single-process kernel and compare")
+    scaling.add_argument("--out", default="out/benchmark")
+
+    readback = commands.add_parser("readback", help="frame time with and without an async readback every frame")
+    readback.add_argument("--particles", type=int, default=1_000_000)
+    readback.add_argument("--frames", type=int, default=60)
+    readback.add_argument("--warmup", type=int, default=5)
+    readback.add_argument("--backend", default="egl", help="offscreen GL backend")
+    readback.add_argument("--width", type=int, default=900)
+    readback.add_argument("--height", type=int, default=900)
+    readback.add_argument("--out", default="out/benchmark")
+
+    layout = commands.add_parser("layout", help="per-pass times and particle traffic of the full and compact buffer layouts")
+    layout.add_argument("--particles", type=int, default=1_000_000)
+    layout.add_argument("--steps", type=int, default=30)
+    layout.add_argument("--warmup", type=int, default=5)
+    layout.add_argument("--layouts", nargs="+", default=["full", "compact"])
+    layout.add_argument("--partition-mode", default="counting_sort")
+    layout.add_argument("--backend", default="egl", help="offscreen GL backend")
+    layout.add_argument("--out", default="out/benchmark")
+
+    kernel = commands.add_parser("kernel", help="direct against tiled physics kernel over particle densities")
+    kernel.add_argument("--particles", type=int, default=500_000)
+    kernel.add_argument("--densities", type=float, nargs="+", default=[2.0, 8.0, 32.0, 64.0], help="particles per cell")
+    kernel.add_argument("--steps", type=int, default=20)
+    kernel.add_argument("--warmup", type=int, default=3)
+    kernel.add_argument("--types", type=int, default=4)
+    kernel.add_argument("--grid-size", type=int, default=None, help="grid cells per axis, the tiled dispatch covers all of them")
+    kernel.add_argument("--backend", default="egl", help="offscreen GL backend")
+    kernel.add_argument("--out", default="out/benchmark")
+
+    sparse = commands.add_parser("sparse", help="partition memory and times of the dense grid and the hash table in a large world")
+    sparse.add_argument("--particles", type=int, default=1_000_000)
+    sparse.add_argument("--world-size", type=int, default=1000, help="world edge (gridSize)")
+    sparse.add_argument("--clusters", type=int, default=64, help="particle clusters spread over the world")
+    sparse.add_argument("--cluster-size", type=float, default=20.0, help="cluster cube edge")
+    sparse.add_argument("--modes", nargs="+", default=["counting_sort", "hashed"])
+    sparse.add_argument("--steps", type=int, default=10)
+    sparse.add_argument("--warmup", type=int, default=2)
+    sparse.add_argument("--types", type=int, default=4)
+    sparse.add_argument("--seed", type=int, default=0)
+    sparse.add_argument("--backend", default="egl", help="offscreen GL backend")
+    sparse.add_argument("--out", default="out/benchmark")
+
+    universes = commands.add_parser("universes", help="batched universes against stepping them one at a time")
+    universes.add_argument("--particles", type=int, default=5_000, help="per universe")
+    universes.add_argument("--universes", type=int, nargs="+", default=[1, 8, 32, 128])
+    universes.add_argument("--steps", type=int, default=20)
+    universes.add_argument("--warmup", type=int, default=3)
+    universes.add_argument("--partition-mode", default="counting_sort")
+    universes.add_argument("--backend", default="egl", help="offscreen GL backend")
+    universes.add_argument("--out", default="out/benchmark")
+    return parser.parse_args(argv)
+
+
+def spawn(count, extent, types, seed):
+    """ Same layout Particles.init_particles produces: uniform cube, zero velocity, random type. """
+    rng = np.random.default_rng(seed)
+    particle_data = np.zeros((count, 8), dtype=np.float32)
+    particle_data[:, 0:3] = rng.uniform(-extent / 2, extent / 2, size=(count, 3))
+    particle_data[:, 7] = rng.integers(0, types, size=count)
+    return particle_data
+
+
+def spawn_clusters(count, gridSize, clusters, clusterSize, types, seed):
+    """ count particles in clusters cubes scattered over the world, mostly empty space in between. """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-0.45 * gridSize, 0.45 * gridSize, size=(clusters, 3))
+    particle_data = np.zeros((count, 8), dtype=np.float32)
+    particle_data[:, 0:3] = centers[rng.integers(0, clusters, size=count)] + rng.uniform(-clusterSize / 2, clusterSize / 2, size=(count, 3))
+    particle_data[:, 7] = rng.integers(0, types, size=count)
+    return particle_data
+
+
+def default_params(count, gridSize, types):
+    # Particles defaults, see Particles.sim_param_values
+    return {
+        "PARTICLE_COUNT": count,
+        "gridSize": gridSize,
+        "gridDims": (gridSize, gridSize, gridSize),
+        "cellSize": 1.0,
+        "deltaTime": 1.0 / 20.0,
+        "stepSize": 0.8,
+        "DETECTION_RADIUS": 1.2,
+        "TOO_CLOSE_RADIUS": 1.1,
+        "ACTIVE_TYPES": types,
+        "MAX_PARTICLE_INTERACTIONS": 500,
+        "PARTITION_MODE": 0,
+    }
+
+
+def engine_params(particle_data, gridSize, types, maxCellsPerParticle=4):
+    """ default_params with the grid Particles derives for a fresh state under autoGrid, one cell per
+        radius over the particle bounds plus a cell of margin; see Particles.derive_grid_dims. """
+    params = default_params(len(particle_data), gridSize, types)
+    cellSize = max(params["DETECTION_RADIUS"], params["TOO_CLOSE_RADIUS"])
+    positions = particle_data[:, 0:3].astype(np.float64)
+    extent = np.minimum(positions.max(axis=0) - positions.min(axis=0) + 2.0 * cellSize, gridSize)
+    dims = np.maximum(np.ceil(extent / cellSize), 3)
+    limit = max(maxCellsPerParticle * len(particle_data), 27)
+    if dims.prod() > limit:
+        dims = np.maximum(np.floor(dims * (limit / dims.prod()) ** (1.0 / 3.0)), 3)
+    params.update(cellSize=cellSize, gridDims=tuple(int(d) for d in dims))
+    return params
+
+
+def force_matrix(types, seed):
+    matrix = np.zeros((30, 30), dtype=np.float32)
+    matrix[:types, :types] = np.random.default_rng(seed).uniform(-1.0, 1.0, size=(types, types)) * 100.0
+    return matrix
+
+
+def scaling(args):
+    from backendC import CPUBackend
+    from shardC import ShardedCPUBackend
+
+    particle_data = spawn(args.particles, args.spawn_size, args.types, args.seed)
+    if args.fixed_grid:
+        params = default_params(args.particles, args.grid_size, args.types)
+    else:
+        params = engine_params(particle_data, args.grid_size, args.types)
+    matrix = force_matrix(args.types, args.seed)
+
+    reference = None
+    if args.check:
+        cpu = CPUBackend()
+        cpu.load(particle_data)
+        cpu.step(params, matrix)
+        reference = cpu.read()
+
+    rows = []
+    for workers in args.workers:
+        backend = ShardedCPUBackend(workers=workers)
+        backend.load(particle_data)
+        # first step starts the worker processes, keep it out of the timing
+        backend.step(params, matrix)
+        error = float(np.abs(backend.read() - reference).max()) if reference is not None else None
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            backend.step(params, matrix)
+        elapsed = time.perf_counter() - start
+        # largest slab over the mean, 1.0 is a perfect split
+        imbalance = float(np.diff(backend.rowStart).max() * backend.shards / args.particles)
+        rows.append({"workers": workers, "shards": backend.shards, "seconds": elapsed,
+                     "steps_per_second": args.steps / elapsed, "imbalance": imbalance, "max_error": error})
+        backend.close()
+
+    base = rows[0]["steps_per_second"] / rows[0]["shards"]
+    print(f"[Benchmark] {args.particles} particles, {params['gridDims']} cells of {params['cellSize']:g}, "
+          f"{args.steps} steps, {os.cpu_count()} cores")
+    for row in rows:
+        row["speedup"] = row["steps_per_second"] / rows[0]["steps_per_second"]
+        row["efficiency"] = row["steps_per_second"] / (base * row["shards"])
+        error = "" if row["max_error"] is None else f"  max error {row['max_error']:.1e}"
+        print(f"  {row['workers']:>3} workers ({row['shards']:>3} shards): {row['steps_per_second']:7.3f} steps/s  "
+              f"x{row['speedup']:5.2f}  efficiency {row['efficiency'] * 100:5.1f}%  imbalance {row['imbalance']:.2f}{error}")
+    return {"benchmark": "scaling", "cores": os.cpu_count(), "args": vars(args), "gridDims": params["gridDims"],
+            "cellSize": params["cellSize"], "results": rows}
+
+
+def load_scenarios(args):
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    if args.only:
+        missing = set(args.only) - set(scenarios)
+        if missing:
+            raise SystemExit(f"[Benchmark] Unknown scenarios: {', '.join(sorted(missing))}")
+        scenarios = {name: scenarios[name] for name in args.only}
+    if args.tag:
+        scenarios = {name: scenario for name, scenario in scenarios.items() if args.tag in scenario.get("tags", [])}
+    return scenarios
+
+
+def suite(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(args.width, args.height, args.backend)
+    import OpenGL.GL as gl
+    from gameC import Game
+    from headless import resize
+
+    game = Game()
+    resize(game, args.width, args.height)
+    particles = game.particles
+    profiler = particles.profiler
+
+    scenarios = load_scenarios(args)
+    results = {}
+    for name, scenario in scenarios.items():
+        np.random.seed(0)
+        particles.scheduler.reset()
+        particles.numTypes = scenario["numTypes"]
+        particles.detectionRadius = scenario["detectionRadius"]
+        # the cell grid follows the radius and the particle bounds, "autoGrid": false scenarios pin it to
+        # gridSize^3 cells of the detection radius instead
+        particles.autoGrid = scenario.get("autoGrid", True)
+        particles.cellSize = scenario["detectionRadius"]
+        particles.spawnGridSize = scenario["spawnGridSize"]
+        particles.particleCount = scenario["particleCount"]
+        if particles.gridSize != scenario["gridSize"]:
+            particles.gridSize = scenario["gridSize"]
+            particles.update_grid_size()
+        particles.set_particle_count()
+
+        # one simulation step per frame so every frame carries the same work
+        profiler.blocking = False
+        for _ in range(args.warmup):
+            particles.simulate_step()
+            game.render.scene()
+        profiler.reset()
+        profiler.blocking = True
+        for _ in range(args.frames):
+            with profiler.scope("frame"):
+                particles.simulate_step()
+                game.render.scene()
+        profiler.blocking = False
+
+        passes = profiler.percentiles()
+        frame = passes["frame"]["p50"]
+        results[name] = {"scenario": scenario, "gridDims": list(particles.gridDims), "passes": passes,
+                         "particles_per_second": scenario["particleCount"] / (frame / 1000.0) if frame > 0 else 0.0}
+        print(f"[Benchmark] {name}: frame p50 {frame:.2f} ms  "
+              + "  ".join(f"{scope} {timing['p50']:.2f}" for scope, timing in passes.items() if scope != "frame"))
+
+    report = {"benchmark": "suite", "renderer": gl.glGetString(gl.GL_RENDERER).decode(),
+              "frames": args.frames, "width": args.width, "height": args.height, "scenarios": results}
+    context.destroy()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Benchmark] baseline -> {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+    return report
+
+
+def readback(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(args.width, args.height, args.backend)
+    import OpenGL.GL as gl
+    from gameC import Game
+    from headless import resize
+
+    np.random.seed(0)
+    game = Game()
+    resize(game, args.width, args.height)
+    particles = game.particles
+    particles.particleCount = args.particles
+    particles.set_particle_count()
+
+    def frames(read):
+        frame_ms, latency, received = [], [], 0
+        for frame in range(args.warmup + args.frames):
+            start = time.perf_counter()
+            particles.simulate_step()
+            game.render.scene()
+            if read:
+                particles.request_readback(frame)
+                for result in particles.readback.poll():
+                    # touch the view so the pages are really read
+                    float(result.particles[-1, 0])
+                    latency.append(frame - result.tag)
+                    received += 1
+            # the readback must not cost the frame, so the frame ends where a swap would wait for the GPU
+            gl.glFinish()
+            if frame >= args.warmup:
+                frame_ms.append((time.perf_counter() - start) * 1000.0)
+        return frame_ms, latency, received
+
+    rows = {}
+    for mode, read in (("plain", False), ("readback", True)):
+        dropped = particles.readback.dropped
+        frame_ms, latency, received = frames(read)
+        rows[mode] = {"frame_p50_ms": float(np.percentile(frame_ms, 50)), "frame_p95_ms": float(np.percentile(frame_ms, 95)),
+                      "received": received, "dropped": particles.readback.dropped - dropped,
+                      "latency_frames": float(np.mean(latency)) if latency else None}
+        latency = "" if rows[mode]["latency_frames"] is None else f", {rows[mode]['latency_frames']:.1f} frames late"
+        print(f"[Benchmark] {mode}: frame p50 {rows[mode]['frame_p50_ms']:.2f} ms  p95 {rows[mode]['frame_p95_ms']:.2f} ms  "
+              f"{received} received, {rows[mode]['dropped']} dropped{latency}")
+    particles.readback.drain()
+    renderer = gl.glGetString(gl.GL_RENDERER).decode()
+    context.destroy()
+    return {"benchmark": "readback", "renderer": renderer, "args": vars(args), "results": rows}
+
+
+def layout(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(64, 64, args.backend)
+    import OpenGL.GL as gl
+    import particlesC
+    from loadC import Load
+    from layoutC import select_layout
+    from profilerC import Profiler
+    from shaderC import Shader
+
+    repository = Load.load_shader_repository("config/repository_shaders.json")
+    rows = {}
+    for name in args.layouts:
+        # the struct is compiled in, so every layout gets its own shaders and the same spawn
+        selected = select_layout(name)
+        np.random.seed(0)
+        profiler = Profiler()
+        particles = particlesC.Particles(Shader.load_all_shaders(repository), profiler)
+        particles.partitionMode = args.partition_mode
+        particles.particleCount = args.particles
+        particles.set_particle_count()
+
+        for _ in range(args.warmup):
+            particles.simulate_step()
+        profiler.reset()
+        profiler.blocking = True
+        for _ in range(args.steps):
+            with profiler.scope("step"):
+                particles.simulate_step()
+        profiler.blocking = False
+
+        # one more step with the counter on, every accepted neighbour is one Particle read
+        profiler.gpuTimers = True
+        particles.simulate_step()
+        profiler.gpuTimers = False
+        interactions = np.zeros(1, dtype=np.uint32)
+        gl.glGetNamedBufferSubData(particles.interaction_count_ssbo, 0, interactions.nbytes, interactions)
+
+        passes = profiler.percentiles()
+        physics = passes["physics"]["p50"]
+        neighbour_bytes = int(interactions[0]) * selected.stride
+        # self read + next write, on top of the neighbour reads
+        own_bytes = 2 * args.particles * selected.stride
+        rows[name] = {"stride": selected.stride, "passes": passes, "interactions": int(interactions[0]),
+                      "physics_bytes": neighbour_bytes + own_bytes,
+                      "physics_gb_per_s": (neighbour_bytes + own_bytes) / (physics / 1000.0) / 1e9 if physics > 0 else 0.0}
+        print(f"[Benchmark] {name} ({selected.stride} B): step p50 {passes['step']['p50']:.2f} ms  "
+              + "  ".join(f"{scope} {timing['p50']:.2f}" for scope, timing in passes.items() if scope != "step")
+              + f"  physics reads+writes {rows[name]['physics_bytes'] / 1e6:.1f} MB, {rows[name]['physics_gb_per_s']:.1f} GB/s")
+
+    if "full" in rows:
+        for name, row in rows.items():
+            if name != "full" and row["passes"]["physics"]["p50"] > 0:
+                row["physics_speedup"] = rows["full"]["passes"]["physics"]["p50"] / row["passes"]["physics"]["p50"]
+                print(f"[Benchmark] {name}: physics x{row['physics_speedup']:.2f} against full")
+    renderer = gl.glGetString(gl.GL_RENDERER).decode()
+    select_layout("full")
+    context.destroy()
+    return {"benchmark": "layout", "renderer": renderer, "args": vars(args), "results": rows}
+
+
+def kernel(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(64, 64, args.backend)
+    import OpenGL.GL as gl
+    import particlesC
+    from loadC import Load
+    from profilerC import Profiler
+    from shaderC import Shader
+
+    profiler = Profiler()
+    particles = particlesC.Particles(Shader.load_all_shaders(Load.load_shader_repository("config/repository_shaders.json")), profiler)
+    particles.partitionMode = "counting_sort"
+    particles.numTypes = args.types
+    if args.grid_size is not None:
+        particles.gridSize = args.grid_size
+        particles.update_grid_size()
+    rows = {}
+    for density in args.densities:
+        # denser worlds are smaller cubes of the same particle count, cellSize stays 1
+        np.random.seed(0)
+        particles.spawnGridSize = min(float(np.cbrt(args.particles / density)), particles.gridSize - 1.0)
+        particles.particleCount = args.particles
+        particles.set_particle_count()
+        start = particles.read_particles()
+
+        row = {"spawn_size": particles.spawnGridSize}
+        stepped = {}
+        for name in particles.PHYSICS_KERNELS:
+            particles.physicsKernel = name
+            particles.set_particles(start)
+            for _ in range(args.warmup):
+                particles.simulate_step()
+            profiler.reset()
+            profiler.blocking = True
+            for _ in range(args.steps):
+                particles.simulate_step()
+            profiler.blocking = False
+            row[name] = profiler.percentiles()["physics"]
+            # one step from the same state, the kernels only differ in summation order
+            particles.set_particles(start)
+            particles.simulate_step()
+            stepped[name] = particles.read_particles()
+        row["max_difference"] = float(np.abs(stepped["direct"] - stepped["tiled"])[:, 0:3].max())
+        row["speedup"] = row["direct"]["p50"] / row["tiled"]["p50"] if row["tiled"]["p50"] > 0 else 0.0
+        rows[str(density)] = row
+        print(f"[Benchmark] {density:g} per cell: direct {row['direct']['p50']:.2f} ms  tiled {row['tiled']['p50']:.2f} ms  "
+              f"x{row['speedup']:.2f}  max position difference {row['max_difference']:.2e}")
+    renderer = gl.glGetString(gl.GL_RENDERER).decode()
+    context.destroy()
+    return {"benchmark": "kernel", "renderer": renderer, "args": vars(args), "results": rows}
+
+
+def sparse(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(64, 64, args.backend)
+    import OpenGL.GL as gl
+    import particlesC
+    from loadC import Load
+    from profilerC import Profiler
+    from shaderC import Shader
+
+    profiler = Profiler()
+    particles = particlesC.Particles(Shader.load_all_shaders(Load.load_shader_repository("config/repository_shaders.json")), profiler)
+    particles.numTypes = args.types
+    particles.gridSize = args.world_size
+    particles.update_grid_size()
+    start = spawn_clusters(args.particles, args.world_size, args.clusters, args.cluster_size, args.types, args.seed)
+
+    # what a grid over the whole world would hold, never allocated: heads and cell starts per cell
+    world_cells = int(np.ceil(args.world_size / particles.cellSize)) ** 3
+    rows = {"dense_world_grid_bytes": 2 * world_cells * np.dtype(np.int32).itemsize}
+    print(f"[Benchmark] {world_cells} world cells of {particles.cellSize:.2f}, "
+          f"a dense grid over them would take {rows['dense_world_grid_bytes'] / 2**30:.1f} GiB")
+    stepped = {}
+    for mode in args.modes:
+        particles.partitionMode = mode
+        particles.set_particles(start)
+        for _ in range(args.warmup):
+            particles.simulate_step()
+        profiler.reset()
+        profiler.blocking = True
+        for _ in range(args.steps):
+            with profiler.scope("step"):
+                particles.simulate_step()
+        profiler.blocking = False
+        passes = profiler.percentiles()
+        memory = particles.partition_memory()
+        rows[mode] = {"passes": passes, "memory": memory, "grid_dims": list(particles.gridDims),
+                      "hash_capacity": particles.hashCapacity if mode == "hashed" else None}
+        # one step from the same state, both find every neighbour inside the radius
+        particles.set_particles(start)
+        particles.simulate_step()
+        stepped[mode] = particles.read_particles()
+        print(f"[Benchmark] {mode}: step p50 {passes['step']['p50']:.2f} ms  partition {passes['partition']['p50']:.2f}  "
+              f"physics {passes['physics']['p50']:.2f}  partition memory {memory['cells'] / 2**20:.1f} MB cells "
+              f"+ {memory['particles'] / 2**20:.1f} MB per-particle")
+    if len(stepped) > 1:
+        first = stepped[args.modes[0]]
+        rows["max_difference"] = max(float(np.abs(first - other)[:, 0:3].max()) for other in stepped.values())
+        print(f"[Benchmark] max position difference between modes {rows['max_difference']:.2e}")
+    renderer = gl.glGetString(gl.GL_RENDERER).decode()
+    context.destroy()
+    return {"benchmark": "sparse", "renderer": renderer, "args": vars(args), "results": rows}
+
+
+def universes(args):
+    from contextC import select_backend
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(64, 64, args.backend)
+    import OpenGL.GL as gl
+    import particlesC
+    from loadC import Load
+    from profilerC import Profiler
+    from shaderC import Shader
+
+    profiler = Profiler()
+    particles = particlesC.Particles(Shader.load_all_shaders(Load.load_shader_repository("config/repository_shaders.json")), profiler)
+    particles.partitionMode = args.partition_mode
+
+    def step_ms(rules):
+        particles.set_universes(rules, args.particles)
+        for _ in range(args.warmup):
+            particles.simulate_step()
+        gl.glFinish()
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            particles.simulate_step()
+        gl.glFinish()
+        return (time.perf_counter() - start) * 1000.0 / args.steps
+
+    # one universe alone, what a sequential screen pays per rule set and step
+    single = step_ms([{"randomSeed": 0, "spawnSeed": 0}])
+    rows = {"single_ms": single}
+    for count in args.universes:
+        batched = step_ms([{"randomSeed": u, "spawnSeed": u} for u in range(count)])
+        rows[str(count)] = {"batched_ms": batched, "sequential_ms": single * count,
+                            "speedup": single * count / batched if batched > 0 else 0.0}
+        print(f"[Benchmark] {count} universes of {args.particles}: batched {batched:.2f} ms/step, "
+              f"one at a time {single * count:.2f} ms/step, x{rows[str(count)]['speedup']:.2f}")
+    particles.set_universes(None)
+    renderer = gl.glGetString(gl.GL_RENDERER).decode()
+    context.destroy()
+    return {"benchmark": "universes", "renderer": renderer, "args": vars(args), "results": rows}
+
+
+def compare(report, baseline, threshold, quantiles=("p50", "p95"), floor_ms=0.05):
+    """ Scopes slower than baseline * (1 + threshold), differences under floor_ms are timer noise. """
+    if baseline.get("renderer") != report["renderer"]:
+        print(f"[Benchmark] baseline was recorded on {baseline.get('renderer')}, this is {report['renderer']}")
+    regressions = []
+    for name, result in report["scenarios"].items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            print(f"[Benchmark] {name}: not in the baseline, skipped")
+            continue
+        for scope, timing in result["passes"].items():
+            if scope not in reference["passes"]:
+                continue
+            for q in quantiles:
+                before, now = reference["passes"][scope][q], timing[q]
+                if now > before * (1.0 + threshold) and now - before > floor_ms:
+                    regressions.append({"scenario": name, "scope": scope, "quantile": q,
+                                        "baseline_ms": before, "ms": now, "ratio": now / before if before > 0 else float("inf")})
+    for r in regressions:
+        print(f"[Benchmark] REGRESSION {r['scenario']} {r['scope']} {r['quantile']}: "
+              f"{r['baseline_ms']:.2f} -> {r['ms']:.2f} ms (x{r['ratio']:.2f})")
+    print(f"[Benchmark] {len(regressions)} regressions over {threshold * 100:.0f}%")
+    return regressions
+
+
+def run(args):
+    result = {"scaling": scaling, "suite": suite, "readback": readback, "layout": layout, "kernel": kernel, "sparse": sparse,
+              "universes": universes}[args.command](args)
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, f"{args.command}.json"), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    result = run(parse_args())
+    sys.exit(1 if result.get("regressions") else 0)
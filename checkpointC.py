@@ -0,0 +1,182 @@
+""" CONTAINS
+        CheckpointWriter Class, full simulation state saved to / restored from memory-mappable files """
+
+import os
+import json
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from readbackC import AsyncReadback
+
+# magic, version, metadata bytes, particle data offset, particle count
+HEADER = struct.Struct("<8sIIQQ")
+MAGIC = b"PLIFECKP"
+VERSION = 1
+# page aligned so the particle block maps straight onto the file
+DATA_ALIGNMENT = 4096
+
+# Particles attributes that make up a run, the particle buffer and force matrix are stored next to them
+CHECKPOINT_FIELDS = (
+    "numTypes", "gridSize", "cellSize", "stepSize", "randomSeed", "maxInteractions", "particleRadius",
+    "detectionRadius", "tooCloseRadius", "forceStrengthFactor", "closeRepellentForce", "spawnGridSize",
+    "useManualForceMatrix", "partitionMode", "mortonReorder", "mortonReorderInterval", "partitionInterval",
+    "physicsKernel", "autoGrid", "gridRefreshInterval", "maxCellsPerParticle",
+)
+
+
+def write_checkpoint(path, particle_data, metadata):
+    """ Header, JSON metadata, then the float32 particles at a page boundary. Written next to path and
+        renamed over it, so a reader (or a live memmap of the old file) never sees half a checkpoint. """
+    particle_data = np.ascontiguousarray(particle_data, dtype=np.float32)
+    encoded = json.dumps(metadata).encode()
+    offset = -(-(HEADER.size + len(encoded)) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded), offset, len(particle_data)))
+        f.write(encoded)
+        f.write(b"\0" * (offset - HEADER.size - len(encoded)))
+        f.write(memoryview(particle_data).cast("B"))
+    os.replace(temporary, path)
+    return path
+
+
+def read_checkpoint(path):
+    """ (metadata, particle_data), particle_data is a read-only memmap of the file, nothing is parsed. """
+    with open(path, "rb") as f:
+        magic, version, length, offset, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"[Checkpoint] {path} is not a checkpoint")
+        if version != VERSION:
+            raise ValueError(f"[Checkpoint] {path} is version {version}, this build reads {VERSION}")
+        metadata = json.loads(f.read(length))
+    particle_data = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(count, 8)) if count else np.zeros((0, 8), dtype=np.float32)
+    return metadata, particle_data
+
+
+def capture_state(particles):
+    metadata = {name: getattr(particles, name) for name in CHECKPOINT_FIELDS}
+    metadata["particleCount"] = particles.particleCount
+    metadata["manualForceMatrix"] = particles.manualForceMatrix.tolist()
+    metadata["forceMatrix"] = particles.force_matrix.tolist()
+    metadata["simulationRate"] = particles.scheduler.simulationRate
+    metadata["stepCount"] = particles.scheduler.stepCount
+    metadata["backend"] = particles.backend.name
+    # batched universes: per-universe rules and the particles each owns, force_matrix is [universe, 30, 30]
+    metadata["universes"] = particles.universes
+    metadata["universeParticles"] = particles.universeParticles
+    # GPU population: particleCount is the live count once save() synced it
+    metadata["emitters"] = particles.emitters
+    metadata["killZones"] = particles.killZones
+    metadata["populationCapacity"] = particles.populationCapacity
+    metadata["emitCarry"] = particles.emitCarry.tolist()
+    return metadata
+
+
+def restore_checkpoint(particles, path):
+    """ Puts particles back into the saved state, one mmap and one upload for the particle buffer. """
+    metadata, particle_data = read_checkpoint(path)
+    # files from before a field was added keep the current value
+    for name in CHECKPOINT_FIELDS:
+        if name in metadata:
+            setattr(particles, name, metadata[name])
+    particles.manualForceMatrix = np.array(metadata["manualForceMatrix"], dtype=np.float32)
+    particles.scheduler.reset()
+    particles.scheduler.simulationRate = metadata["simulationRate"]
+    particles.scheduler.stepCount = metadata["stepCount"]
+    particles.deltaTime = particles.scheduler.fixedDeltaTime
+    # a running population would refuse the universes, the checkpoint's own is set up after the particles
+    particles.set_population()
+    particles.update_gridCellCount()
+    # universes the backend refuses leave a single world of all the particles
+    if not particles.set_universes(metadata.get("universes"), metadata.get("universeParticles", len(particle_data)), particle_data):
+        particles.set_particles(particle_data)
+
+    # a matrix the seed no longer reproduces (older build, edited by hand) is kept as a manual one
+    force_matrix = np.array(metadata["forceMatrix"], dtype=np.float32)
+    particles.force_matrix_key = None
+    particles.update_force_matrix()
+    if force_matrix.shape != particles.force_matrix.shape or force_matrix.ndim != 2:
+        # one matrix per universe has no single manual matrix to stand in for it, the seeds rebuild them
+        if not np.array_equal(particles.force_matrix, force_matrix):
+            print(f"[Checkpoint] {path}: stored force matrices do not match the universe seeds, rebuilt from the seeds")
+    elif not np.array_equal(particles.force_matrix, force_matrix):
+        particles.useManualForceMatrix = True
+        particles.manualForceMatrix = force_matrix
+        particles.update_force_matrix()
+
+    # emitters and kill zones take the restored particles over, a checkpoint without them clears any
+    particles.set_population(metadata.get("emitters"), metadata.get("killZones"), metadata.get("populationCapacity"))
+    if particles.gpu_population() and len(metadata.get("emitCarry", [])) == len(particles.emitters):
+        particles.emitCarry = np.array(metadata["emitCarry"])
+    return metadata
+
+
+class CheckpointWriter:
+    """ save() snapshots the parameters right away and queues a readback of the particle buffer, update()
+        hands finished readbacks to a thread that writes them out while the simulation keeps going. """
+
+    def __init__(self, particles):
+        self.particles = particles
+        self.readback = AsyncReadback(capacity=2)
+        self.jobs = queue.Queue()
+        self.written = []
+        self.errors = []
+        self.thread = None
+
+    def save(self, path):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_loop, name="checkpoint-writer", daemon=True)
+            self.thread.start()
+        if self.particles.gpu_population():
+            # the readback copies particleCount slots, under a GPU population that count trails the GPU's
+            self.particles.sync_population_count()
+        # the tag carries everything the file needs besides the particles
+        tag = (path, capture_state(self.particles))
+        # both slots busy only when saves come faster than copies land, then waiting is the point
+        while not self.request(tag):
+            self.update(wait=True)
+        return path
+
+    def request(self, tag):
+        particles = self.particles
+        return self.readback.request(particles.ssbo, particles.particle_id_ssbo, particles.particleCount, tag)
+
+    def update(self, wait=False):
+        """ Call once a frame, wait=True blocks until the copies in flight have landed. """
+        for readback in self.readback.drain() if wait else self.readback.poll():
+            path, metadata = readback.tag
+            # the mapped view goes back to the ring on the next poll, the thread gets its own copy
+            self.jobs.put((path, readback.particles.copy(), readback.ids.copy(), metadata))
+
+    def write_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            path, particles, ids, metadata = job
+            try:
+                ordered = np.empty_like(particles)
+                ordered[ids] = particles
+                self.written.append(write_checkpoint(path, ordered, metadata))
+                print(f"[Checkpoint] {path}")
+            except OSError as error:
+                self.errors.append((path, error))
+                print(f"[Checkpoint] writing {path} failed: {error}")
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        """ Blocks until every checkpoint saved so far is on disk. """
+        self.update(wait=True)
+        self.jobs.join()
+
+    def close(self):
+        self.flush()
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread.join()
+            self.thread = None
+        self.readback.close()
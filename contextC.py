@@ -0,0 +1,92 @@
+""" CONTAINS
+        OffscreenContext Class, a windowless OpenGL 4.5 core context """
+
+def prRed(skk): print("\033[91m {}\033[00m" .format(skk))
+def prGreen(skk): print("\033[92m {}\033[00m" .format(skk))
+
+import os
+import ctypes
+
+BACKENDS = ("egl", "osmesa")
+
+
+def select_backend(backend):
+    # PyOpenGL picks its platform on first import, so this has to run before anything imports OpenGL
+    if backend not in BACKENDS:
+        raise ValueError(f"[Context] Unknown backend: {backend}")
+    os.environ["PYOPENGL_PLATFORM"] = backend
+    if backend == "egl":
+        # no display server on farm / CI nodes, Mesa's surfaceless platform still gives a GPU or llvmpipe device
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+
+class OffscreenContext:
+    def __init__(self, width, height, backend="egl"):
+        self.width = width
+        self.height = height
+        self.backend = backend
+        if backend == "egl":
+            self._create_egl()
+        elif backend == "osmesa":
+            self._create_osmesa()
+        else:
+            raise ValueError(f"[Context] Unknown backend: {backend}")
+
+        import OpenGL.GL as gl
+        prGreen(f"[Context] {backend}: {gl.glGetString(gl.GL_RENDERER).decode()} / {gl.glGetString(gl.GL_VERSION).decode()}")
+
+    def _create_egl(self):
+        from OpenGL import EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("[Context] eglInitialize failed")
+
+        config_attribs = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                          EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                          EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        num_configs = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, config_attribs, ctypes.pointer(config), 1, ctypes.pointer(num_configs))
+        if num_configs.value == 0:
+            raise RuntimeError("[Context] No EGL config with pbuffer + desktop GL support")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attribs = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 4,
+                                           EGL.EGL_CONTEXT_MINOR_VERSION, 5,
+                                           EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                                           EGL.EGL_NONE)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, context_attribs)
+        if not self.context:
+            raise RuntimeError("[Context] Could not create an OpenGL 4.5 core context")
+
+        surface_attribs = (EGL.EGLint * 5)(EGL.EGL_WIDTH, self.width, EGL.EGL_HEIGHT, self.height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, surface_attribs)
+        EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+
+    def _create_osmesa(self):
+        from OpenGL import osmesa, arrays
+        import OpenGL.GL as gl
+        attribs = arrays.GLintArray.asArray([osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+                                             osmesa.OSMESA_DEPTH_BITS, 24,
+                                             osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                                             osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 4,
+                                             osmesa.OSMESA_CONTEXT_MINOR_VERSION, 5,
+                                             0])
+        self.context = osmesa.OSMesaCreateContextAttribs(attribs, None)
+        if not self.context:
+            raise RuntimeError("[Context] Could not create an OSMesa 4.5 core context")
+        self.buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, gl.GL_UNSIGNED_BYTE, self.width, self.height):
+            raise RuntimeError("[Context] OSMesaMakeCurrent failed")
+
+    def destroy(self):
+        if self.backend == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(self.display, self.surface)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
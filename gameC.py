@@ -8,9 +8,11 @@ from materialsC import Material
 from particlesC import Particles
 from framebufferC import Framebuffer
 from world_ObjectC import World_Object
+from profilerC import Profiler
 
 class Game:
-    def __init__(self):
+    def __init__(self, profiler=None):
+        self.profiler = profiler if profiler is not None else Profiler()
 
         self.RENDER_SETTINGS = {
                                 "HDR_ENABLED": False,
@@ -26,36 +28,39 @@ class Game:
         self.TRIGGER_RELOAD_SHADER = False
       
     def load_config(self):
-        
-        self.REPOSITORY_SHADERS      = Load.load_shader_repository("config/repository_shaders.json")
-        self.ALL_OBJECTS_SHADERS      = Shader.load_all_shaders(self.REPOSITORY_SHADERS)
-        
-        
-        self.REPOSITORY_FRAMEBUFFERS = Load.load_framebuffer_repository("config/repository_framebuffers.json")
-        self.ALL_OBJECTS_FRAMEBUFFERS = Framebuffer.load_all_framebuffers(self.REPOSITORY_FRAMEBUFFERS)
-        
-        
-        self.REPOSITORY_MATERIALS    = Material.load_material_repository("config/repository_materials.json")    
-        self.ALL_OBJECTS_MATERIALS    = Material.load_all_materials(self.REPOSITORY_MATERIALS)
-        
-        
-        self.REPOSITORY_TEXTURES     = Texture.load_texture_repository("config/repository_textures.json", self.ALL_OBJECTS_MATERIALS)
-        self.ALL_OBJECTS_TEXTURES     = Texture.load_all_textures(self.REPOSITORY_TEXTURES)
-        
-        self.REPOSITORY_MODELS       = Load.load_model_repository("config/repository_models.json")
-        self.ALL_OBJECTS_MODELS       = Model.load_all_models(self.REPOSITORY_MODELS)
-        
-        
-        self.REPOSITORY_SCENE        = Load.load_scene_repository("config/repository_scene.json")
-        self.ALL_WORLD_OBJECTS        = World_Object.load_scene(self.REPOSITORY_SCENE, self.ALL_OBJECTS_MODELS, self.ALL_OBJECTS_TEXTURES, self.ALL_OBJECTS_MATERIALS) 
-        
-        self.particles = Particles(self.ALL_OBJECTS_SHADERS["particles_cs"],
-                                   self.ALL_OBJECTS_SHADERS["particles_partition_cs"])
-        
-        self.render = Render(self.ALL_OBJECTS_SHADERS,  self.ALL_OBJECTS_FRAMEBUFFERS,
-                             self.ALL_OBJECTS_TEXTURES, self.ALL_OBJECTS_MATERIALS,
-                             self.ALL_OBJECTS_MODELS,   self.ALL_WORLD_OBJECTS,
-                             self.RENDER_SETTINGS,      self.camera, self.particles)
+        scope = self.profiler.cpu_scope
+        with scope("Game.load_config"):
+            with scope("load shaders"):
+                self.REPOSITORY_SHADERS      = Load.load_shader_repository("config/repository_shaders.json")
+                self.ALL_OBJECTS_SHADERS      = Shader.load_all_shaders(self.REPOSITORY_SHADERS)
+            
+            with scope("load framebuffers"):
+                self.REPOSITORY_FRAMEBUFFERS = Load.load_framebuffer_repository("config/repository_framebuffers.json")
+                self.ALL_OBJECTS_FRAMEBUFFERS = Framebuffer.load_all_framebuffers(self.REPOSITORY_FRAMEBUFFERS)
+            
+            with scope("load materials"):
+                self.REPOSITORY_MATERIALS    = Material.load_material_repository("config/repository_materials.json")    
+                self.ALL_OBJECTS_MATERIALS    = Material.load_all_materials(self.REPOSITORY_MATERIALS)
+            
+            with scope("load textures"):
+                self.REPOSITORY_TEXTURES     = Texture.load_texture_repository("config/repository_textures.json", self.ALL_OBJECTS_MATERIALS)
+                self.ALL_OBJECTS_TEXTURES     = Texture.load_all_textures(self.REPOSITORY_TEXTURES)
+            
+            with scope("load models"):
+                self.REPOSITORY_MODELS       = Load.load_model_repository("config/repository_models.json")
+                self.ALL_OBJECTS_MODELS       = Model.load_all_models(self.REPOSITORY_MODELS)
+            
+            with scope("load scene"):
+                self.REPOSITORY_SCENE        = Load.load_scene_repository("config/repository_scene.json")
+                self.ALL_WORLD_OBJECTS        = World_Object.load_scene(self.REPOSITORY_SCENE, self.ALL_OBJECTS_MODELS, self.ALL_OBJECTS_TEXTURES, self.ALL_OBJECTS_MATERIALS) 
+            
+            with scope("init particles"):
+                self.particles = Particles(self.ALL_OBJECTS_SHADERS, self.profiler)
+            
+            self.render = Render(self.ALL_OBJECTS_SHADERS,  self.ALL_OBJECTS_FRAMEBUFFERS,
+                                 self.ALL_OBJECTS_TEXTURES, self.ALL_OBJECTS_MATERIALS,
+                                 self.ALL_OBJECTS_MODELS,   self.ALL_WORLD_OBJECTS,
+                                 self.RENDER_SETTINGS,      self.camera, self.particles)
             
         self.TRIGGER_RELOAD_CONFIG = False
         print("[GAME] CONFIG LOADED")
@@ -1,4 +1,5 @@
 from imgui.integrations.glfw import GlfwRenderer
+import numpy as np
 import random
 import colorsys
 
@@ -33,6 +34,14 @@ class GUI:
         changed, new_sz = self.imgui.slider_float("Step Size", particles.stepSize, 0.001, 10.0, format="%.4f")
         if changed:
             particles.stepSize = new_sz
+        scheduler = particles.scheduler
+        changed, new_hz = self.imgui.slider_float("Simulation Rate (Hz)", scheduler.simulationRate, 5.0, 240.0, format="%.1f")
+        if changed:
+            scheduler.simulationRate = new_hz
+        changed, new_ms = self.imgui.slider_int("Max Substeps", scheduler.maxSubsteps, 1, 16)
+        if changed:
+            scheduler.maxSubsteps = new_ms
+        self.imgui.text(f"Steps/Frame: {scheduler.lastFrameSteps}  Dropped: {scheduler.droppedSteps}  Alpha: {scheduler.alpha:.2f}")
         self.imgui.separator()
         self.imgui.text("Interaction Parameters")
         changed, new_mI = self.imgui.slider_int("Max Interactions", particles.maxInteractions, 10, 5_000)
@@ -45,33 +54,67 @@ class GUI:
         if changed:
             particles.tooCloseRadius = new_c
             particles.tooCloseRadius = max(particles.tooCloseRadius, particles.particleRadius + 0.01)
+        changed, auto_grid = self.imgui.checkbox("Auto Cell Grid", particles.autoGrid)
+        if changed:
+            particles.autoGrid = auto_grid
+        dims = particles.gridDims
+        self.imgui.text(f"Cells {dims[0]} x {dims[1]} x {dims[2]}, size {particles.cellSize:.2f}")
+        if particles.universes:
+            self.imgui.text(f"{len(particles.universes)} universes of {particles.universeParticles} particles")
+        if particles.gpu_population():
+            self.imgui.text(f"~{particles.particleCount} / {particles.particleCapacity} particles, "
+                            f"{len(particles.emitters)} emitters, {len(particles.killZones)} kill zones")
+        changed, new_be = self.imgui.combo("Backend", particles.BACKENDS.index(particles.backend.name), list(particles.BACKENDS))
+        if changed:
+            particles.set_backend(particles.BACKENDS[new_be])
+        changed, new_pm = self.imgui.combo("Partition Mode", particles.PARTITION_MODES.index(particles.partitionMode), list(particles.PARTITION_MODES))
+        if changed:
+            particles.partitionMode = particles.PARTITION_MODES[new_pm]
+        if particles.partitionMode == "counting_sort":
+            changed, new_pk = self.imgui.combo("Physics Kernel", particles.PHYSICS_KERNELS.index(particles.physicsKernel), list(particles.PHYSICS_KERNELS))
+            if changed:
+                particles.physicsKernel = particles.PHYSICS_KERNELS[new_pk]
+            if particles.physicsKernel == "tiled" and not particles.tiled_physics():
+                self.imgui.text("Search span too wide for tiling, running direct")
+        if particles.partitionMode == "hashed":
+            memory = particles.partition_memory()
+            self.imgui.text(f"Hash table {particles.hashCapacity} slots, partition {memory['total'] / 2**20:.1f} MB")
+        if particles.partitionMode == "linked_list":
+            changed, new_pi = self.imgui.slider_int("Partition Interval (steps)", particles.partitionInterval, 1, 30)
+            if changed:
+                particles.partitionInterval = new_pi
+        changed, run_mo = self.imgui.checkbox("Morton Reorder", particles.mortonReorder)
+        if changed:
+            particles.mortonReorder = run_mo
+        if particles.mortonReorder:
+            changed, new_mi = self.imgui.slider_int("Reorder Interval (steps)", particles.mortonReorderInterval, 1, 600)
+            if changed:
+                particles.mortonReorderInterval = new_mi
         self.imgui.text("Start Parameters")
         changed, new_numT = self.imgui.slider_int("Num Types", particles.numTypes, 1, 30)
         if changed:
             particles.numTypes = new_numT
-            if particles.useManualForceMatrix:
-                particles.numTypes = 4
         changed, new_seed = self.imgui.input_int("Random Matrix", particles.randomSeed)
         if changed:
             particles.randomSeed = new_seed
         changed, run_fMm = self.imgui.checkbox("Manual Force Matrix", particles.useManualForceMatrix)
         if changed:
             particles.useManualForceMatrix = run_fMm
-            particles.numTypes = 4
         if particles.useManualForceMatrix:
             self.imgui.text("Manual Force Matrix")
-            for i in range(4):
+            n = particles.numTypes
+            for i in range(n):
                 if i == 0:
-                    self.imgui.columns(4, "force_matrix_headers")
-                    for col in range(4):
+                    self.imgui.columns(n, "force_matrix_headers")
+                    for col in range(n):
                         self.imgui.set_column_width(col, 90)
                         self.imgui.text(f"Type {col}") 
                         self.imgui.next_column()
                     self.imgui.columns(1)
                 else:
                     self.imgui.text(f"Type {i}")
-                for j in range(4):
-                    val = particles.manualForceMatrix[i][j]
+                for j in range(n):
+                    val = float(particles.manualForceMatrix[i][j])
                     norm_val = max(-1.0, min(1.0, val))
                     brightness = abs(norm_val)
                     if norm_val > 0:
@@ -102,33 +145,74 @@ class GUI:
                     self.imgui.pop_style_color(3)
                     if changed:
                         particles.manualForceMatrix[i][j] = val
-                    if j < 3:
+                    if j < n - 1:
                         self.imgui.same_line()
             if self.imgui.button("Reset Matrix"):
-                for i in range(4):
-                    for j in range(4):
-                        particles.manualForceMatrix[i][j] = 0.0
+                particles.manualForceMatrix[:n, :n] = 0.0
             self.imgui.same_line()
             if self.imgui.button("Randomize Matrix"):
-                for i in range(4):
-                    for j in range(4):
+                for i in range(n):
+                    for j in range(n):
                         particles.manualForceMatrix[i][j] = random.uniform(-1.0, 1.0)
         changed, new_mp = self.imgui.slider_int("Particle Count", particles.particleCount, 10, 30_000)
         if changed:
-            particles.particleCount = new_mp
-            particles.set_particle_count()
+            particles.resize_particles(new_mp)
         changed, new_ns = self.imgui.slider_int("Spawn Size", particles.spawnGridSize, 10, 50)
         if changed:
             particles.spawnGridSize = new_ns
-            particles.cellSize = particles.detectionRadius + 0.1
             particles.set_particle_count()
             particles.update_grid_size()
         self.imgui.separator()
         if self.imgui.button("Reinitialize Particles"):
-            particles.cellSize = particles.detectionRadius + 0.1
-            particles.init_particles()
-            particles.init_particle_ssbo()
+            particles.set_particle_count()
         changed, run_sim = self.imgui.checkbox("Run Simulation", particles.runSimulation)
         if changed:
             particles.runSimulation = run_sim
         self.imgui.end()
+
+    def render_profiler(self, particles):
+        profiler = particles.profiler
+        self.imgui.begin("GPU Timers")
+        changed, run_gt = self.imgui.checkbox("GPU Timers", profiler.gpuTimers)
+        if changed:
+            profiler.gpuTimers = run_gt
+        particle_rate = profiler.rate("particle_steps")
+        interaction_rate = profiler.rate("interactions")
+        self.imgui.text(f"Particles/s: {particle_rate / 1e6:.2f} M  Interactions/s: {interaction_rate / 1e6:.2f} M")
+        if particle_rate > 0 and interaction_rate > 0:
+            self.imgui.text(f"Interactions/particle: {interaction_rate / particle_rate:.1f}")
+        self.imgui.text(f"Dropped queries: {profiler.droppedQueries}")
+        self.imgui.separator()
+        for name, history in profiler.history.items():
+            values = np.array(history, dtype=np.float32)
+            if values.size == 0:
+                continue
+            self.imgui.plot_lines(f"##{name}", values, overlay_text=f"{name}: {values[-1]:.2f} ms (avg {values.mean():.2f})",
+                                  scale_min=0.0, graph_size=(300, 50))
+        self.imgui.end()
+
+    def render_replay(self, particles):
+        replay = particles.replay
+        if replay is None:
+            return
+        self.imgui.begin("Replay")
+        self.imgui.text(f"{replay.path}")
+        previous, current = replay.pair()
+        self.imgui.text(f"Frame {replay.frames[previous]} / {replay.frames[-1]}  ({replay.frameCount} recorded)")
+        changed, playing = self.imgui.checkbox("Play", replay.playing)
+        if changed:
+            replay.playing = playing
+        self.imgui.same_line()
+        changed, loop = self.imgui.checkbox("Loop", replay.loop)
+        if changed:
+            replay.loop = loop
+        # dragging the slider scrubs, playback carries on from wherever it is let go
+        changed, position = self.imgui.slider_float("Position", replay.position, 0.0, float(replay.span), format="%.1f")
+        if changed:
+            replay.seek(position)
+        changed, speed = self.imgui.slider_float("Speed", replay.speed, -4.0, 4.0, format="%.2fx")
+        if changed:
+            replay.speed = speed
+        if self.imgui.button("Resume Simulation"):
+            particles.stop_replay()
+        self.imgui.end()
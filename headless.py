@@ -0,0 +1,318 @@
+""" Headless runner: steps the simulation in an offscreen context and writes state / frames to disk.
+
+    python headless.py --frames 600 --particles 20000 --out out/run01 --save-every 100
+    python headless.py --frames 300 --render --render-every 10 --width 1280 --height 720
+    python headless.py --conformance 300 --particles 4000
+    python headless.py --conformance 300 --particles 4000 --kernel tiled
+    python headless.py --conformance 100 --particles 4000 --partition-mode hashed --world-size 1000
+    python headless.py --conformance 300 --particles 4000 --layout compact --tolerance 5e-3
+    python headless.py --frames 120 --render --trace 60
+    python headless.py --frames 200 --universes 16 --particles 3000 --render --render-every 20
+    python headless.py --frames 600 --particles 2000 --emitter 0 0 0 2 20 --kill-zone 6 0 0 3 --capacity 50000
+    python headless.py --frames 6000 --checkpoint-every 1000 --out out/run02
+    python headless.py --frames 600 --restore out/run02/checkpoint_006000.ckpt
+    python headless.py --frames 600 --record out/run03/trajectory.arrow --record-every 5 --record-float16
+    python headless.py --frames 300 --replay out/run03/trajectory.arrow --replay-speed 2 --render
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from contextC import BACKENDS, select_backend
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the particle simulation without a window or GUI.")
+    parser.add_argument("--backend", choices=BACKENDS, default="egl")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--frame-time", type=float, default=None,
+                        help="wall time fed to the scheduler per frame, defaults to one simulation step")
+    parser.add_argument("--rate", type=float, default=None, help="simulation rate in Hz")
+    parser.add_argument("--particles", type=int, default=None)
+    parser.add_argument("--types", type=int, default=None)
+    parser.add_argument("--matrix-seed", type=int, default=None)
+    parser.add_argument("--spawn-seed", type=int, default=0)
+    parser.add_argument("--partition-mode", default=None)
+    parser.add_argument("--morton", action="store_true")
+    parser.add_argument("--world-size", type=int, default=None,
+                        help="world edge (gridSize), the particles still spawn in the spawn cube")
+    parser.add_argument("--fixed-grid", action="store_true",
+                        help="gridSize^3 cells of cellSize instead of a grid derived from radius and particle bounds")
+    parser.add_argument("--kernel", choices=("direct", "tiled"), default=None,
+                        help="physics kernel, tiled stages neighbours in shared memory (counting_sort only)")
+    parser.add_argument("--layout", choices=("full", "compact"), default="full",
+                        help="particle buffer layout, compact stores 20 bytes with half-float velocities")
+    parser.add_argument("--universes", type=int, default=0,
+                        help="batch this many universes, matrix and spawn seeds counting up; --particles is per universe")
+    parser.add_argument("--emitter", type=float, nargs=5, action="append", metavar=("X", "Y", "Z", "RADIUS", "RATE"),
+                        help="spawn RATE particles per step in a ball on the GPU, repeatable")
+    parser.add_argument("--kill-zone", type=float, nargs=4, action="append", metavar=("X", "Y", "Z", "RADIUS"),
+                        help="remove the particles inside a ball every step on the GPU, repeatable")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="particles the buffers hold while emitters or kill zones run")
+    parser.add_argument("--sim-backend", choices=("gpu", "cpu", "cpu_sharded"), default="gpu")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for cpu_sharded, defaults to all cores")
+    parser.add_argument("--conformance", type=int, default=0, metavar="STEPS",
+                        help="step the compute shader and the NumPy backend from the same state and compare")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--out", default="out/headless")
+    parser.add_argument("--save-every", type=int, default=0, help="write particle state every N frames, 0 = final only")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                        help="write a restorable checkpoint every N frames, in the background")
+    parser.add_argument("--restore", default=None, help="start from this checkpoint instead of a fresh spawn")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="stream particle frames to an Arrow IPC (.arrow) or Parquet (.parquet) file")
+    parser.add_argument("--record-every", type=int, default=1)
+    parser.add_argument("--record-columns", nargs="+", default=None,
+                        help="subset of frame id x y z vx vy vz type stress, defaults to all")
+    parser.add_argument("--record-float16", action="store_true", help="store the float columns as float16")
+    parser.add_argument("--replay", default=None, metavar="PATH",
+                        help="play back an Arrow recording instead of simulating")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    parser.add_argument("--replay-loop", action="store_true", help="start over at the end instead of holding the last frame")
+    parser.add_argument("--render", action="store_true", help="also run the render passes and write PNG frames")
+    parser.add_argument("--render-every", type=int, default=1)
+    parser.add_argument("--width", type=int, default=900)
+    parser.add_argument("--height", type=int, default=900)
+    parser.add_argument("--trace", type=int, default=0, metavar="FRAMES",
+                        help="write a Chrome trace of the last FRAMES frames to <out>/trace.json")
+    return parser.parse_args(argv)
+
+
+def resize(game, width, height):
+    import glm
+    import OpenGL.GL as gl
+    gl.glViewport(0, 0, width, height)
+    for FBO in game.ALL_OBJECTS_FRAMEBUFFERS.values():
+        FBO.resize(width, height)
+    game.RENDER_SETTINGS["Width"] = width
+    game.RENDER_SETTINGS["Height"] = height
+    game.camera.resolution = glm.vec2(width, height)
+    game.camera.aspect_ratio = width / max(1.0, height)
+    game.camera.projectionMatrix = glm.perspective(glm.radians(game.camera.FOV), game.camera.aspect_ratio, game.camera.near, game.camera.far)
+
+
+def frame_universes(game, particles):
+    """ Pulls the camera back until the side by side universes fit the view. """
+    import glm
+    columns, spacing = particles.universe_tiles()
+    rows = -(-particles.universe_count() // columns)
+    extent = max(columns, rows) * spacing
+    game.camera.cameraPos = glm.vec3(0.0, 0.0, extent / (2.0 * float(glm.tan(glm.radians(game.camera.FOV) / 2.0))) + spacing)
+    game.camera.cameraFront = glm.vec3(0.0, 0.0, -1.0)
+    game.camera.update_view()
+
+
+def capture_frame(game, path):
+    # the display pass only copies this texture to the default framebuffer
+    import numpy as np
+    import OpenGL.GL as gl
+    from PIL import Image
+    FB = game.ALL_OBJECTS_FRAMEBUFFERS["downsample"]
+    pixels = np.empty((FB.height, FB.width, 4), dtype=np.float32)
+    gl.glGetTextureImage(FB.downsampledTexture, 0, gl.GL_RGBA, gl.GL_FLOAT, pixels.nbytes, pixels)
+    image = (np.clip(pixels[::-1, :, :3], 0.0, 1.0) * 255.0).astype(np.uint8)
+    Image.fromarray(image).save(path)
+
+
+def build(args, profiler=None):
+    import numpy as np
+    np.random.seed(args.spawn_seed)
+    # the struct is compiled into the shaders, so it is picked before any of them load
+    from layoutC import select_layout
+    select_layout(args.layout)
+    if args.render:
+        from gameC import Game
+        game = Game(profiler)
+        resize(game, args.width, args.height)
+        return game, game.particles
+
+    import particlesC
+    from loadC import Load
+    from shaderC import Shader
+    shaders = Shader.load_all_shaders(Load.load_shader_repository("config/repository_shaders.json"))
+    return None, particlesC.Particles(shaders, profiler)
+
+
+def configure(particles, args):
+    if args.restore is not None:
+        from checkpointC import restore_checkpoint
+        restore_checkpoint(particles, args.restore)
+    if args.rate is not None:
+        particles.scheduler.simulationRate = args.rate
+    if args.types is not None:
+        particles.numTypes = args.types
+    if args.matrix_seed is not None:
+        particles.randomSeed = args.matrix_seed
+    if args.world_size is not None:
+        particles.gridSize = args.world_size
+        particles.update_grid_size()
+    if args.partition_mode is not None:
+        if args.partition_mode not in particles.PARTITION_MODES:
+            raise SystemExit(f"[Headless] Unknown partition mode: {args.partition_mode}")
+        particles.partitionMode = args.partition_mode
+    if args.morton:
+        particles.mortonReorder = True
+    if args.kernel is not None:
+        particles.physicsKernel = args.kernel
+    if args.fixed_grid:
+        particles.autoGrid = False
+        particles.cellSize = 1.0
+        particles.refresh_grid()
+    if args.workers is not None:
+        particles.sharded_backend.workers = args.workers
+    particles.set_backend(args.sim_backend)
+    if args.replay is not None:
+        from replayC import TrajectoryReplay
+        replay = TrajectoryReplay(args.replay)
+        replay.speed = args.replay_speed
+        replay.loop = args.replay_loop
+        particles.start_replay(replay)
+    elif args.universes > 1:
+        seed = particles.randomSeed
+        particles.set_universes([{"randomSeed": seed + u, "spawnSeed": args.spawn_seed + u} for u in range(args.universes)],
+                                args.particles if args.particles is not None else particles.particleCount)
+    elif args.restore is None and (args.particles is not None or args.types is not None):
+        if args.particles is not None:
+            particles.particleCount = args.particles
+        particles.set_particle_count()
+    if args.emitter or args.kill_zone:
+        particles.set_population([{"position": tuple(e[:3]), "radius": e[3], "rate": e[4]} for e in args.emitter or []],
+                                 args.kill_zone or [], args.capacity)
+
+
+def conformance(particles, steps, tolerance):
+    """ Per step: CPU and GPU both advance the GPU state, any particle off by more than tolerance fails. """
+    import numpy as np
+    cpu = particles.cpu_backend
+    # linked lists are only rebuilt every partitionInterval steps, so neighbours that moved cells in
+    # between are missed; the sorted partitions re-bin every step like the CPU does
+    if not particles.sorted_partition():
+        print(f"[Headless] conformance: partition mode {particles.partitionMode} is not re-binned every step, "
+              f"checking counting_sort instead")
+        particles.partitionMode = "counting_sort"
+    worst = 0.0
+    failures = 0
+    free_running = particles.read_particles()
+    for step in range(1, steps + 1):
+        state = particles.read_particles()
+        cpu.load(state)
+        particles.update_force_matrix()
+        cpu.step(particles.sim_param_values(), particles.force_matrix)
+        particles.simulate_step()
+        error = np.abs(particles.read_particles() - cpu.read())[:, [0, 1, 2, 4, 5, 6]].max(axis=1)
+        worst = max(worst, float(error.max()))
+        failures += int((error > tolerance).sum())
+
+        cpu.load(free_running)
+        cpu.step(particles.sim_param_values(), particles.force_matrix)
+        free_running = cpu.read()
+    drift = float(np.abs(particles.read_particles()[:, 0:3] - free_running[:, 0:3]).max())
+    print(f"[Headless] conformance: {steps} steps, max per-step error {worst:.3e}, "
+          f"{failures} particle-steps above {tolerance:g}, free-running drift {drift:.3e}")
+    return {"steps": steps, "partition_mode": particles.partitionMode, "max_error": worst, "failures": failures, "tolerance": tolerance, "free_running_drift": drift}
+
+
+def run(args):
+    select_backend(args.backend)
+    from contextC import OffscreenContext
+    context = OffscreenContext(args.width, args.height, args.backend)
+
+    import numpy as np
+    import OpenGL.GL as gl
+
+    from profilerC import Profiler
+    profiler = Profiler()
+    if args.trace:
+        profiler.start_trace(args.trace)
+    game, particles = build(args, profiler)
+    configure(particles, args)
+    if game is not None and particles.universes:
+        frame_universes(game, particles)
+    os.makedirs(args.out, exist_ok=True)
+
+    if args.conformance:
+        result = conformance(particles, args.conformance, args.tolerance)
+        with open(os.path.join(args.out, "conformance.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        context.destroy()
+        return result
+
+    from checkpointC import CheckpointWriter
+    checkpoints = CheckpointWriter(particles)
+    recorder = None
+    if args.record is not None:
+        from recorderC import TrajectoryRecorder
+        os.makedirs(os.path.dirname(os.path.abspath(args.record)), exist_ok=True)
+        # offline, so a frame is waited for rather than dropped
+        recorder = TrajectoryRecorder(particles, args.record, args.record_every, args.record_columns, args.record_float16,
+                                      block=True)
+    frame_time = args.frame_time if args.frame_time is not None else particles.scheduler.fixedDeltaTime
+    first_step = particles.scheduler.stepCount
+    gl.glFinish()
+    start = time.perf_counter()
+    def save(readback):
+        np.save(os.path.join(args.out, f"particles_{readback.tag:06d}.npy"), readback.ordered())
+
+    for frame in range(1, args.frames + 1):
+        profiler.new_frame()
+        particles.simulate_particles(frame_time)
+        if game is not None and frame % args.render_every == 0:
+            game.render.scene()
+            capture_frame(game, os.path.join(args.out, f"frame_{frame:06d}.png"))
+        # saved a frame or two later once the copy landed, a full ring falls back to a blocking read
+        if args.save_every and frame % args.save_every == 0 and not particles.request_readback(frame):
+            np.save(os.path.join(args.out, f"particles_{frame:06d}.npy"), particles.read_particles())
+        for readback in particles.readback.poll():
+            save(readback)
+        if args.checkpoint_every and frame % args.checkpoint_every == 0:
+            checkpoints.save(os.path.join(args.out, f"checkpoint_{frame:06d}.ckpt"))
+        checkpoints.update()
+        if recorder is not None:
+            recorder.capture(particles.scheduler.stepCount)
+    for readback in particles.readback.drain():
+        save(readback)
+    checkpoints.close()
+    if recorder is not None:
+        recorder.close()
+        if recorder.dropped or recorder.error is not None:
+            print(f"[Headless] recording incomplete: {recorder.recorded} frames written, {recorder.dropped} dropped"
+                  + (f", writer failed: {recorder.error}" if recorder.error is not None else ""))
+    gl.glFinish()
+    elapsed = time.perf_counter() - start
+
+    np.save(os.path.join(args.out, "particles_final.npy"), particles.read_particles())
+    steps = particles.scheduler.stepCount - first_step
+    summary = {
+        "renderer": gl.glGetString(gl.GL_RENDERER).decode(),
+        "frames": args.frames,
+        "steps": steps,
+        "particles": particles.particleCount,
+        "partition_mode": particles.partitionMode,
+        "sim_backend": particles.backend.name,
+        "seconds": elapsed,
+        "steps_per_second": steps / elapsed if elapsed > 0 else 0.0,
+        "particle_steps_per_second": steps * particles.particleCount / elapsed if elapsed > 0 else 0.0,
+        "recorded_frames": recorder.recorded if recorder is not None else 0,
+        "dropped_frames": recorder.dropped if recorder is not None else 0,
+        "args": vars(args),
+    }
+    with open(os.path.join(args.out, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"[Headless] {steps} steps of {particles.particleCount} particles in {elapsed:.2f}s "
+          f"({summary['steps_per_second']:.1f} steps/s) -> {args.out}")
+
+    if args.trace:
+        print(f"[Headless] trace -> {profiler.stop_trace(os.path.join(args.out, 'trace.json'))}")
+    if particles.replay is not None:
+        particles.replay.close()
+    particles.backend.close()
+    context.destroy()
+    return summary
+
+
+if __name__ == "__main__":
+    result = run(parse_args())
+    sys.exit(1 if result.get("failures") else 0)
@@ -0,0 +1,106 @@
+""" CONTAINS
+        ParticleLayout Class, how one particle is stored in the SSBOs, as GLSL for the shaders and as NumPy for the CPU """
+
+import numpy as np
+
+from shaderC import Shader
+
+# every shader that touches a Particle gets the struct and its accessors through '#include "particle_layout.glsl"'
+FULL_GLSL = """
+struct Particle {
+    vec4 position_stress;
+    vec4 velocity_type;
+};
+
+vec3 position_of(Particle p) { return p.position_stress.xyz; }
+vec3 velocity_of(Particle p) { return p.velocity_type.xyz; }
+float type_of(Particle p) { return p.velocity_type.w; }
+float stress_of(Particle p) { return p.position_stress.w; }
+Particle pack_particle(vec3 position, vec3 velocity, float type, float stress) {
+    return Particle(vec4(position, stress), vec4(velocity, type));
+}
+"""
+
+# velocityZTypeStress: vz half in the low 16 bits, 5 type bits, an 11 bit stress (half without sign and the low 4 mantissa bits)
+COMPACT_GLSL = """
+struct Particle {
+    float px, py, pz;
+    uint velocityXY;
+    uint velocityZTypeStress;
+};
+
+vec3 position_of(Particle p) { return vec3(p.px, p.py, p.pz); }
+vec3 velocity_of(Particle p) { return vec3(unpackHalf2x16(p.velocityXY), unpackHalf2x16(p.velocityZTypeStress & 0xFFFFu).x); }
+float type_of(Particle p) { return float((p.velocityZTypeStress >> 16) & 31u); }
+float stress_of(Particle p) { return unpackHalf2x16((p.velocityZTypeStress >> 21) << 4).x; }
+Particle pack_particle(vec3 position, vec3 velocity, float type, float stress) {
+    uint stressBits = (packHalf2x16(vec2(max(stress, 0.0), 0.0)) & 0x7FFFu) >> 4;
+    uint word = (packHalf2x16(vec2(velocity.z, 0.0)) & 0xFFFFu) | ((uint(round(type)) & 31u) << 16) | (stressBits << 21);
+    return Particle(position.x, position.y, position.z, packHalf2x16(velocity.xy), word);
+}
+"""
+
+COMPACT_DTYPE = np.dtype([("position", np.float32, 3), ("velocityXY", np.uint32), ("velocityZTypeStress", np.uint32)])
+
+
+class ParticleLayout:
+    """ stride bytes per particle on the GPU; pack / unpack convert (N, 8) float32 particle_data rows. """
+
+    def __init__(self, name, stride, glsl):
+        self.name = name
+        self.stride = stride
+        self.glsl = glsl
+
+    def pack(self, particle_data):
+        particle_data = np.ascontiguousarray(particle_data, dtype=np.float32)
+        if self.name == "full":
+            return particle_data
+        packed = np.empty(len(particle_data), dtype=COMPACT_DTYPE)
+        packed["position"] = particle_data[:, 0:3]
+        half = particle_data[:, 4:7].astype(np.float16).view(np.uint16).astype(np.uint32)
+        packed["velocityXY"] = half[:, 0] | (half[:, 1] << 16)
+        stress = np.maximum(particle_data[:, 3], 0.0).astype(np.float16).view(np.uint16).astype(np.uint32)
+        types = np.rint(particle_data[:, 7]).astype(np.uint32) & 31
+        packed["velocityZTypeStress"] = half[:, 2] | (types << 16) | (((stress & 0x7FFF) >> 4) << 21)
+        return packed
+
+    def unpack(self, raw, count):
+        """ raw: bytes of count packed particles (any contiguous buffer). The full layout comes back as a view. """
+        raw = np.frombuffer(raw, dtype=np.uint8, count=count * self.stride)
+        if self.name == "full":
+            return raw.view(np.float32).reshape(count, 8)
+        packed = raw.view(COMPACT_DTYPE)
+        particle_data = np.empty((count, 8), dtype=np.float32)
+        particle_data[:, 0:3] = packed["position"]
+        halves = lambda bits: (bits & 0xFFFF).astype(np.uint16).view(np.float16).astype(np.float32)
+        particle_data[:, 4] = halves(packed["velocityXY"])
+        particle_data[:, 5] = halves(packed["velocityXY"] >> 16)
+        particle_data[:, 6] = halves(packed["velocityZTypeStress"])
+        particle_data[:, 7] = (packed["velocityZTypeStress"] >> 16) & 31
+        particle_data[:, 3] = halves((packed["velocityZTypeStress"] >> 21) << 4)
+        return particle_data
+
+
+PARTICLE_LAYOUTS = {
+    "full": ParticleLayout("full", 32, FULL_GLSL),
+    "compact": ParticleLayout("compact", COMPACT_DTYPE.itemsize, COMPACT_GLSL),
+}
+
+_active = None
+
+
+def select_layout(name):
+    """ Has to run before the particle shaders compile, they bake the struct in. """
+    global _active
+    if name not in PARTICLE_LAYOUTS:
+        raise ValueError(f"[Layout] Unknown particle layout: {name}")
+    _active = PARTICLE_LAYOUTS[name]
+    Shader.register_source("particle_layout.glsl", _active.glsl)
+    return _active
+
+
+def active_layout():
+    return _active
+
+
+select_layout("full")
@@ -2,12 +2,33 @@ import OpenGL.GL as gl
 import glm
 import imgui  
 import glfw
+import os
+import time
+import argparse
 
 from guiC import GUI
 from gameC import Game
 from cameraC import Camera
+from profilerC import Profiler
+from checkpointC import CheckpointWriter, restore_checkpoint
+from layoutC import select_layout
 
-def run():
+TRACE_DIR = "out"
+CHECKPOINT_DIR = os.path.join("out", "checkpoints")
+RECORDING_DIR = os.path.join("out", "recordings")
+
+def write_trace(profiler):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = profiler.stop_trace(os.path.join(TRACE_DIR, time.strftime("trace_%Y%m%d_%H%M%S.json")))
+    print(f"[Trace] {path}, open in ui.perfetto.dev or chrome://tracing")
+
+def latest_checkpoint():
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return None
+    paths = [os.path.join(CHECKPOINT_DIR, name) for name in os.listdir(CHECKPOINT_DIR) if name.endswith(".ckpt")]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+def run(trace_frames=None, replay_path=None, layout="full"):
     if not glfw.init():
         return
 
@@ -30,9 +51,27 @@ def run():
 
     gui = GUI(imgui, engine_window)
     
+    # F9 starts / stops a trace, --trace starts one before the config loads
+    profiler = Profiler()
+    if trace_frames:
+        profiler.start_trace(trace_frames)
+    trace_key_down = False
+
+    # the particle struct is compiled into the shaders Game loads
+    select_layout(layout)
     global game
-    game = Game()
+    game = Game(profiler)
+    profiler.gpuTimers = True
     game.camera.first_mouse = True
+    if replay_path is not None:
+        from replayC import TrajectoryReplay
+        game.particles.start_replay(TrajectoryReplay(replay_path))
+    # F5 saves a checkpoint in the background, F8 restores the newest one
+    checkpoints = CheckpointWriter(game.particles)
+    checkpoint_key_down = False
+    # F6 starts / stops streaming frames to an Arrow file
+    recorder = None
+    record_key_down = False
     
     framebuffer_size_callback(engine_window, game.RENDER_SETTINGS["Width"], game.RENDER_SETTINGS["Heigt"])
     
@@ -52,8 +91,8 @@ def run():
         game.camera.deltaTime = currentFrame - game.camera.lastFrame
         game.camera.lastFrame = currentFrame
         
-        game.particles.deltaTime = game.camera.deltaTime
-        game.particles.simulate_particles()
+        profiler.new_frame()
+        game.particles.simulate_particles(game.camera.deltaTime)
 
         gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT) # type: ignore
         
@@ -61,13 +100,17 @@ def run():
         
         game.render.scene()
         
-        imgui.new_frame() # type: ignore
-        gui.render_particle_graphics(game.particles)
-        gui.render_particle_settings(game.particles)
-        gui.imgui.render() # type: ignore
-        gui.imgui_renderer.render(imgui.get_draw_data()) # type: ignore
+        with profiler.cpu_scope("imgui"):
+            imgui.new_frame() # type: ignore
+            gui.render_particle_graphics(game.particles)
+            gui.render_particle_settings(game.particles)
+            gui.render_profiler(game.particles)
+            gui.render_replay(game.particles)
+            gui.imgui.render() # type: ignore
+            gui.imgui_renderer.render(imgui.get_draw_data()) # type: ignore
         
-        glfw.swap_buffers(engine_window)
+        with profiler.cpu_scope("swap_buffers"):
+            glfw.swap_buffers(engine_window)
         
         frame_count += 1
         current_time = glfw.get_time()
@@ -78,6 +121,45 @@ def run():
             frame_count = 0
 
 
+        if glfw.get_key(engine_window, glfw.KEY_F9) == glfw.PRESS and not trace_key_down:
+            trace_key_down = True
+            if profiler.tracing:
+                write_trace(profiler)
+            else:
+                profiler.start_trace()
+                print(f"[Trace] recording, keeps the last {profiler.traceCapacity} frames, F9 to write")
+        if glfw.get_key(engine_window, glfw.KEY_F9) == glfw.RELEASE:
+            trace_key_down = False
+
+        checkpoints.update()
+        save_key = glfw.get_key(engine_window, glfw.KEY_F5) == glfw.PRESS
+        restore_key = glfw.get_key(engine_window, glfw.KEY_F8) == glfw.PRESS
+        if save_key and not checkpoint_key_down:
+            os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+            checkpoints.save(os.path.join(CHECKPOINT_DIR, time.strftime("checkpoint_%Y%m%d_%H%M%S.ckpt")))
+        if restore_key and not checkpoint_key_down:
+            checkpoints.flush()
+            path = latest_checkpoint()
+            if path is not None:
+                restore_checkpoint(game.particles, path)
+                print(f"[Checkpoint] restored {path}")
+        checkpoint_key_down = save_key or restore_key
+
+        if recorder is not None:
+            recorder.capture(game.particles.scheduler.stepCount)
+        if glfw.get_key(engine_window, glfw.KEY_F6) == glfw.PRESS and not record_key_down:
+            record_key_down = True
+            if recorder is not None:
+                recorder.close()
+                recorder = None
+            else:
+                from recorderC import TrajectoryRecorder
+                os.makedirs(RECORDING_DIR, exist_ok=True)
+                recorder = TrajectoryRecorder(game.particles, os.path.join(RECORDING_DIR, time.strftime("trajectory_%Y%m%d_%H%M%S.arrow")))
+                print(f"[Recorder] recording to {recorder.path}, F6 to stop")
+        if glfw.get_key(engine_window, glfw.KEY_F6) == glfw.RELEASE:
+            record_key_down = False
+
         if glfw.get_key(engine_window, glfw.KEY_HOME) == glfw.PRESS:
             glfw.set_window_should_close(engine_window, True)
 
@@ -88,6 +170,14 @@ def run():
             game.reload_shaders()
             game.TRIGGER_RELOAD_CONFIG = False
 
+    if profiler.tracing:
+        write_trace(profiler)
+    checkpoints.close()
+    if game.particles.replay is not None:
+        game.particles.replay.close()
+    if recorder is not None:
+        recorder.close()
+    game.particles.backend.close()
     gui.imgui_renderer.shutdown()
     glfw.terminate()
     print("Bye!")
@@ -106,4 +196,11 @@ def framebuffer_size_callback(window, width, height):
     imgui.get_io().display_size = glm.vec2(width, height) # type: ignore
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", type=int, default=None, metavar="FRAMES",
+                        help="record a Chrome trace from startup, keeping the last FRAMES frames")
+    parser.add_argument("--replay", default=None, metavar="PATH", help="play back an Arrow recording instead of simulating")
+    parser.add_argument("--layout", choices=("full", "compact"), default="full",
+                        help="particle buffer layout, compact stores 20 bytes with half-float velocities")
+    args = parser.parse_args()
+    run(args.trace, args.replay, args.layout)
@@ -2,22 +2,154 @@ import glm
 import numpy as np
 import time
 import OpenGL.GL as gl
-from shaderC import Shader
+from shaderC import Shader, UniformBlock
+from scanC import PrefixSum, RadixSort
+from schedulerC import Scheduler
+from backendC import ParticleBackend, CPUBackend, spawn_particles, hashed_force_matrix, mask_force_matrix
+from shardC import ShardedCPUBackend
+from profilerC import Profiler
+from readbackC import AsyncReadback
+from layoutC import active_layout
 
 def prGreen(msg): print("\033[92m {}\033[00m".format(msg))
 def prRed(msg): print("\033[91m {}\033[00m".format(msg))
 
+# order-preserving uint encodings of +inf / -inf, what particles_bounds.comp reduces from
+BOUNDS_CLEAR = np.array([0xFFFFFFFF] * 3 + [0] * 3, dtype=np.uint32)
+
+# simulation parameters shared by every particle kernel through '#include "sim_params.glsl"'
+SIM_PARAMS_FIELDS = [
+    ("PARTICLE_COUNT", "int"),
+    ("gridSize", "int"),
+    ("gridDims", "ivec3"),
+    ("cellSize", "float"),
+    ("deltaTime", "float"),
+    ("stepSize", "float"),
+    ("DETECTION_RADIUS", "float"),
+    ("TOO_CLOSE_RADIUS", "float"),
+    ("ACTIVE_TYPES", "int"),
+    ("MAX_PARTICLE_INTERACTIONS", "int"),
+    ("PARTITION_MODE", "int"),
+    ("COUNT_INTERACTIONS", "int"),
+    ("hashCapacity", "uint"),
+    ("UNIVERSE_COUNT", "int"),
+    ("UNIVERSE_PARTICLES", "int"),
+    ("GPU_POPULATION", "int"),
+]
+Shader.register_source("sim_params.glsl", UniformBlock.declaration("SimParams", 0, SIM_PARAMS_FIELDS))
+
+class GPUBackend(ParticleBackend):
+    """ The compute shader path, state lives in the Particles SSBOs. """
+    name = "gpu"
+
+    def __init__(self, particles):
+        self.particles = particles
+
+    def load(self, particle_data):
+        self.particles.upload_particles(particle_data, reset_ids=True)
+
+    def read(self):
+        particles = self.particles
+        if particles.gpu_population():
+            particles.sync_population_count()
+        gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+        raw = np.empty(particles.buffer_size, dtype=np.uint8)
+        gl.glGetNamedBufferSubData(particles.ssbo, 0, raw.nbytes, raw)
+        data = particles.layout.unpack(raw, particles.particleCount)
+        ids = np.empty(particles.particleCount, dtype=np.uint32)
+        gl.glGetNamedBufferSubData(particles.particle_id_ssbo, 0, ids.nbytes, ids)
+        # back to spawn order, undoes Morton reorders
+        ordered = np.empty_like(data)
+        ordered[ids] = data
+        return ordered
+
+    def step(self, params, force_matrix):
+        # params and matrix are already what upload_sim_params / update_force_matrix send
+        particles = self.particles
+        profiler = particles.profiler
+        step = particles.scheduler.stepCount
+        population = particles.gpu_population()
+        if population:
+            with profiler.scope("population"):
+                particles.execute_population()
+        # a GPU population keeps ids equal to slots, so Morton reorders are off while it runs
+        if particles.mortonReorder and not population and step % particles.mortonReorderInterval == 0:
+            with profiler.scope("morton"):
+                particles.execute_morton_reorder()
+            # slot indices changed, so the linked lists point at the wrong particles now
+            if particles.partitionMode == "linked_list":
+                with profiler.scope("partition"):
+                    particles.execute_partitioning()
+        elif particles.partitionMode == "linked_list" and (population or particles.partitionDirty or particles.scheduler.due(particles.partitionInterval)):
+            with profiler.scope("partition"):
+                particles.execute_partitioning()
+        # the sorted copy is a position snapshot, so it has to be rebuilt for every physics step
+        if particles.sorted_partition():
+            with profiler.scope("partition"):
+                particles.execute_partitioning()
+        with profiler.scope("physics"):
+            particles.execute_particle_physics()
+
+
 class Particles:
-    def __init__(self, compute_physics_shader: Shader, compute_partition_shader: Shader):
-        self.COMPUTE_SHADER = compute_physics_shader
-        self.COMPUTE_PARTITION_SHADER = compute_partition_shader
+    PARTITION_MODES = ("linked_list", "counting_sort", "hashed")
+    BACKENDS = ("gpu", "cpu", "cpu_sharded")
+    PHYSICS_KERNELS = ("direct", "tiled")
+    MAX_POSSIBLE_TYPES = 30
+    # must match particles_tiled.comp
+    TILE_BLOCK = 2
+    MAX_TILED_SPAN = 3
+    # must match particle_hash.glsl: the largest cells^3 world whose cell keys stay below HASH_EMPTY
+    MAX_HASH_AXIS_CELLS = 1625
+    MIN_HASH_CAPACITY = 1024
+    # rules a batched universe sets for itself, the rest are shared; UniverseRules in particle_forces.glsl
+    UNIVERSE_FIELDS = ("randomSeed", "numTypes", "detectionRadius", "tooCloseRadius", "stepSize", "spawnSeed")
+    UNIVERSE_DTYPE = np.dtype([("detectionRadius", np.float32), ("tooCloseRadius", np.float32),
+                               ("stepSize", np.float32), ("activeTypes", np.int32)])
+    # byte offsets into the Population buffer of population.glsl
+    POPULATION_SIZE = 48
+    POPULATION_PHYSICS_ARGS = 4
+    POPULATION_PARTICLE_ARGS = 16
+    POPULATION_DRAW_COMMAND = 28
+    # Emitter in particles_emit.comp
+    EMITTER_DTYPE = np.dtype([("positionRadius", np.float32, 4), ("velocitySpread", np.float32, 4),
+                              ("firstSpawn", np.uint32), ("spawnCount", np.uint32),
+                              ("typeFirst", np.uint32), ("typeCount", np.uint32)])
+    # what an emitter leaves out; rate is particles per step, typeCount None spawns every type from typeFirst
+    EMITTER_DEFAULTS = {"position": (0.0, 0.0, 0.0), "radius": 1.0, "rate": 1.0, "velocity": (0.0, 0.0, 0.0),
+                        "spread": 0.0, "typeFirst": 0, "typeCount": None}
+
+    def __init__(self, SHADERS, profiler=None):
+        self.SHADERS = SHADERS
+        self.COMPUTE_SHADER = SHADERS["particles_cs"]
+        self.COMPUTE_TILED_SHADER = SHADERS["particles_tiled_cs"]
+        self.COMPUTE_PARTITION_SHADER = SHADERS["particles_partition_cs"]
+        self.COMPUTE_COUNT_SHADER = SHADERS["particles_count_cs"]
+        self.COMPUTE_HASH_SHADER = SHADERS["particles_hash_cs"]
+        self.COMPUTE_SCATTER_SHADER = SHADERS["particles_scatter_cs"]
+        self.COMPUTE_MORTON_SHADER = SHADERS["particles_morton_cs"]
+        self.COMPUTE_REORDER_SHADER = SHADERS["particles_reorder_cs"]
+        self.COMPUTE_RENUMBER_SHADER = SHADERS["particles_renumber_cs"]
+        self.COMPUTE_BOUNDS_SHADER = SHADERS["particles_bounds_cs"]
+        self.COMPUTE_EMIT_SHADER = SHADERS["particles_emit_cs"]
+        self.COMPUTE_KILL_SHADER = SHADERS["particles_kill_cs"]
+        self.COMPUTE_COMPACT_SHADER = SHADERS["particles_compact_cs"]
+        self.COMPUTE_POPULATION_SHADER = SHADERS["particles_population_cs"]
+        self.prefix_sum = PrefixSum(SHADERS["prefix_sum_cs"])
+        self.radix_sort = RadixSort(SHADERS["radix_split_cs"], self.prefix_sum)
+        self.sim_params = UniformBlock("SimParams", 0, SIM_PARAMS_FIELDS)
+        linked_block = self.COMPUTE_SHADER.uniform_blocks.get("SimParams")
+        if linked_block is not None and linked_block[1] != self.sim_params.size:
+            prRed(f"[Particles] SimParams is {linked_block[1]} bytes in the kernel but {self.sim_params.size} on the CPU")
+        self.scheduler = Scheduler()
+        self.profiler = profiler if profiler is not None else Profiler()
         self.particleCount = 5_000
         self.frameCount = 0
         self.numTypes = 4
         self.gridSize = 100
         self.cellSize = 1.0
-        self.deltaTime = 0.001
-        self.stepSize = 2.5
+        self.deltaTime = self.scheduler.fixedDeltaTime
+        self.stepSize = 0.8
         self.randomSeed = 11
         self.maxInteractions = 500
         self.particleRadius = 0.1
@@ -28,166 +160,975 @@ class Particles:
         self.spawnGridSize = 15
         self.runSimulation = True
         self.useManualForceMatrix = False
-        self.manualForceMatrix = glm.mat4(1.0)
+        self.manualForceMatrix = np.eye(self.MAX_POSSIBLE_TYPES, dtype=np.float32)
+        self.partitionMode = "linked_list"
+        self.physicsKernel = "direct"
+        self.mortonReorder = False
+        self.mortonReorderInterval = 20
+        self.partitionInterval = 2
+        # gridSize is the world edge; the cell grid is derived from the detection radius and the bounds
+        # the particles occupy, refreshed from the GPU every gridRefreshInterval steps. It wraps, so
+        # particles outside the bounds alias into it instead of being missed.
+        self.autoGrid = True
+        self.gridRefreshInterval = 30
+        self.maxCellsPerParticle = 4
+        self.gridDims = (self.gridSize,) * 3
+        # hashed partition: cells of the whole world are looked up in a table of hashCapacity slots, sized
+        # by the particle count, so the partition memory does not grow with the world volume
+        self.hashCapacity = self.MIN_HASH_CAPACITY
+        self.gridCellCount = 0
+        self.hashedGrid = False
+        self.gridBounds = None
+        self.boundsFence = None
+        # batched universes: a list of per-universe rules (UNIVERSE_FIELDS), universeParticles each, or
+        # None for a single world; see set_universes
+        self.universes = None
+        self.universeParticles = self.particleCount
+        # GPU population: emitters (EMITTER_DEFAULTS dicts) and kill zones ((x, y, z, radius)) change the
+        # count on the GPU, in buffers of populationCapacity particles; see set_population
+        self.emitters = []
+        self.killZones = []
+        self.populationCapacity = 100_000
+        self.emitCarry = np.zeros(0)
+        self.populationFence = None
+        self.gpu_backend = GPUBackend(self)
+        self.cpu_backend = CPUBackend()
+        self.sharded_backend = ShardedCPUBackend()
+        self.backend = self.gpu_backend
+        self.readback = AsyncReadback()
+        # a TrajectoryReplay drives the SSBOs instead of the simulation while set
+        self.replay = None
+        self.replayShown = None
 
         self.LOCAL_X_CP = 512
         self.LOCAL_X_CS = 1024
         self.dispatchCount_CS = (self.particleCount + self.LOCAL_X_CS - 1) // self.LOCAL_X_CS
         self.dispatchCount_CP = (self.particleCount + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP
         
+        # rows of particle_data on the CPU, the SSBOs hold layout.stride bytes per particle
         self.floatsPerParticle = 8
+        self.layout = active_layout()
 
-        self.update_gridCellCount()
+        self.update_gridCellCount(fresh=True)
         self.init_particles()
         self.init_particle_ssbo()
         self.init_partition_buffers()
+        self.init_force_matrix_buffer()
+        self.init_population_buffers()
         
 
-    def update_gridCellCount(self):
-        self.gridCellCount = self.gridSize ** 3
+    def update_gridCellCount(self, fresh=False):
+        """ Derives cellSize and gridDims (autoGrid), True when the cell buffers have to be resized.
+            fresh skips the hysteresis, for a new particle state. """
+        previous = (self.gridDims, self.gridCellCount, self.hashedGrid)
+        if self.autoGrid:
+            # one cell per radius keeps the search at 3x3x3 cells, tooCloseRadius included
+            self.cellSize = max(max(float(rules["detectionRadius"]), float(rules["tooCloseRadius"]))
+                                for rules in self.universe_rules())
+            self.cellSize = max(self.cellSize, 0.01)
+            self.gridDims = self.derive_grid_dims(None if fresh else previous[0])
+        else:
+            self.gridDims = (self.gridSize,) * 3
+        self.hashedGrid = self.partitionMode == "hashed"
+        if self.hashedGrid:
+            # the table keys on world cells, coarser cells once the world has too many for a uint key
+            self.cellSize = max(self.cellSize, self.gridSize * np.cbrt(self.universe_count()) / self.MAX_HASH_AXIS_CELLS)
+            self.hashCapacity = self.derive_hash_capacity(None if fresh else self.hashCapacity)
+            self.gridCellCount = self.hashCapacity
+        else:
+            # one block of cells per universe
+            self.gridCellCount = int(np.prod(self.gridDims)) * self.universe_count()
+        return (self.gridDims, self.gridCellCount, self.hashedGrid) != previous
+
+    def derive_hash_capacity(self, current=None):
+        """ Power of two slots, at least twice the particles so the table stays at most half full. """
+        # a GPU population may fill its capacity before the CPU hears about it
+        particles = self.particleCapacity if self.gpu_population() else self.particleCount
+        needed = max(2 * particles, self.MIN_HASH_CAPACITY)
+        # same hysteresis as the grid, a shrinking count only reallocates once most slots are spare
+        if current is not None and needed <= current <= 4 * needed:
+            return current
+        return 1 << (needed - 1).bit_length()
+
+    def derive_grid_dims(self, current=None):
+        world = np.full(3, float(self.gridSize))
+        if self.gridBounds is None:
+            extent = np.minimum(np.full(3, float(self.spawnGridSize)), world)
+        else:
+            # a cell of margin each side, particles cross the bounds between refreshes
+            extent = np.minimum(self.gridBounds[1] - self.gridBounds[0] + 2.0 * self.cellSize, world)
+        dims = np.maximum(np.ceil(extent / self.cellSize), 3)
+        # a sparse world gets a coarser hash rather than mostly empty cells
+        limit = max(self.maxCellsPerParticle * self.particleCount, 27)
+        if dims.prod() > limit:
+            dims = np.maximum(np.floor(dims * (limit / dims.prod()) ** (1.0 / 3.0)), 3)
+        dims = tuple(int(d) for d in dims)
+        # hysteresis: drifting bounds only reallocate when they outgrow the grid or leave most of it empty
+        if current is not None and all(d <= c for d, c in zip(dims, current)) and np.prod(dims) * 2 >= np.prod(current):
+            return current
+        return dims
+
+    def request_grid_bounds(self):
+        """ Reduces the particle bounds on the GPU, poll_grid_bounds picks them up once the fence passed. """
+        if self.boundsFence is not None or self.particleCount == 0:
+            return
+        gl.glNamedBufferSubData(self.bounds_ssbo, 0, BOUNDS_CLEAR.nbytes, BOUNDS_CLEAR)
+        self.upload_sim_params()
+        gl.glUseProgram(self.COMPUTE_BOUNDS_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 19, self.bounds_ssbo)
+        self.dispatch_particle_pass(self.COMPUTE_BOUNDS_SHADER)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 19, 0)
+        gl.glUseProgram(0)
+        gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+        self.boundsFence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def poll_grid_bounds(self):
+        if self.boundsFence is None:
+            return
+        if gl.glClientWaitSync(self.boundsFence, 0, 0) not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+            return
+        gl.glDeleteSync(self.boundsFence)
+        self.boundsFence = None
+        bits = np.empty(6, dtype=np.uint32)
+        gl.glGetNamedBufferSubData(self.bounds_ssbo, 0, bits.nbytes, bits)
+        bits = np.where(bits & 0x80000000, bits & 0x7FFFFFFF, ~bits).astype(np.uint32)
+        bounds = bits.view(np.float32).reshape(2, 3).astype(np.float64)
+        if np.all(np.isfinite(bounds)) and np.all(bounds[0] <= bounds[1]):
+            self.gridBounds = bounds
+
+    def refresh_grid(self):
+        """ Once a step: new bounds or radii resize the cell buffers before anything bins into them. """
+        self.poll_grid_bounds()
+        if self.update_gridCellCount():
+            self.init_grid_buffers()
+
+    def universe_count(self):
+        return len(self.universes) if self.universes else 1
+
+    def universe_rules(self):
+        """ Rules of every universe, the Particles values fill in what a universe leaves out. A universe
+            without a spawnSeed spawns from the running np.random state. """
+        shared = {name: getattr(self, name, None) for name in self.UNIVERSE_FIELDS}
+        if not self.universes:
+            return [shared]
+        return [dict(shared, **rules) for rules in self.universes]
+
+    def set_universes(self, universes, universeParticles=None, particle_data=None):
+        """ Steps len(universes) independent worlds of universeParticles particles in the same dispatches.
+            universes: dicts of UNIVERSE_FIELDS, each gets its own force matrix and spawn; None or [] goes
+            back to a single world of particleCount. Universe u owns the particles of spawn ids
+            [u * universeParticles, (u + 1) * universeParticles), read_particles returns them in that order.
+            particle_data, in that order, stands in for the spawn. False when the universes are refused. """
+        if universes and self.backend is not self.gpu_backend:
+            prRed("[Particles] Batched universes only run on the gpu backend")
+            return False
+        if universes and self.gpu_population():
+            prRed("[Particles] Batched universes keep a fixed count, clear the emitters and kill zones first")
+            return False
+        self.universes = [dict(rules) for rules in universes] if universes else None
+        if universeParticles is not None:
+            self.universeParticles = max(int(universeParticles), 1)
+        if self.universes:
+            self.particleCount = self.universeParticles * len(self.universes)
+        self.force_matrix_key = None
+        if particle_data is None:
+            self.set_particle_count()
+        else:
+            self.set_particles(particle_data)
+        return True
+
+    def split_universes(self, particle_data):
+        """ Spawn-ordered particle_data, from read_particles, as one array per universe. """
+        if not self.universes:
+            return [particle_data]
+        return [particle_data[u * self.universeParticles:(u + 1) * self.universeParticles] for u in range(len(self.universes))]
+
+    def universe_tiles(self):
+        """ (columns, spacing) of the side by side preview: a near square grid of spawn cubes with a gap. """
+        columns = int(np.ceil(np.sqrt(self.universe_count())))
+        return columns, float(self.spawnGridSize) * 1.5
+
+    def spawn_universes(self):
+        half = self.spawnGridSize * 0.5
+        blocks = []
+        for rules in self.universe_rules():
+            if rules.get("spawnSeed") is not None:
+                np.random.seed(rules["spawnSeed"])
+            blocks.append(spawn_particles(self.universeParticles, (half, half, half), rules["numTypes"]))
+        return np.concatenate(blocks)
+
+    def gpu_population(self):
+        """ Whether emitters or kill zones own the particle count, on the GPU. """
+        return bool(self.emitters or self.killZones)
+
+    def set_population(self, emitters=None, killZones=None, capacity=None):
+        """ Spawns and removes particles entirely on the GPU. emitters: dicts of EMITTER_DEFAULTS, rate
+            particles per step inside a ball of radius around position; killZones: (x, y, z, radius) balls
+            whose particles are removed every step. The buffers hold capacity particles, spawns past it are
+            dropped. While any are set the passes size themselves from the GPU's live count and particleCount
+            follows it a step or two late; ids equal slots, so read_particles returns slot order. """
+        population = bool(emitters or killZones)
+        if population and self.universes:
+            prRed("[Particles] Batched universes keep a fixed count, leave them before adding emitters or kill zones")
+            return
+        if population and self.backend is not self.gpu_backend:
+            prRed("[Particles] Emitters and kill zones only run on the gpu backend")
+            return
+        if self.gpu_population():
+            # the exact count, for whatever owns it next
+            self.sync_population_count()
+        self.emitters = [dict(self.EMITTER_DEFAULTS, **emitter) for emitter in emitters or []]
+        self.killZones = [tuple(float(v) for v in zone) for zone in killZones or []]
+        self.emitCarry = np.zeros(len(self.emitters))
+        if capacity is not None:
+            self.populationCapacity = max(int(capacity), 1)
+        self.upload_population_shapes()
+        if population:
+            self.init_population_state()
+        # the lists may link slots the population moved
+        self.partitionDirty = True
+
+    def init_population_buffers(self):
+        self.population_ssbo = self.create_ssbo(self.POPULATION_SIZE)
+        # liveCount is copied here before the fence, so polling it never waits on later steps
+        self.population_count_ssbo = self.create_ssbo(np.dtype(np.uint32).itemsize)
+        self.emitter_ssbo = 0
+        self.kill_zone_ssbo = 0
+        self.upload_population_shapes()
+
+    def upload_population_shapes(self):
+        """ Kill zones go up once, the emitters every step with their spawn counts. """
+        for name, count, size in (("emitter_ssbo", len(self.emitters), self.EMITTER_DTYPE.itemsize),
+                                  ("kill_zone_ssbo", len(self.killZones), 4 * np.dtype(np.float32).itemsize)):
+            ssbo = getattr(self, name)
+            if ssbo != 0 and gl.glIsBuffer(ssbo):
+                gl.glDeleteBuffers(1, [ssbo])
+            setattr(self, name, self.create_ssbo(max(count, 1) * size))
+        if self.killZones:
+            zones = np.array(self.killZones, dtype=np.float32)
+            gl.glNamedBufferSubData(self.kill_zone_ssbo, 0, zones.nbytes, zones)
+
+    def init_population_state(self):
+        """ Hands the current particles to the GPU population: capacity sized buffers, ids equal to slots. """
+        capacity = max(self.populationCapacity, self.particleCount)
+        if capacity != self.particleCapacity:
+            self.reallocate_particle_buffers(capacity, self.particleCount)
+        particle_ids = np.arange(capacity, dtype=np.uint32)
+        gl.glNamedBufferSubData(self.particle_id_ssbo, 0, particle_ids.nbytes, particle_ids)
+        # the hash table is sized for the capacity now
+        if self.update_gridCellCount(fresh=True):
+            self.init_grid_buffers()
+        live = np.array([self.particleCount], dtype=np.uint32)
+        gl.glNamedBufferSubData(self.population_ssbo, 0, live.nbytes, live)
+        self.execute_population_args(compacted=False)
+
+    def emitter_table(self):
+        """ This step's spawns, fractional rates carry over to later steps. """
+        table = np.zeros(len(self.emitters), dtype=self.EMITTER_DTYPE)
+        first = 0
+        for e, emitter in enumerate(self.emitters):
+            self.emitCarry[e] += max(float(emitter["rate"]), 0.0)
+            spawns = int(self.emitCarry[e])
+            self.emitCarry[e] -= spawns
+            types = emitter["typeCount"] if emitter["typeCount"] is not None else self.numTypes - emitter["typeFirst"]
+            table[e] = ((*emitter["position"], emitter["radius"]), (*emitter["velocity"], emitter["spread"]),
+                        first, spawns, emitter["typeFirst"], max(int(types), 1))
+            first += spawns
+        return table, first
+
+    def execute_population(self):
+        """ Emit, remove and compact, then size the indirect arguments; the count never leaves the GPU. """
+        self.upload_sim_params()
+        capacity = self.particleCapacity
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 22, self.population_ssbo)
+
+        table, spawns = self.emitter_table()
+        if spawns:
+            gl.glNamedBufferSubData(self.emitter_ssbo, 0, table.nbytes, table)
+            shader = self.COMPUTE_EMIT_SHADER
+            shader.set("EMIT_TOTAL", spawns)
+            shader.set("EMITTER_COUNT", len(table))
+            shader.set("PARTICLE_CAPACITY", capacity)
+            shader.set("EMIT_SEED", (self.randomSeed * 0x9E3779B9 + self.scheduler.stepCount) & 0xFFFFFFFF)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 23, self.emitter_ssbo)
+            shader.dispatch((spawns + 63) // 64, 1, 1)
+
+        if self.killZones:
+            # flags over the whole capacity, the scan turns them into survivor slots and count
+            shader = self.COMPUTE_KILL_SHADER
+            shader.set("KILL_ZONE_COUNT", len(self.killZones))
+            shader.set("PARTICLE_CAPACITY", capacity)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 24, self.kill_zone_ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 25, self.compact_flags_ssbo)
+            shader.dispatch((capacity + self.LOCAL_X_CP) // self.LOCAL_X_CP, 1, 1)
+            self.prefix_sum.exclusive_scan(self.compact_flags_ssbo, capacity + 1)
+
+            shader = self.COMPUTE_COMPACT_SHADER
+            shader.set("PARTICLE_CAPACITY", capacity)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.sorted_particles_ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 25, self.compact_flags_ssbo)
+            shader.dispatch((capacity + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP, 1, 1)
+            # before physics, which then writes the compacted state over previous_ssbo, so the pair stays aligned
+            self.ssbo, self.sorted_particles_ssbo = self.sorted_particles_ssbo, self.ssbo
+
+        for binding in (0, 5, 8, 23, 24, 25):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        self.execute_population_args(compacted=bool(self.killZones))
+
+    def execute_population_args(self, compacted):
+        shader = self.COMPUTE_POPULATION_SHADER
+        shader.set("COMPACTED", int(compacted))
+        shader.set("PARTICLE_CAPACITY", self.particleCapacity)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 22, self.population_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 25, self.compact_flags_ssbo)
+        shader.dispatch(1, 1, 1)
+        for binding in (22, 25):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+        # the indirect dispatches and the draw read their arguments from it
+        gl.glMemoryBarrier(gl.GL_COMMAND_BARRIER_BIT)
+
+    def request_population_count(self):
+        """ Queues a copy of the live count, poll_population_count picks it up once the fence passed. """
+        if self.populationFence is not None:
+            return
+        gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+        gl.glCopyNamedBufferSubData(self.population_ssbo, self.population_count_ssbo, 0, 0, np.dtype(np.uint32).itemsize)
+        self.populationFence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def poll_population_count(self):
+        if self.populationFence is None:
+            return
+        if gl.glClientWaitSync(self.populationFence, 0, 0) not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+            return
+        gl.glDeleteSync(self.populationFence)
+        self.populationFence = None
+        self.set_live_count(self.population_count_ssbo)
+
+    def sync_population_count(self):
+        """ The exact live count, waits for the GPU; for reads and mode changes, not every step. """
+        if self.populationFence is not None:
+            gl.glDeleteSync(self.populationFence)
+            self.populationFence = None
+        gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+        self.set_live_count(self.population_ssbo)
+
+    def set_live_count(self, ssbo):
+        live = np.empty(1, dtype=np.uint32)
+        gl.glGetNamedBufferSubData(ssbo, 0, live.nbytes, live)
+        self.particleCount = int(live[0])
+        self.buffer_size = self.particleCount * self.layout.stride
+        self.dispatchCount_CS = (self.particleCount + self.LOCAL_X_CS - 1) // self.LOCAL_X_CS
+        self.dispatchCount_CP = (self.particleCount + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP
 
     def init_particles(self):
+        if self.universes:
+            self.particle_data = self.spawn_universes()
+            return
         if isinstance(self.gridSize, (list, tuple)):
             gs_vec = glm.vec3(self.gridSize[0], self.gridSize[1], self.gridSize[2])
         else:
             gs_vec = glm.vec3(self.spawnGridSize)
         
         world_half_extents = gs_vec * 0.5
-
-        low_bounds = np.array([-world_half_extents.x, -world_half_extents.y, -world_half_extents.z], dtype=np.float32)
-        high_bounds = np.array([world_half_extents.x, world_half_extents.y, world_half_extents.z], dtype=np.float32)
-        
-        positions = np.random.uniform(low=low_bounds, high=high_bounds, size=(self.particleCount, 3)).astype(np.float32)
-        
-
-        velocities = np.zeros((self.particleCount, 3), dtype=np.float32) 
-        types = np.random.randint(0, self.numTypes, size=(self.particleCount, 1)).astype(np.float32)
-        
-        self.particle_data = np.zeros((self.particleCount, self.floatsPerParticle), dtype=np.float32)
-        self.particle_data[:, 0:3] = positions             
-        self.particle_data[:, 3]   = 0.0                  
-        self.particle_data[:, 4:7] = velocities            
-        self.particle_data[:, 7]   = types.flatten()        
+        self.particle_data = spawn_particles(self.particleCount, (world_half_extents.x, world_half_extents.y, world_half_extents.z), self.numTypes)
 
     def init_particle_ssbo(self):
-        self.buffer_size = self.particleCount * self.floatsPerParticle * np.dtype(np.float32).itemsize
+        # per-particle buffers are sized for particleCapacity, resize_particles grows it by doubling
+        self.particleCapacity = self.particleCount
+        self.buffer_size = self.particleCount * self.layout.stride
         
         if hasattr(self, 'ssbo') and gl.glIsBuffer(self.ssbo):
             gl.glDeleteBuffers(1, [self.ssbo])
 
         self.ssbo = gl.glGenBuffers(1)
         gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.ssbo)
-        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, self.buffer_size, self.particle_data, gl.GL_DYNAMIC_DRAW)
+        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, self.buffer_size, self.layout.pack(self.particle_data), gl.GL_DYNAMIC_DRAW)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
         gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
 
+        # spawn index of the particle in each slot, permuted along with every reorder
+        if hasattr(self, 'particle_id_ssbo') and gl.glIsBuffer(self.particle_id_ssbo):
+            gl.glDeleteBuffers(1, [self.particle_id_ssbo])
+        particle_ids = np.arange(self.particleCount, dtype=np.uint32)
+        self.particle_id_ssbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.particle_id_ssbo)
+        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, particle_ids.nbytes, particle_ids, gl.GL_DYNAMIC_COPY)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
+
+        # second half of the ping-pong pair: physics reads ssbo and writes this one, then they swap,
+        # so between steps it holds the state before the latest step and the renderer blends from it
+        if hasattr(self, 'previous_ssbo') and gl.glIsBuffer(self.previous_ssbo):
+            gl.glDeleteBuffers(1, [self.previous_ssbo])
+        self.previous_ssbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.previous_ssbo)
+        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, self.buffer_size, None, gl.GL_DYNAMIC_COPY)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
+        # copied on the GPU, the state crosses the bus once
+        gl.glCopyNamedBufferSubData(self.ssbo, self.previous_ssbo, 0, 0, self.buffer_size)
+
+        if self.backend is not self.gpu_backend:
+            self.backend.load(self.particle_data)
+
+    def read_particles(self):
+        """ Particle state in spawn order, from whichever backend is simulating. """
+        return self.backend.read()
+
+    def request_readback(self, tag=None):
+        """ Queues a copy of the last completed state without stalling, collect it from readback.poll()
+            a frame or two later. tag defaults to the step count. """
+        tag = self.scheduler.stepCount if tag is None else tag
+        if self.gpu_population():
+            # particleCount trails the GPU population, the copy has to cover exactly the live particles
+            self.sync_population_count()
+        return self.readback.request(self.ssbo, self.particle_id_ssbo, self.particleCount, tag)
+
+    def upload_particles(self, particle_data, reset_ids=False):
+        gl.glNamedBufferSubData(self.ssbo, 0, self.buffer_size, self.layout.pack(particle_data))
+        if reset_ids:
+            particle_ids = np.arange(self.particleCount, dtype=np.uint32)
+            gl.glNamedBufferSubData(self.particle_id_ssbo, 0, particle_ids.nbytes, particle_ids)
+
+    def set_backend(self, name):
+        target = {"gpu": self.gpu_backend, "cpu": self.cpu_backend, "cpu_sharded": self.sharded_backend}[name]
+        if target is self.backend:
+            return
+        if self.universes:
+            prRed("[Particles] The CPU backends step a single world, leave the batched universes first")
+            return
+        if self.gpu_population():
+            prRed("[Particles] The CPU backends keep a fixed count, clear the emitters and kill zones first")
+            return
+        particle_data = self.backend.read()
+        self.backend.close()
+        self.backend = target
+        target.load(particle_data)
+        # the renderer keeps drawing from the SSBO, in spawn order while the CPU simulates
+        self.upload_particles(particle_data, reset_ids=True)
+        gl.glCopyNamedBufferSubData(self.ssbo, self.previous_ssbo, 0, 0, self.buffer_size)
+
+    def init_force_matrix_buffer(self):
+        self.force_matrix_ssbo = 0
+        self.universe_ssbo = 0
+        self.forceMatrixUniverses = 0
+        # neighbour interactions summed by the physics kernel while the profiler is live
+        self.interaction_count_ssbo = self.create_ssbo(np.dtype(np.uint32).itemsize)
+        self.force_matrix_key = None
+        self.update_force_matrix()
+
+    def build_force_matrix(self, rules=None):
+        """ Interaction strength indexed [acting type, receiving type], of one universe's rules. """
+        seed, types = (self.randomSeed, self.numTypes) if rules is None else (rules["randomSeed"], rules["numTypes"])
+        if self.useManualForceMatrix:
+            return mask_force_matrix(self.manualForceMatrix, types)
+        return hashed_force_matrix(seed, types, self.gridSize)
+
+    def update_force_matrix(self):
+        """ Uploads the force matrices and the universe table, one matrix and one row per universe. """
+        key = (self.randomSeed, self.numTypes, self.gridSize, self.useManualForceMatrix, self.manualForceMatrix.tobytes(),
+               repr(self.universe_rules()))
+        if key == self.force_matrix_key:
+            return
+        if not self.universes:
+            self.force_matrix = self.build_force_matrix()
+        else:
+            # [universe, acting, receiving]
+            self.force_matrix = np.stack([self.build_force_matrix(rules) for rules in self.universe_rules()])
+        matrices = self.force_matrix
+        universes = self.universe_count()
+        if universes != self.forceMatrixUniverses:
+            for ssbo in (self.force_matrix_ssbo, self.universe_ssbo):
+                if ssbo != 0 and gl.glIsBuffer(ssbo):
+                    gl.glDeleteBuffers(1, [ssbo])
+            self.force_matrix_ssbo = self.create_ssbo(matrices.nbytes)
+            self.universe_ssbo = self.create_ssbo(universes * self.UNIVERSE_DTYPE.itemsize)
+            self.forceMatrixUniverses = universes
+        gl.glNamedBufferSubData(self.force_matrix_ssbo, 0, matrices.nbytes, matrices)
+        table = np.zeros(universes, dtype=self.UNIVERSE_DTYPE)
+        for u, rules in enumerate(self.universe_rules()):
+            table[u] = (rules["detectionRadius"], rules["tooCloseRadius"], rules["stepSize"], rules["numTypes"])
+        gl.glNamedBufferSubData(self.universe_ssbo, 0, table.nbytes, table)
+        self.force_matrix_key = key
+
     def dispatch_particles(self):
         self.dispatchCount_CS = (self.particleCount + 1023) // 1024
         self.dispatchCount_CP = (self.particleCount + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
         self.COMPUTE_SHADER.dispatch(self.dispatchCount_CS, 1, 1)
 
+    def dispatch_particle_pass(self, shader, physics=False):
+        """ One invocation per particle, sized on the CPU from particleCount or, under a GPU population,
+            from the arguments particles_population.comp wrote. """
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 22, self.population_ssbo)
+        if self.gpu_population():
+            shader.dispatch_indirect(self.population_ssbo, self.POPULATION_PHYSICS_ARGS if physics else self.POPULATION_PARTICLE_ARGS)
+        else:
+            shader.dispatch(self.dispatchCount_CS if physics else self.dispatchCount_CP, 1, 1)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 22, 0)
+
+    def init_grid_buffers(self):
+        """ The buffers sized by gridCellCount, cells of the dense grid or slots of the hash table. """
+        for name in ("grid_head_ssbo", "cell_start_ssbo", "hash_keys_ssbo"):
+            ssbo = getattr(self, name, 0)
+            if ssbo != 0 and gl.glIsBuffer(ssbo):
+                gl.glDeleteBuffers(1, [ssbo])
+        int_size = np.dtype(np.int32).itemsize
+        # the linked lists only run on the dense grid, the hashed mode keeps placeholders
+        self.grid_head_ssbo = self.create_ssbo((1 if self.hashedGrid else self.gridCellCount) * int_size)
+        # cellStart holds one extra entry so cell c spans [cellStart[c], cellStart[c + 1])
+        self.cell_start_ssbo = self.create_ssbo((self.gridCellCount + 1) * int_size)
+        self.hash_keys_ssbo = self.create_ssbo((self.hashCapacity if self.hashedGrid else 1) * int_size)
+        self.reset_partition_buffers()
+        # empty lists, the next step has to build them whatever partitionInterval says
+        self.partitionDirty = True
+
     def init_partition_buffers(self):
-        if hasattr(self, 'grid_head_ssbo') and self.grid_head_ssbo != 0 and gl.glIsBuffer(self.grid_head_ssbo):
-            gl.glDeleteBuffers(1, [self.grid_head_ssbo])
-            self.grid_head_ssbo = 0 
         if hasattr(self, 'particle_links_ssbo') and self.particle_links_ssbo != 0 and gl.glIsBuffer(self.particle_links_ssbo):
             gl.glDeleteBuffers(1, [self.particle_links_ssbo])
             self.particle_links_ssbo = 0 
 
-        self.grid_head_data = np.full(self.gridCellCount, -1, dtype=np.int32)
-        self.grid_head_ssbo = gl.glGenBuffers(1)
-        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.grid_head_ssbo)
-        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, self.grid_head_data.nbytes, self.grid_head_data, gl.GL_DYNAMIC_DRAW)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, self.grid_head_ssbo)
+        int_size = np.dtype(np.int32).itemsize
+        self.particle_links_ssbo = self.create_ssbo(self.particleCapacity * int_size)
+        self.init_grid_buffers()
 
-        self.particle_links_data = np.full(self.particleCount, -1, dtype=np.int32)
-        self.particle_links_ssbo = gl.glGenBuffers(1)
-        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.particle_links_ssbo)
-        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, self.particle_links_data.nbytes, self.particle_links_data, gl.GL_DYNAMIC_DRAW)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, self.particle_links_ssbo)
+        self.init_counting_sort_buffers()
 
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0) 
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, 0) 
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, 0) 
-        gl.glUseProgram(0)
+    def init_counting_sort_buffers(self):
+        for name in ("particle_cell_rank_ssbo", "sorted_particles_ssbo", "sorted_index_ssbo", "compact_flags_ssbo",
+                     "reordered_id_ssbo", "sort_keys_ssbo", "sort_values_ssbo", "sort_keys_tmp_ssbo", "sort_values_tmp_ssbo"):
+            ssbo = getattr(self, name, 0)
+            if ssbo != 0 and gl.glIsBuffer(ssbo):
+                gl.glDeleteBuffers(1, [ssbo])
+            setattr(self, name, 0)
+
+        uint_size = np.dtype(np.uint32).itemsize
+        capacity = self.particleCapacity
+        self.particle_cell_rank_ssbo = self.create_ssbo(capacity * 2 * uint_size)
+        self.sorted_particles_ssbo = self.create_ssbo(capacity * self.layout.stride)
+        self.sorted_index_ssbo = self.create_ssbo(capacity * uint_size)
+
+        self.reordered_id_ssbo = self.create_ssbo(capacity * uint_size)
+        self.sort_keys_ssbo = self.create_ssbo(capacity * uint_size)
+        self.sort_values_ssbo = self.create_ssbo(capacity * uint_size)
+        self.sort_keys_tmp_ssbo = self.create_ssbo(capacity * uint_size)
+        self.sort_values_tmp_ssbo = self.create_ssbo(capacity * uint_size)
+        # kept flags of the kill pass, one past the capacity so their scan ends in the survivor count
+        self.compact_flags_ssbo = self.create_ssbo((capacity + 1) * uint_size)
+        # freed / moved counters of the renumber pass after a shrink
+        if getattr(self, "renumber_counter_ssbo", 0) == 0:
+            self.renumber_counter_ssbo = self.create_ssbo(2 * uint_size)
+        if getattr(self, "bounds_ssbo", 0) == 0:
+            self.bounds_ssbo = self.create_ssbo(BOUNDS_CLEAR.nbytes)
+
+    def partition_memory(self):
+        """ Bytes of the partition buffers: cells (dense grid or hash table) and per-particle (links, sort). """
+        int_size = np.dtype(np.int32).itemsize
+        heads = 1 if self.hashedGrid else self.gridCellCount
+        keys = self.hashCapacity if self.hashedGrid else 1
+        cells = (heads + self.gridCellCount + 1 + keys) * int_size
+        # links, cell and rank, sorted index, and the sorted copy
+        per_particle = self.particleCapacity * (4 * int_size + self.layout.stride)
+        return {"cells": cells, "particles": per_particle, "total": cells + per_particle}
+
+    @staticmethod
+    def create_ssbo(size):
+        ssbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, ssbo)
+        gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, size, None, gl.GL_DYNAMIC_COPY)
+        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
+        return ssbo
+
+    @staticmethod
+    def clear_buffer(ssbo, value):
+        if value < 0:
+            gl.glClearNamedBufferData(ssbo, gl.GL_R32I, gl.GL_RED_INTEGER, gl.GL_INT, np.array([value], dtype=np.int32))
+        else:
+            gl.glClearNamedBufferData(ssbo, gl.GL_R32UI, gl.GL_RED_INTEGER, gl.GL_UNSIGNED_INT, np.array([value], dtype=np.uint32))
 
     def reset_partition_buffers(self):
-        self.grid_head_data.fill(-1)
-        self.particle_links_data.fill(-1)
-        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.grid_head_ssbo)
-        gl.glBufferSubData(gl.GL_SHADER_STORAGE_BUFFER, 0, self.grid_head_data.nbytes, self.grid_head_data)
-        gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.particle_links_ssbo)
-        gl.glBufferSubData(gl.GL_SHADER_STORAGE_BUFFER, 0, self.particle_links_data.nbytes, self.particle_links_data)
+        # every particle link is rewritten by the partition pass, only the heads need clearing
+        self.clear_buffer(self.grid_head_ssbo, -1)
 
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, 0)
-        gl.glUseProgram(0)
+    def upload_sim_params(self):
+        self.sim_params.upload(self.sim_param_values())
+
+    def sim_param_values(self):
+        return {
+            "PARTICLE_COUNT": self.particleCount,
+            "gridSize": self.gridSize,
+            "gridDims": self.gridDims,
+            "cellSize": self.cellSize,
+            "deltaTime": self.deltaTime,
+            "stepSize": self.stepSize,
+            "DETECTION_RADIUS": self.detectionRadius,
+            "TOO_CLOSE_RADIUS": self.tooCloseRadius,
+            "ACTIVE_TYPES": self.numTypes,
+            "MAX_PARTICLE_INTERACTIONS": self.maxInteractions,
+            "PARTITION_MODE": self.PARTITION_MODES.index(self.partitionMode),
+            "COUNT_INTERACTIONS": int(self.profiler.gpuTimers),
+            "hashCapacity": self.hashCapacity,
+            "UNIVERSE_COUNT": self.universe_count(),
+            "UNIVERSE_PARTICLES": max(self.universeParticles if self.universes else self.particleCount, 1),
+            "GPU_POPULATION": int(self.gpu_population()),
+        }
+
+    def sorted_partition(self):
+        """ Whether the partition is the cell-sorted copy, rebuilt every step, rather than linked lists. """
+        return self.partitionMode in ("counting_sort", "hashed")
 
     def execute_partitioning(self):
+        self.upload_sim_params()
+        if self.sorted_partition():
+            self.execute_counting_sort()
+            return
         self.reset_partition_buffers()
+        self.partitionDirty = False
         gl.glUseProgram(self.COMPUTE_PARTITION_SHADER.program)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_PARTITION_SHADER.program, "gridSize"), self.gridSize)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_PARTITION_SHADER.program, "cellSize"), self.cellSize)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_PARTITION_SHADER.program, "PARTICLE_COUNT"), self.particleCount)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, self.grid_head_ssbo)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, self.particle_links_ssbo)
-        self.COMPUTE_PARTITION_SHADER.dispatch(self.dispatchCount_CP, 1, 1)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        self.dispatch_particle_pass(self.COMPUTE_PARTITION_SHADER)
+        for binding in (0, 1, 2, 8):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
         gl.glUseProgram(0)
 
+    def execute_counting_sort(self):
+        self.clear_buffer(self.cell_start_ssbo, 0)
+
+        # hashed: the same sort over table slots, the count pass inserts the cells it meets
+        count_shader = self.COMPUTE_HASH_SHADER if self.hashedGrid else self.COMPUTE_COUNT_SHADER
+        if self.hashedGrid:
+            self.clear_buffer(self.hash_keys_ssbo, 0xFFFFFFFF)
+        gl.glUseProgram(count_shader.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 3, self.cell_start_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 4, self.particle_cell_rank_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 20, self.hash_keys_ssbo)
+        self.dispatch_particle_pass(count_shader)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 20, 0)
+
+        self.prefix_sum.exclusive_scan(self.cell_start_ssbo, self.gridCellCount + 1)
+
+        gl.glUseProgram(self.COMPUTE_SCATTER_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 3, self.cell_start_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 4, self.particle_cell_rank_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.sorted_particles_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 6, self.sorted_index_ssbo)
+        self.dispatch_particle_pass(self.COMPUTE_SCATTER_SHADER)
+
+        for binding in (0, 3, 4, 5, 6):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+
+    def execute_morton_reorder(self):
+        self.upload_sim_params()
+        gl.glUseProgram(self.COMPUTE_MORTON_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 12, self.sort_keys_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 13, self.sort_values_ssbo)
+        self.COMPUTE_MORTON_SHADER.dispatch(self.dispatchCount_CP, 1, 1)
+
+        # 10 bits per axis at most, only the bits a cell coordinate can actually use get sorted
+        axis_bits = min(max(int(max(self.gridDims) - 1).bit_length(), 1), 10)
+        self.radix_sort.sort(self.sort_keys_ssbo, self.sort_values_ssbo,
+                             self.sort_keys_tmp_ssbo, self.sort_values_tmp_ssbo,
+                             self.particleCount, 3 * axis_bits)
+
+        gl.glUseProgram(self.COMPUTE_REORDER_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.sorted_particles_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 9, self.reordered_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 13, self.sort_values_ssbo)
+        self.COMPUTE_REORDER_SHADER.dispatch(self.dispatchCount_CP, 1, 1)
+
+        for binding in (0, 5, 8, 9, 12, 13):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+
+        # the gathered copy becomes the particle buffer, the old one is scratch for the next sort
+        self.ssbo, self.sorted_particles_ssbo = self.sorted_particles_ssbo, self.ssbo
+        self.particle_id_ssbo, self.reordered_id_ssbo = self.reordered_id_ssbo, self.particle_id_ssbo
+
+    def search_span(self):
+        """ Cells searched on each side of a particle's own cell, as the kernels compute it. """
+        if self.cellSize > 0.0001:
+            return int(np.ceil(np.float32(self.detectionRadius) / np.float32(self.cellSize)))
+        return 1 if self.detectionRadius > 0.0001 else 0
+
+    def tiled_physics(self):
+        """ Whether the tiled kernel runs this step: it reads the counting sort arrays, and its halo has to fit
+            the shared arrays and the grid without wrapping onto itself, and a block holds one universe's cells
+            only in a single world. Otherwise the direct kernel runs. """
+        span = self.search_span()
+        return (self.physicsKernel == "tiled" and self.partitionMode == "counting_sort" and not self.universes
+                and span <= self.MAX_TILED_SPAN and self.TILE_BLOCK + 2 * span <= min(self.gridDims))
+
     def execute_particle_physics(self):
+        self.update_force_matrix()
+        self.upload_sim_params()
+        counting = self.profiler.gpuTimers
+        if counting:
+            self.clear_buffer(self.interaction_count_ssbo, 0)
+        if self.tiled_physics():
+            self.execute_tiled_physics()
+        else:
+            self.execute_direct_physics()
+        self.swap_particle_buffers()
+        if counting:
+            gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+            self.profiler.sample_counter("interactions", self.interaction_count_ssbo)
+
+    def execute_tiled_physics(self):
+        # one workgroup per block of cells, the shader reads its block from gl_WorkGroupID
+        blocks = [(d + self.TILE_BLOCK - 1) // self.TILE_BLOCK for d in self.gridDims]
+        gl.glUseProgram(self.COMPUTE_TILED_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 3, self.cell_start_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.sorted_particles_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 6, self.sorted_index_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 7, self.force_matrix_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 17, self.interaction_count_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 18, self.previous_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 21, self.universe_ssbo)
+        self.COMPUTE_TILED_SHADER.dispatch(*blocks)
+        for binding in (3, 5, 6, 7, 17, 18, 21):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+
+    def execute_direct_physics(self):
         gl.glUseProgram(self.COMPUTE_SHADER.program)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "gridSize"), self.gridSize)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "cellSize"), self.cellSize)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "deltaTime"), self.deltaTime)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "stepSize"), self.stepSize)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "closeRepellentForce"), self.closeRepellentForce)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "forceStrengthFactor"), self.forceStrengthFactor)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "PARTICLE_RADIUS"), self.particleRadius)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "DETECTION_RADIUS"), self.detectionRadius)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "TOO_CLOSE_RADIUS"), self.tooCloseRadius)
-        gl.glUniform1f(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "seed"), self.randomSeed)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "MAX_PARTICLE_INTERACTIONS"), self.maxInteractions)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "PARTICLE_COUNT"), self.particleCount)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "ACTIVE_TYPES"), self.numTypes)
-        gl.glUniform1i(gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "useManualForceMatrix"), int(self.useManualForceMatrix))
-        gl.glUniformMatrix4fv(
-            gl.glGetUniformLocation(self.COMPUTE_SHADER.program, "manualForceMatrix"),
-            1, gl.GL_FALSE, glm.value_ptr(self.manualForceMatrix)
-        )
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.ssbo)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, self.grid_head_ssbo)
         gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, self.particle_links_ssbo)
-        self.COMPUTE_SHADER.dispatch(self.dispatchCount_CS, 1, 1)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 1, 0)
-        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 2, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 3, self.cell_start_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.sorted_particles_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 6, self.sorted_index_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 7, self.force_matrix_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 17, self.interaction_count_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 18, self.previous_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 20, self.hash_keys_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 21, self.universe_ssbo)
+        self.dispatch_particle_pass(self.COMPUTE_SHADER, physics=True)
+        for binding in (0, 1, 2, 3, 5, 6, 7, 8, 17, 18, 20, 21):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
         gl.glUseProgram(0)
-        
-    def simulate_particles(self):
+
+    def swap_particle_buffers(self):
+        # the buffer just written is the last completed state, the one just read becomes previous
+        self.ssbo, self.previous_ssbo = self.previous_ssbo, self.ssbo
+
+    def simulate_step(self):
+        self.scheduler.step()
+        self.update_force_matrix()
+        self.refresh_grid()
+        self.backend.step(self.sim_param_values(), self.force_matrix)
+        if self.backend is not self.gpu_backend:
+            self.swap_particle_buffers()
+            self.upload_particles(self.backend.read())
+        if self.autoGrid and self.scheduler.due(self.gridRefreshInterval):
+            self.request_grid_bounds()
+        if self.gpu_population():
+            # particleCount trails the GPU by the fence, nothing on the step path waits for it
+            self.poll_population_count()
+            self.request_population_count()
+        self.profiler.count("particle_steps", self.particleCount)
+
+    def start_replay(self, replay):
+        """ Shows the recorded frames instead of simulating, the draw pass reads them like simulated ones. """
+        self.replay = replay
+        self.replayShown = None
+        for name in ("gridSize", "numTypes"):
+            if name in replay.metadata:
+                setattr(self, name, replay.metadata[name])
+        self.update_gridCellCount()
+
+    def stop_replay(self):
+        """ The simulation carries on from the frame on screen. """
+        self.replay.close()
+        self.replay = None
+        self.replayShown = None
+        self.set_particles(self.gpu_backend.read())
+
+    def show_replay(self, frameTime):
+        replay = self.replay
+        replay.advance(frameTime)
+        previous, current = replay.pair()
+        if (previous, current) == self.replayShown:
+            return
+        frame = replay.frame(current)
+        if len(frame[0]) != self.particleCount:
+            self.set_particles(np.zeros((len(frame[0]), self.floatsPerParticle), dtype=np.float32))
+            self.replayShown = None
+        if self.replayShown is not None and self.replayShown[1] == previous:
+            # playing forward, the frame on screen becomes the one blended from
+            self.swap_particle_buffers()
+            self.upload_replay_frame(*frame)
+        else:
+            # a jump, or a particle count change between the two frames, has nothing to blend from
+            blend_from = replay.frame(previous)
+            self.upload_replay_frame(*(blend_from if len(blend_from[0]) == len(frame[0]) else frame))
+            self.swap_particle_buffers()
+            self.upload_replay_frame(*frame)
+        self.replayShown = (previous, current)
+
+    def upload_replay_frame(self, particle_data, gather):
+        if gather is None:
+            self.upload_particles(particle_data)
+            return
+        # rows go up in recorded order and the reorder kernel gathers them into spawn order, reorderedIds is scratch
+        gl.glNamedBufferSubData(self.sorted_particles_ssbo, 0, self.buffer_size, self.layout.pack(particle_data))
+        gl.glNamedBufferSubData(self.sort_values_ssbo, 0, gather.nbytes, gather)
+        self.upload_sim_params()
+        gl.glUseProgram(self.COMPUTE_REORDER_SHADER.program)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, self.sorted_particles_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 5, self.ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 9, self.reordered_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 13, self.sort_values_ssbo)
+        self.COMPUTE_REORDER_SHADER.dispatch(self.dispatchCount_CP, 1, 1)
+        for binding in (0, 5, 8, 9, 13):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+        gl.glMemoryBarrier(gl.GL_SHADER_STORAGE_BARRIER_BIT)
+
+    def simulate_particles(self, frameTime):
         self.frameCount += 1
-        if self.runSimulation:
-            if self.frameCount % 5 == 0:
-                self.reset_partition_buffers()
-                self.execute_partitioning()
-            if self.frameCount % 3 == 0:
-                self.execute_particle_physics()
+        if self.replay is not None:
+            with self.profiler.cpu_scope("replay"):
+                self.show_replay(frameTime)
+            return
+        if not self.runSimulation:
+            self.scheduler.accumulator = 0.0
+            return
+        with self.profiler.cpu_scope("simulate_particles"):
+            steps = self.scheduler.advance(frameTime)
+            self.deltaTime = self.scheduler.fixedDeltaTime
+            for _ in range(steps):
+                self.simulate_step()
+
+    def interpolation_alpha(self):
+        if self.replay is not None:
+            return self.replay.alpha
+        return self.scheduler.alpha if self.runSimulation else 1.0
 
     def update_grid_size(self):
-        self.update_gridCellCount()
+        # the bounds are those of the new spawn
+        self.gridBounds = None
+        self.update_gridCellCount(fresh=True)
         self.init_particles()
         self.init_particle_ssbo()
         self.init_partition_buffers()
+        if self.gpu_population():
+            self.init_population_state()
 
     def set_particle_count(self):
+        self.init_particles()
+        self.set_particles(self.particle_data)
+
+    def resize_particles(self, count):
+        """ Changes particleCount without touching the particles that stay: new ones are spawned into spare
+            capacity, removed ones are cut off the end of the active range. O(delta) on the GPU unless the
+            capacity has to double; it only shrinks once a quarter of it is left in use. """
+        count = max(int(count), 1)
+        old = self.particleCount
+        if count == old:
+            return
+        if self.gpu_population():
+            prRed("[Particles] The emitters and kill zones own the particle count")
+            return
+        if self.universes:
+            # the universes own fixed id ranges, they are respawned at the new size
+            self.set_universes(self.universes, -(-count // len(self.universes)))
+            return
+        if self.backend is not self.gpu_backend:
+            # the CPU backends own the state and reload it whole anyway
+            particle_data = self.backend.read()
+            self.set_particles(particle_data[:count] if count < old else np.concatenate([particle_data, self.spawn_extra(count - old)]))
+            return
+
+        if count < old:
+            self.renumber_ids(old, count)
+        if count > self.particleCapacity:
+            self.reallocate_particle_buffers(max(count, 2 * self.particleCapacity), old)
+        elif count < self.particleCapacity // 4:
+            self.reallocate_particle_buffers(2 * count, count)
+        if count > old:
+            self.append_particles(old, count)
+
+        self.particleCount = count
+        self.buffer_size = count * self.layout.stride
+        self.dispatchCount_CS = (count + self.LOCAL_X_CS - 1) // self.LOCAL_X_CS
+        self.dispatchCount_CP = (count + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP
+        # the lists still link removed slots, or miss the new ones
+        self.partitionDirty = True
+
+    def spawn_extra(self, count):
+        half = self.spawnGridSize * 0.5
+        return spawn_particles(count, (half, half, half), self.numTypes)
+
+    def append_particles(self, old, count):
+        particle_data = self.layout.pack(self.spawn_extra(count - old))
+        row = self.layout.stride
+        # uploaded once, the blend-from buffer gets a GPU copy so new particles do not fly in from slot garbage
+        gl.glNamedBufferSubData(self.ssbo, old * row, particle_data.nbytes, particle_data)
+        gl.glCopyNamedBufferSubData(self.ssbo, self.previous_ssbo, old * row, old * row, particle_data.nbytes)
+        particle_ids = np.arange(old, count, dtype=np.uint32)
+        gl.glNamedBufferSubData(self.particle_id_ssbo, old * particle_ids.itemsize, particle_ids.nbytes, particle_ids)
+
+    def renumber_ids(self, old, count):
+        self.clear_buffer(self.renumber_counter_ssbo, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, self.particle_id_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 12, self.sort_keys_ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 14, self.renumber_counter_ssbo)
+        self.COMPUTE_RENUMBER_SHADER.set("OLD_COUNT", old)
+        self.COMPUTE_RENUMBER_SHADER.set("NEW_COUNT", count)
+        self.COMPUTE_RENUMBER_SHADER.set("RENUMBER_PHASE", 0)
+        self.COMPUTE_RENUMBER_SHADER.dispatch((old - count + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP, 1, 1)
+        self.COMPUTE_RENUMBER_SHADER.set("RENUMBER_PHASE", 1)
+        self.COMPUTE_RENUMBER_SHADER.dispatch((count + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP, 1, 1)
+        for binding in (8, 12, 14):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
+
+    def reallocate_particle_buffers(self, capacity, keep):
+        """ New capacity for every per-particle buffer, the first keep particles are copied over on the GPU. """
+        row = self.layout.stride
+        uint_size = np.dtype(np.uint32).itemsize
+        for name, size in (("ssbo", row), ("previous_ssbo", row), ("particle_id_ssbo", uint_size)):
+            old_ssbo = getattr(self, name)
+            ssbo = self.create_ssbo(capacity * size)
+            gl.glCopyNamedBufferSubData(old_ssbo, ssbo, 0, 0, keep * size)
+            gl.glDeleteBuffers(1, [old_ssbo])
+            setattr(self, name, ssbo)
+        self.particleCapacity = capacity
+        # everything else is rebuilt from the particles every step
+        self.init_partition_buffers()
+
+    def set_particles(self, particle_data):
+        """ Replaces the whole particle state, particleCount follows the array. """
+        if self.universes and len(particle_data) != self.universeParticles * len(self.universes):
+            prRed("[Particles] Particle count no longer matches the batched universes, back to a single world")
+            self.universes = None
+        self.particleCount = len(particle_data)
         self.dispatchCount_CS = (self.particleCount + self.LOCAL_X_CS - 1) // self.LOCAL_X_CS
         self.dispatchCount_CP = (self.particleCount + self.LOCAL_X_CP - 1) // self.LOCAL_X_CP
-        self.init_particles()
+        self.particle_data = particle_data
+        if self.particleCount:
+            positions = np.asarray(particle_data[:, 0:3], dtype=np.float64)
+            self.gridBounds = np.stack([positions.min(axis=0), positions.max(axis=0)])
+        self.update_gridCellCount(fresh=True)
         self.init_particle_ssbo()
         self.init_partition_buffers()
-
+        if self.gpu_population():
+            self.init_population_state()
@@ -0,0 +1,253 @@
+""" CONTAINS
+        Profiler Class, named timing scopes around compute dispatches and render passes """
+
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+class Profiler:
+    """ Passes stay wrapped in scopes permanently, a disabled profiler only pays for the with-statement.
+
+        blocking:  glFinish around each scope, exact wall time per pass (benchmarks)
+        gpuTimers: GL_TIME_ELAPSED queries from a ring, read back frames later without stalling (live GUI)
+        tracing:   CPU scopes plus GPU passes placed by timestamp queries, kept for the last
+                   traceCapacity frames and written as a Chrome / Perfetto trace """
+    CPU_TRACK = 1
+    GPU_TRACK = 2
+
+    def __init__(self, queryCapacity=256, counterCapacity=8, historyLength=240, traceCapacity=300):
+        self.blocking = False
+        self.gpuTimers = False
+        self.tracing = False
+        self.samples = {}
+
+        self.queryCapacity = queryCapacity
+        self.counterCapacity = counterCapacity
+        self.historyLength = historyLength
+        self.queries = None
+        self.stampQueries = None
+        self.queryHead = 0
+        self.pendingQueries = deque()
+        self.queryActive = False
+        self.droppedQueries = 0
+        self.counterBuffers = None
+        self.counterHead = 0
+        self.pendingCounters = deque()
+        self.frame = 0
+        # per scope: GPU milliseconds summed over each frame the scope ran in
+        self.history = {}
+        self.partial = {}
+        # per counter: (wall time, value) over the rate window
+        self.counters = {}
+        self.rateWindow = 1.0
+        # (frame, events) per frame, the oldest frame falls out once traceCapacity is reached
+        self.traceCapacity = traceCapacity
+        self.traceFrames = deque(maxlen=traceCapacity)
+        self.traceEpoch = 0.0
+        self.gpuClockOffset = 0.0
+
+    @contextmanager
+    def scope(self, name):
+        if self.blocking:
+            # drains the GPU on both sides so the wall time is the pass alone
+            gl.glFinish()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                gl.glFinish()
+                self.samples.setdefault(name, []).append((time.perf_counter() - start) * 1000.0)
+            return
+        query = self.begin_query() if self.gpuTimers or self.tracing else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if query is not None:
+                gl.glEndQuery(gl.GL_TIME_ELAPSED)
+                self.queryActive = False
+                self.pendingQueries.append(query + (name, self.frame))
+            if self.tracing:
+                self.trace_event(name, "pass", start, time.perf_counter())
+
+    @contextmanager
+    def cpu_scope(self, name):
+        """ CPU-only scope, costs nothing unless a trace is recording. """
+        if not self.tracing:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.trace_event(name, "cpu", start, time.perf_counter())
+
+    def begin_query(self):
+        # TIME_ELAPSED queries cannot nest, an inner scope just goes untimed
+        if self.queryActive:
+            return None
+        if self.queries is None:
+            self.queries = [int(q) for q in gl.glGenQueries(self.queryCapacity)]
+            self.stampQueries = [int(q) for q in gl.glGenQueries(self.queryCapacity)]
+        # the ring slot is still in flight when the GPU is a whole ring behind, skip rather than wait
+        if len(self.pendingQueries) >= self.queryCapacity:
+            self.droppedQueries += 1
+            return None
+        query = self.queries[self.queryHead]
+        stamp = None
+        if self.tracing:
+            # elapsed time alone cannot place the pass on the timeline
+            stamp = self.stampQueries[self.queryHead]
+            gl.glQueryCounter(stamp, gl.GL_TIMESTAMP)
+        self.queryHead = (self.queryHead + 1) % self.queryCapacity
+        gl.glBeginQuery(gl.GL_TIME_ELAPSED, query)
+        self.queryActive = True
+        return (query, stamp)
+
+    def sample_counter(self, name, buffer, offset=0):
+        """ Copies a uint out of buffer into the counter ring, the value shows up once the GPU got there. """
+        if not self.gpuTimers:
+            return
+        if self.counterBuffers is None:
+            self.counterBuffers = list(gl.glGenBuffers(self.counterCapacity))
+            for counter in self.counterBuffers:
+                gl.glBindBuffer(gl.GL_COPY_WRITE_BUFFER, counter)
+                gl.glBufferData(gl.GL_COPY_WRITE_BUFFER, 4, None, gl.GL_STREAM_READ)
+            gl.glBindBuffer(gl.GL_COPY_WRITE_BUFFER, 0)
+        if len(self.pendingCounters) >= self.counterCapacity:
+            return
+        counter = self.counterBuffers[self.counterHead]
+        self.counterHead = (self.counterHead + 1) % self.counterCapacity
+        gl.glCopyNamedBufferSubData(buffer, counter, offset, 0, 4)
+        fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.pendingCounters.append((counter, fence, name, time.perf_counter()))
+
+    def count(self, name, value, stamp=None):
+        stamp = time.perf_counter() if stamp is None else stamp
+        samples = self.counters.setdefault(name, deque())
+        samples.append((stamp, value))
+        if self.tracing:
+            self.add_trace_event(self.frame, {"name": name, "ph": "C", "pid": 1, "ts": self.trace_time(stamp),
+                                              "args": {name: value}})
+
+    def new_frame(self):
+        """ Collects every result the GPU has finished, never waits for the rest. """
+        self.collect()
+        self.frame += 1
+        if self.tracing:
+            self.traceFrames.append((self.frame, []))
+
+    def collect(self):
+        available = np.zeros(1, dtype=np.int32)
+        # the ui64v getter fails in PyOpenGL, the signed one takes an int64 array fine
+        elapsed = np.zeros(1, dtype=np.int64)
+        started = np.zeros(1, dtype=np.int64)
+        while self.pendingQueries:
+            query, stamp, name, frame = self.pendingQueries[0]
+            gl.glGetQueryObjectiv(query, gl.GL_QUERY_RESULT_AVAILABLE, available)
+            if not available[0]:
+                break
+            self.pendingQueries.popleft()
+            gl.glGetQueryObjecti64v(query, gl.GL_QUERY_RESULT, elapsed)
+            self.add_timing(name, frame, float(elapsed[0]) / 1e6)
+            if stamp is not None and self.tracing:
+                gl.glGetQueryObjecti64v(stamp, gl.GL_QUERY_RESULT, started)
+                self.add_trace_event(frame, {"name": name, "cat": "gpu", "ph": "X", "pid": 1, "tid": self.GPU_TRACK,
+                                             "ts": float(started[0]) / 1e3 + self.gpuClockOffset,
+                                             "dur": float(elapsed[0]) / 1e3})
+
+        value = np.zeros(1, dtype=np.uint32)
+        while self.pendingCounters:
+            counter, fence, name, stamp = self.pendingCounters[0]
+            if gl.glClientWaitSync(fence, 0, 0) not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+                break
+            self.pendingCounters.popleft()
+            gl.glDeleteSync(fence)
+            gl.glGetNamedBufferSubData(counter, 0, 4, value)
+            self.count(name, int(value[0]), stamp)
+
+    def add_timing(self, name, frame, ms):
+        # results arrive in submission order, so a new frame number closes the previous frame's total
+        partial = self.partial.get(name)
+        if partial is not None and partial[0] == frame:
+            partial[1] += ms
+            return
+        if partial is not None:
+            self.history.setdefault(name, deque(maxlen=self.historyLength)).append(partial[1])
+        self.partial[name] = [frame, ms]
+
+    def rate(self, name):
+        """ Counter value per second over the last rateWindow seconds. """
+        samples = self.counters.get(name)
+        if not samples:
+            return 0.0
+        now = time.perf_counter()
+        while samples and now - samples[0][0] > self.rateWindow:
+            samples.popleft()
+        if len(samples) < 2:
+            return 0.0
+        span = max(samples[-1][0] - samples[0][0], 1e-6)
+        # the oldest sample only marks where the window starts
+        return sum(value for _, value in list(samples)[1:]) / span
+
+    def reset(self):
+        self.samples = {}
+
+    def start_trace(self, frames=None):
+        """ Needs a current GL context, the GPU clock is lined up with perf_counter here. """
+        if frames is not None:
+            self.traceCapacity = frames
+        self.traceFrames = deque([(self.frame, [])], maxlen=self.traceCapacity)
+        self.traceEpoch = time.perf_counter()
+        gpu_now = np.zeros(1, dtype=np.int64)
+        gl.glGetInteger64v(gl.GL_TIMESTAMP, gpu_now)
+        self.gpuClockOffset = self.trace_time(time.perf_counter()) - float(gpu_now[0]) / 1e3
+        self.tracing = True
+
+    def stop_trace(self, path):
+        """ Waits for the GPU once so the last frames' passes make it in, then writes the trace. """
+        gl.glFinish()
+        self.collect()
+        self.tracing = False
+        events = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "Particle Life"}},
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": self.CPU_TRACK, "args": {"name": "CPU"}},
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": self.GPU_TRACK, "args": {"name": "GPU"}},
+        ]
+        for _, frame_events in self.traceFrames:
+            events.extend(frame_events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        self.traceFrames = deque(maxlen=self.traceCapacity)
+        return path
+
+    def trace_time(self, stamp):
+        return (stamp - self.traceEpoch) * 1e6
+
+    def trace_event(self, name, category, start, end):
+        self.add_trace_event(self.frame, {"name": name, "cat": category, "ph": "X", "pid": 1, "tid": self.CPU_TRACK,
+                                          "ts": self.trace_time(start), "dur": (end - start) * 1e6})
+
+    def add_trace_event(self, frame, event):
+        # GPU results come in a few frames late, they belong to the frame that submitted them
+        for number, events in reversed(self.traceFrames):
+            if number == frame:
+                events.append(event)
+                return
+            if number < frame:
+                break
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        """ {scope: {"p50": ms, ..., "mean": ms, "count": n}} over everything recorded since reset. """
+        summary = {}
+        for name, values in self.samples.items():
+            values = np.asarray(values)
+            summary[name] = {f"p{q}": float(np.percentile(values, q)) for q in quantiles}
+            summary[name]["mean"] = float(values.mean())
+            summary[name]["count"] = len(values)
+        return summary
@@ -0,0 +1,114 @@
+""" CONTAINS
+        AsyncReadback Class, particle state copied into a ring of persistently mapped staging buffers """
+
+import ctypes
+from collections import deque
+
+import numpy as np
+import OpenGL.GL as gl
+
+from layoutC import active_layout
+
+
+class Readback:
+    """ One completed copy. particles and ids are views straight into mapped memory, in GPU slot order,
+        and stay valid until the next AsyncReadback.poll() hands the slot back to the ring. With the
+        compact layout particles is unpacked into a fresh (N, 8) array instead. """
+
+    def __init__(self, tag, particles, ids):
+        self.tag = tag
+        self.particles = particles
+        self.ids = ids
+
+    def ordered(self):
+        """ Copy of the state in spawn order, what Particles.read_particles returns. """
+        ordered = np.empty_like(self.particles)
+        ordered[self.ids] = self.particles
+        return ordered
+
+
+class AsyncReadback:
+    """ request() queues a GPU-side copy and a fence, poll() returns whatever finished since, usually one or
+        two frames later. Nothing ever waits on the GPU, a request that finds every slot busy is dropped.
+        Slots are sized one at a time when a free one turns out too small, copies in flight keep theirs. """
+    MAP_FLAGS = gl.GL_MAP_READ_BIT | gl.GL_MAP_PERSISTENT_BIT | gl.GL_MAP_COHERENT_BIT
+
+    def __init__(self, capacity=3):
+        self.capacity = capacity
+        self.slots = [{"index": index, "buffer": None, "size": 0, "memory": None} for index in range(capacity)]
+        self.free = deque(range(capacity))
+        self.pending = deque()
+        self.held = []
+        self.dropped = 0
+
+    def allocate(self, slot, size):
+        """ Replaces a free slot's buffer with one of at least size bytes, doubling so a slowly growing
+            count does not reallocate every frame. """
+        if slot["buffer"] is not None:
+            gl.glDeleteBuffers(1, [slot["buffer"]])
+        size = max(size, 2 * slot["size"])
+        # immutable storage, glBufferStorage has no named variant without glCreateBuffers
+        buffer = int(gl.glGenBuffers(1))
+        gl.glBindBuffer(gl.GL_COPY_WRITE_BUFFER, buffer)
+        gl.glBufferStorage(gl.GL_COPY_WRITE_BUFFER, size, None, self.MAP_FLAGS)
+        gl.glBindBuffer(gl.GL_COPY_WRITE_BUFFER, 0)
+        address = gl.glMapNamedBufferRange(buffer, 0, size, self.MAP_FLAGS)
+        slot.update(buffer=buffer, size=size, memory=np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(address)))
+
+    def request(self, particle_ssbo, id_ssbo, count, tag=None):
+        """ Queues a copy of count particles and their ids, False when the ring is full. """
+        stride = active_layout().stride
+        size = count * (stride + 4)
+        if not self.free:
+            self.dropped += 1
+            return False
+        index = self.free.popleft()
+        if size > self.slots[index]["size"]:
+            self.allocate(self.slots[index], size)
+        buffer = self.slots[index]["buffer"]
+        # the compute shader wrote the SSBO, the copy has to see it
+        gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+        gl.glCopyNamedBufferSubData(particle_ssbo, buffer, 0, 0, count * stride)
+        gl.glCopyNamedBufferSubData(id_ssbo, buffer, 0, count * stride, count * 4)
+        fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        # without a flush the fence might sit in the command queue until something else flushes it
+        gl.glFlush()
+        self.pending.append((index, fence, count, tag))
+        return True
+
+    def poll(self):
+        """ Completed readbacks in request order, the ones from the previous poll are released first. """
+        self.free.extend(self.held)
+        self.held = []
+
+        completed = []
+        while self.pending:
+            index, fence, count, tag = self.pending[0]
+            if gl.glClientWaitSync(fence, 0, 0) not in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+                break
+            self.pending.popleft()
+            gl.glDeleteSync(fence)
+            memory = self.slots[index]["memory"]
+            layout = active_layout()
+            particles = layout.unpack(memory, count)
+            ids = memory[count * layout.stride:count * (layout.stride + 4)].view(np.uint32)
+            completed.append(Readback(tag, particles, ids))
+            self.held.append(index)
+        return completed
+
+    def drain(self):
+        """ Waits for everything still in flight, for the end of a run. """
+        if self.pending:
+            gl.glClientWaitSync(self.pending[-1][1], gl.GL_SYNC_FLUSH_COMMANDS_BIT, 10_000_000_000)
+        return self.poll()
+
+    def close(self):
+        for _, fence, _, _ in self.pending:
+            gl.glDeleteSync(fence)
+        for slot in self.slots:
+            if slot["buffer"] is not None:
+                gl.glDeleteBuffers(1, [slot["buffer"]])
+            slot.update(buffer=None, size=0, memory=None)
+        self.pending.clear()
+        self.held = []
+        self.free = deque(range(self.capacity))
@@ -0,0 +1,134 @@
+""" CONTAINS
+        TrajectoryRecorder Class, every Nth particle state streamed to an Arrow IPC or Parquet file """
+
+import json
+import queue
+import threading
+
+import numpy as np
+import pyarrow as pa
+
+from readbackC import AsyncReadback
+from checkpointC import capture_state
+
+# column -> particle_data row index, frame and id come from the readback itself
+COLUMNS = {"frame": None, "id": None, "x": 0, "y": 1, "z": 2, "vx": 4, "vy": 5, "vz": 6, "type": 7, "stress": 3}
+FLOAT_COLUMNS = ("x", "y", "z", "vx", "vy", "vz", "stress")
+
+
+def recording_schema(columns, float16, metadata):
+    types = {"frame": pa.uint32(), "id": pa.uint32(), "type": pa.uint8()}
+    floating = pa.float16() if float16 else pa.float32()
+    return pa.schema([(name, types.get(name, floating)) for name in columns],
+                     metadata={"particles": json.dumps(metadata)})
+
+
+class TrajectoryRecorder:
+    """ capture() once a frame: the state after every Nth simulation step is copied off the GPU without
+        stalling, turned into one record batch on a worker thread and appended to path (.arrow / .feather IPC
+        file, or .parquet), the frame column holding the step. A full ring or queue drops the frame instead of
+        stalling the caller, unless block is set: offline runs wait for the writer instead, so every Nth step
+        ends up in the file. """
+
+    def __init__(self, particles, path, every=1, columns=None, float16=False, queueSize=8, block=False):
+        columns = list(COLUMNS) if columns is None else list(columns)
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"[Recorder] Unknown columns: {', '.join(sorted(unknown))}")
+        self.particles = particles
+        self.path = path
+        self.every = max(int(every), 1)
+        self.columns = columns
+        self.float16 = float16
+        self.block = block
+        # the step the last capture saw, frames that ran no step record nothing
+        self.lastStep = particles.scheduler.stepCount
+        self.schema = recording_schema(columns, float16, capture_state(particles))
+        self.readback = AsyncReadback()
+        self.jobs = queue.Queue(maxsize=queueSize)
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.write_loop, name="trajectory-recorder", daemon=True)
+        self.thread.start()
+
+    def capture(self, step):
+        """ step is the scheduler's stepCount. A frame that ran no step records nothing, several steps in
+            one frame record the latest once they crossed a multiple of every. """
+        particles = self.particles
+        due = step // self.every != self.lastStep // self.every
+        self.lastStep = step
+        if due:
+            if particles.gpu_population():
+                # particleCount trails the GPU population, a frame has to hold exactly the live particles
+                particles.sync_population_count()
+            while not self.readback.request(particles.ssbo, particles.particle_id_ssbo, particles.particleCount, step):
+                if not self.block:
+                    self.dropped += 1
+                    break
+                # every slot still in flight, waiting for them frees the ring
+                for readback in self.readback.drain():
+                    self.enqueue(readback)
+        for readback in self.readback.poll():
+            self.enqueue(readback)
+
+    def enqueue(self, readback):
+        try:
+            # the mapped view is only good until the next poll, so the worker gets a copy
+            self.jobs.put((readback.tag, readback.particles.copy(), readback.ids.copy()), block=self.block)
+        except queue.Full:
+            self.dropped += 1
+
+    def record_batch(self, frame, particle_data, ids):
+        arrays = []
+        for name in self.columns:
+            if name == "frame":
+                column = np.full(len(ids), frame, dtype=np.uint32)
+            elif name == "id":
+                column = ids
+            elif name == "type":
+                column = np.rint(particle_data[:, COLUMNS[name]]).astype(np.uint8)
+            else:
+                column = particle_data[:, COLUMNS[name]].astype(np.float16 if self.float16 else np.float32)
+            arrays.append(pa.array(column))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def open_writer(self):
+        if self.path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.path, self.schema)
+        return pa.ipc.new_file(self.path, self.schema)
+
+    def write_loop(self):
+        writer = None
+        try:
+            writer = self.open_writer()
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                # a row group / IPC batch per frame, readers can seek to a frame without scanning
+                writer.write_batch(self.record_batch(*job))
+                self.recorded += 1
+        except (OSError, pa.ArrowException) as error:
+            self.error = error
+            print(f"[Recorder] writing {self.path} failed: {error}")
+            # keep draining so capture() never finds the queue stuck full
+            while self.jobs.get() is not None:
+                pass
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def close(self):
+        """ Waits for the frames still in flight and finishes the file. """
+        for readback in self.readback.drain():
+            try:
+                self.jobs.put((readback.tag, readback.particles.copy(), readback.ids.copy()), timeout=60.0)
+            except queue.Full:
+                self.dropped += 1
+        self.jobs.put(None)
+        self.thread.join()
+        self.readback.close()
+        print(f"[Recorder] {self.recorded} frames -> {self.path}" + (f", {self.dropped} dropped" if self.dropped else ""))
+        return self.path
@@ -1,9 +1,12 @@
 from pprint import pprint
+import ctypes
 import OpenGL.GL as gl
 import glm
 from particlesC import Particles
 
 class Render:
+    LIGHT_POS = glm.vec3(10., 10., 10.)
+
     def __init__(self, SHADERS, FRAMEBUFFERS, TEXTURES, MATERIALS, MODELS, WORLD_OBJECTS, SETTINGS, camera, particles: Particles):
         self.SHADERS = SHADERS
         self.FRAMEBUFFERS = FRAMEBUFFERS
@@ -40,11 +43,18 @@ class Render:
                 "TEX": [],
                 "DRAW": lambda ctx: (
                     gl.glBindVertexArray(ctx.dummy_vao),
-                    gl.glUniform1f(gl.glGetUniformLocation(ctx.SHADERS["draw_particles"].program, "PARTICLE_RADIUS"), self.PARTICLES.particleRadius),
+                    ctx.SHADERS["draw_particles"].set("PARTICLE_RADIUS", ctx.PARTICLES.particleRadius),
+                    ctx.SHADERS["draw_particles"].set("INTERPOLATION_ALPHA", ctx.PARTICLES.interpolation_alpha()),
+                    ctx.SHADERS["draw_particles"].set("gridSize", ctx.PARTICLES.gridSize),
+                    ctx.set_universe_uniforms(ctx.SHADERS["draw_particles"]),
                     gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, ctx.PARTICLES.ssbo),
+                    gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, ctx.PARTICLES.particle_id_ssbo),
+                    gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 16, ctx.PARTICLES.previous_ssbo),
                     gl.glEnable(gl.GL_PROGRAM_POINT_SIZE),
-                    gl.glDrawArrays(gl.GL_POINTS, 0, ctx.PARTICLES.particleCount),
+                    ctx.draw_particle_points(),
                     gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, 0),
+                    gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 8, 0),
+                    gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 16, 0),
                     gl.glDisable(gl.GL_PROGRAM_POINT_SIZE),
                 )
             },
@@ -64,30 +74,47 @@ class Render:
         }
 
     def scene(self):
-
-        self.run_pass("draw_grid")
-            
-        self.run_pass("draw_particles")
-        self.resolve_hdr_to_display()
-        self.run_pass("display")
+        with self.PARTICLES.profiler.cpu_scope("Render.scene"):
+            self.run_pass("draw_grid")
+                
+            self.run_pass("draw_particles")
+            with self.PARTICLES.profiler.scope("resolve_hdr_to_display"):
+                self.resolve_hdr_to_display()
+            self.run_pass("display")
 
     def set_common_uniforms(self, shader):
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "viewPos"), 1, glm.value_ptr(self.camera.cameraPos))
-        gl.glUniformMatrix4fv(gl.glGetUniformLocation(shader.program, "view"), 1, gl.GL_FALSE, glm.value_ptr(self.camera.view))
-        gl.glUniformMatrix4fv(gl.glGetUniformLocation(shader.program, "projection"), 1, gl.GL_FALSE, glm.value_ptr(self.camera.projectionMatrix))
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "lightPos"), 1, glm.value_ptr(glm.vec3(10., 10., 10)))
-        width, height = self.FRAMEBUFFERS["hdr"].width, self.FRAMEBUFFERS["hdr"].height
-        loc = gl.glGetUniformLocation(shader.program, "uViewport")
-        if loc != -1:
-            gl.glUniform2f(loc, width, height)
-        gl.glUniform1i(gl.glGetUniformLocation(shader.program, "ACTIVE_TYPES"), self.PARTICLES.numTypes)
-        gl.glUniform1i(gl.glGetUniformLocation(shader.program, "PARTICLE_COUNT"), self.PARTICLES.particleCount)
+        shader.set("viewPos", self.camera.cameraPos)
+        shader.set("view", self.camera.view)
+        shader.set("projection", self.camera.projectionMatrix)
+        shader.set("lightPos", self.LIGHT_POS)
+        shader.set("uViewport", (self.FRAMEBUFFERS["hdr"].width, self.FRAMEBUFFERS["hdr"].height))
+        # colours spread over the most types any batched universe uses
+        shader.set("ACTIVE_TYPES", max(rules["numTypes"] for rules in self.PARTICLES.universe_rules()))
+        shader.set("PARTICLE_COUNT", self.PARTICLES.particleCount)
+
+    def set_universe_uniforms(self, shader):
+        # batched universes are drawn side by side, each in its own tile
+        columns, spacing = self.PARTICLES.universe_tiles()
+        shader.set("UNIVERSE_COUNT", self.PARTICLES.universe_count())
+        shader.set("UNIVERSE_PARTICLES", max(self.PARTICLES.universeParticles, 1))
+        shader.set("UNIVERSE_COLUMNS", columns)
+        shader.set("UNIVERSE_SPACING", spacing)
+
+    def draw_particle_points(self):
+        particles = self.PARTICLES
+        if not particles.gpu_population():
+            gl.glDrawArrays(gl.GL_POINTS, 0, particles.particleCount)
+            return
+        # the live count stays on the GPU, particles_population.comp wrote the draw command
+        gl.glBindBuffer(gl.GL_DRAW_INDIRECT_BUFFER, particles.population_ssbo)
+        gl.glDrawArraysIndirect(gl.GL_POINTS, ctypes.c_void_p(particles.POPULATION_DRAW_COMMAND))
+        gl.glBindBuffer(gl.GL_DRAW_INDIRECT_BUFFER, 0)
 
     def bind_material_uniforms(self, shader, material, indx):
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "material.Kambient"), 1, glm.value_ptr(material[indx].Ka))
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "material.Kdiffuse"), 1, glm.value_ptr(material[indx].Kd))
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "material.Kspecular"), 1, glm.value_ptr(material[indx].Ks))
-        gl.glUniform3fv(gl.glGetUniformLocation(shader.program, "material.Kemissive"), 1, glm.value_ptr(material[indx].Ke))
+        shader.set("material.Kambient", material[indx].Ka)
+        shader.set("material.Kdiffuse", material[indx].Kd)
+        shader.set("material.Kspecular", material[indx].Ks)
+        shader.set("material.Kemissive", material[indx].Ke)
 
     def bind_material_textures(self, shader, material, indx):
         unit = 0
@@ -95,14 +122,17 @@ class Render:
             textureObject = self.TEXTURES[texture_name]
             gl.glActiveTexture(gl.GL_TEXTURE0 + unit) # type: ignore
             gl.glBindTexture(gl.GL_TEXTURE_2D, textureObject.tid)
-            gl.glUniform1i(gl.glGetUniformLocation(shader.program, texture_name), unit)
+            shader.set(texture_name, unit)
             unit += 1
 
     def run_pass(self, name):
         if name not in self.RENDER_PASS_DEFS:
             print(f"[Render] Unknown pass: {name}")
             return
+        with self.PARTICLES.profiler.scope(name):
+            self.draw_pass(name)
 
+    def draw_pass(self, name):
         STRUCTURE = self.RENDER_PASS_DEFS[name]
         FBO = STRUCTURE["FBO"](self)
         gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, FBO)
@@ -122,8 +152,7 @@ class Render:
             for tex in STRUCTURE.get("TEX", []):
                 gl.glActiveTexture(gl.GL_TEXTURE0 + tex["unit"])
                 gl.glBindTexture(tex["target"], tex["source"](self))
-                loc = gl.glGetUniformLocation(shader.program, tex["uniform"])
-                gl.glUniform1i(loc, tex["unit"])
+                shader.set(tex["uniform"], tex["unit"])
             STRUCTURE["DRAW"](self, FBO)
             gl.glBindVertexArray(0)
         else:
@@ -0,0 +1,152 @@
+""" CONTAINS
+        TrajectoryReplay Class, recorded frames streamed back from a memory-mapped Arrow IPC file """
+
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+
+from recorderC import COLUMNS
+
+
+class TrajectoryReplay:
+    """ Playback position in recorded frames. The file is memory-mapped, so a frame costs only the columns it
+        touches; a read-ahead thread unpacks the next readAhead frames in playback direction into the
+        particle_data layout so the render loop only uploads. Frames stay in recorded slot order, the
+        upload gathers them into spawn order on the GPU. """
+
+    def __init__(self, path, readAhead=4):
+        if path.endswith(".parquet"):
+            raise ValueError("[Replay] needs an Arrow IPC recording (.arrow), Parquet has no per-frame random access")
+        self.path = path
+        self.reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        self.frameCount = self.reader.num_record_batches
+        if self.frameCount == 0:
+            raise ValueError(f"[Replay] {path} has no frames")
+        names = self.reader.schema.names
+        missing = {"x", "y", "z"} - set(names)
+        if missing:
+            raise ValueError(f"[Replay] {path} was recorded without {', '.join(sorted(missing))}")
+        metadata = self.reader.schema.metadata or {}
+        self.metadata = json.loads(metadata.get(b"particles", b"{}"))
+        self.frames = [int(self.reader.get_batch(i).column("frame")[0].as_py()) if "frame" in names else i
+                       for i in range(self.frameCount)]
+
+        # recorded frames per second of playback at speed 1, real time if the run was stepped once a frame
+        spacing = (self.frames[-1] - self.frames[0]) / (self.frameCount - 1) if self.frameCount > 1 else 1.0
+        self.baseRate = self.metadata.get("simulationRate", 20.0) / max(spacing, 1e-6)
+        self.position = 0.0
+        self.speed = 1.0
+        self.playing = True
+        self.loop = True
+
+        self.readAhead = readAhead
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = threading.Thread(target=self.read_ahead_loop, name="replay-read-ahead", daemon=True)
+        self.thread.start()
+
+    @property
+    def span(self):
+        return max(self.frameCount - 1, 0)
+
+    def pair(self):
+        """ (previous, current) frame indices around the position, the renderer blends them by alpha. """
+        if self.span == 0:
+            return 0, 0
+        previous = min(int(self.position), self.span - 1)
+        return previous, previous + 1
+
+    @property
+    def alpha(self):
+        return min(max(self.position - self.pair()[0], 0.0), 1.0) if self.span else 1.0
+
+    def seek(self, position):
+        """ Position in recorded frames, fractional positions blend between neighbours. """
+        if self.loop and self.span:
+            position %= self.span
+        self.position = min(max(float(position), 0.0), float(self.span))
+        with self.wake:
+            self.wake.notify()
+
+    def advance(self, frameTime):
+        if self.playing:
+            self.seek(self.position + self.speed * self.baseRate * frameTime)
+
+    def decode(self, index):
+        """ (particle_data in recorded slot order, gather) where gather[i] is the row of particle i,
+            None when the rows already are in spawn order. """
+        batch = self.reader.get_batch(index)
+        count = batch.num_rows
+        particle_data = np.empty((count, 8), dtype=np.float32)
+        for name, row in COLUMNS.items():
+            if row is None:
+                continue
+            if name in batch.schema.names:
+                particle_data[:, row] = batch.column(name).to_numpy(zero_copy_only=False)
+            else:
+                particle_data[:, row] = 0.0
+        if "id" not in batch.schema.names:
+            return particle_data, None
+        # consecutive frames have to line up per slot for the blend, so the SSBO gets spawn order; a uint32
+        # scatter here and a gather on the GPU is far cheaper than moving the 32 byte rows on the CPU
+        ids = batch.column("id").to_numpy()
+        if np.array_equal(ids, np.arange(count, dtype=ids.dtype)):
+            return particle_data, None
+        gather = np.empty(count, dtype=np.uint32)
+        gather[ids] = np.arange(count, dtype=np.uint32)
+        return particle_data, gather
+
+    def frame(self, index):
+        """ decode() of frame index, from the read-ahead cache when it got there first. """
+        with self.lock:
+            particle_data = self.cache.get(index)
+        if particle_data is None:
+            # read-ahead fell behind (seek, scrub, first frame), decode here
+            particle_data = self.decode(index)
+            with self.lock:
+                self.cache[index] = particle_data
+        return particle_data
+
+    def upcoming(self):
+        previous, current = self.pair()
+        step = -1 if self.speed < 0 else 1
+        wanted = [previous, current]
+        index = current if step > 0 else previous
+        for _ in range(self.readAhead):
+            index += step
+            if self.loop and self.span:
+                index %= self.span + 1
+            if not 0 <= index <= self.span:
+                break
+            wanted.append(index)
+        return wanted
+
+    def read_ahead_loop(self):
+        while True:
+            with self.wake:
+                if self.closed:
+                    return
+                wanted = self.upcoming()
+                missing = [index for index in wanted if index not in self.cache]
+                if not missing:
+                    self.wake.wait(0.1)
+                    continue
+            particle_data = self.decode(missing[0])
+            with self.lock:
+                self.cache[missing[0]] = particle_data
+                # keeps the cache to the frames around the position, which may have moved meanwhile
+                wanted = self.upcoming()
+                for index in [index for index in self.cache if index not in wanted]:
+                    del self.cache[index]
+
+    def close(self):
+        with self.wake:
+            self.closed = True
+            self.wake.notify()
+        self.thread.join()
+        self.cache.clear()
@@ -0,0 +1,115 @@
+import numpy as np
+import OpenGL.GL as gl
+from shaderC import Shader
+
+
+class PrefixSum:
+    """ In-place exclusive prefix sum over a uint SSBO, recursing over the block totals. """
+    BLOCK_SIZE = 1024
+    DATA_BINDING = 10
+    BLOCK_SUMS_BINDING = 11
+
+    def __init__(self, compute_scan_shader: Shader):
+        self.COMPUTE_SCAN_SHADER = compute_scan_shader
+        self.block_sum_ssbos = []
+
+    def block_sum_buffer(self, level, count):
+        while len(self.block_sum_ssbos) <= level:
+            self.block_sum_ssbos.append([0, 0])
+        ssbo, capacity = self.block_sum_ssbos[level]
+        if ssbo == 0 or capacity < count:
+            if ssbo != 0:
+                gl.glDeleteBuffers(1, [ssbo])
+            ssbo = gl.glGenBuffers(1)
+            gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, ssbo)
+            gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, max(count, 1) * np.dtype(np.uint32).itemsize, None, gl.GL_DYNAMIC_COPY)
+            gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
+            self.block_sum_ssbos[level] = [ssbo, count]
+        return ssbo
+
+    def exclusive_scan(self, ssbo, count, level=0):
+        blocks = (count + self.BLOCK_SIZE - 1) // self.BLOCK_SIZE
+        block_sums = self.block_sum_buffer(level, blocks)
+
+        self.COMPUTE_SCAN_SHADER.set("SCAN_PHASE", 0)
+        self.COMPUTE_SCAN_SHADER.set("SCAN_COUNT", count)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.DATA_BINDING, ssbo)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.BLOCK_SUMS_BINDING, block_sums)
+        self.COMPUTE_SCAN_SHADER.dispatch(blocks, 1, 1)
+
+        if blocks > 1:
+            self.exclusive_scan(block_sums, blocks, level + 1)
+            self.COMPUTE_SCAN_SHADER.set("SCAN_PHASE", 1)
+            self.COMPUTE_SCAN_SHADER.set("SCAN_COUNT", count)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.DATA_BINDING, ssbo)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.BLOCK_SUMS_BINDING, block_sums)
+            self.COMPUTE_SCAN_SHADER.dispatch(blocks, 1, 1)
+
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.DATA_BINDING, 0)
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.BLOCK_SUMS_BINDING, 0)
+        gl.glUseProgram(0)
+
+
+class RadixSort:
+    """ Stable LSD radix sort of (uint key, uint value) SSBO pairs, one bit per split pass. """
+    LOCAL_X = 512
+    KEYS_BINDING = 12
+    VALUES_BINDING = 13
+    KEYS_OUT_BINDING = 14
+    VALUES_OUT_BINDING = 15
+
+    def __init__(self, compute_split_shader: Shader, prefix_sum: PrefixSum):
+        self.COMPUTE_SPLIT_SHADER = compute_split_shader
+        self.prefix_sum = prefix_sum
+        self.flags_ssbo = 0
+        self.flags_capacity = 0
+
+    def flags_buffer(self, count):
+        if self.flags_ssbo == 0 or self.flags_capacity < count + 1:
+            if self.flags_ssbo != 0:
+                gl.glDeleteBuffers(1, [self.flags_ssbo])
+            self.flags_ssbo = gl.glGenBuffers(1)
+            gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, self.flags_ssbo)
+            gl.glBufferData(gl.GL_SHADER_STORAGE_BUFFER, (count + 1) * np.dtype(np.uint32).itemsize, None, gl.GL_DYNAMIC_COPY)
+            gl.glBindBuffer(gl.GL_SHADER_STORAGE_BUFFER, 0)
+            self.flags_capacity = count + 1
+        return self.flags_ssbo
+
+    def sort(self, keys, values, keys_tmp, values_tmp, count, key_bits):
+        """ Sorts keys/values in place; the tmp buffers must hold count entries each. """
+        flags = self.flags_buffer(count)
+        groups = (count + self.LOCAL_X - 1) // self.LOCAL_X
+        src_keys, src_values, dst_keys, dst_values = keys, values, keys_tmp, values_tmp
+
+        for bit in range(key_bits):
+            self.COMPUTE_SPLIT_SHADER.set("SPLIT_PHASE", 0)
+            self.COMPUTE_SPLIT_SHADER.set("RADIX_BIT", bit)
+            self.COMPUTE_SPLIT_SHADER.set("SORT_COUNT", count)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, PrefixSum.DATA_BINDING, flags)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.KEYS_BINDING, src_keys)
+            self.COMPUTE_SPLIT_SHADER.dispatch(groups, 1, 1)
+
+            self.prefix_sum.exclusive_scan(flags, count + 1)
+
+            self.COMPUTE_SPLIT_SHADER.set("SPLIT_PHASE", 1)
+            self.COMPUTE_SPLIT_SHADER.set("RADIX_BIT", bit)
+            self.COMPUTE_SPLIT_SHADER.set("SORT_COUNT", count)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, PrefixSum.DATA_BINDING, flags)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.KEYS_BINDING, src_keys)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.VALUES_BINDING, src_values)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.KEYS_OUT_BINDING, dst_keys)
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, self.VALUES_OUT_BINDING, dst_values)
+            self.COMPUTE_SPLIT_SHADER.dispatch(groups, 1, 1)
+
+            src_keys, dst_keys = dst_keys, src_keys
+            src_values, dst_values = dst_values, src_values
+
+        # an odd pass count leaves the result in the tmp buffers
+        if key_bits % 2 == 1:
+            gl.glMemoryBarrier(gl.GL_BUFFER_UPDATE_BARRIER_BIT)
+            gl.glCopyNamedBufferSubData(keys_tmp, keys, 0, 0, count * np.dtype(np.uint32).itemsize)
+            gl.glCopyNamedBufferSubData(values_tmp, values, 0, 0, count * np.dtype(np.uint32).itemsize)
+
+        for binding in (PrefixSum.DATA_BINDING, self.KEYS_BINDING, self.VALUES_BINDING, self.KEYS_OUT_BINDING, self.VALUES_OUT_BINDING):
+            gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, binding, 0)
+        gl.glUseProgram(0)
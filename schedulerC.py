@@ -0,0 +1,46 @@
+class Scheduler:
+    """ Fixed-timestep accumulator, turns variable frame times into whole simulation steps. """
+
+    def __init__(self, simulationRate=20.0, maxSubsteps=4):
+        self.simulationRate = simulationRate
+        self.maxSubsteps = maxSubsteps
+        self.accumulator = 0.0
+        self.stepCount = 0
+        self.droppedSteps = 0
+        self.lastFrameSteps = 0
+
+    @property
+    def fixedDeltaTime(self):
+        return 1.0 / self.simulationRate
+
+    @property
+    def alpha(self):
+        # how far the display sits between the last two simulation states
+        return min(max(self.accumulator / self.fixedDeltaTime, 0.0), 1.0)
+
+    def advance(self, frameTime):
+        dt = self.fixedDeltaTime
+        self.accumulator += max(frameTime, 0.0)
+        # tolerance so a frame time of exactly one step never rounds down to zero steps
+        steps = int(self.accumulator / dt + 1e-6)
+        if steps > self.maxSubsteps:
+            # fell behind (hitch, window drag, breakpoint): drop the backlog instead of spiralling
+            self.droppedSteps += steps - self.maxSubsteps
+            steps = self.maxSubsteps
+            self.accumulator = self.accumulator % dt + steps * dt
+        self.accumulator -= steps * dt
+        self.lastFrameSteps = steps
+        return steps
+
+    def step(self):
+        self.stepCount += 1
+        return self.stepCount
+
+    def due(self, interval):
+        return self.stepCount % max(int(interval), 1) == 0
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.stepCount = 0
+        self.droppedSteps = 0
+        self.lastFrameSteps = 0
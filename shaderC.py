@@ -14,7 +14,11 @@ import OpenGL.GL  as gl
 from textureC import Texture
 
 import os
+import re
 import sys
+import ctypes
+import struct
+import numpy as np
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -24,13 +28,47 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+INCLUDE_PATTERN = re.compile(r'^\s*#include\s+"([^"]+)"\s*$', re.MULTILINE)
+
+
 class Shader:
+    # sources handed out to '#include "name"' before the file system is searched
+    GENERATED_SOURCES = {}
+    # GL uniform type: (glProgramUniform*, component conversion, components); bool vectors upload as ints
+    UNIFORM_SETTERS = {
+        gl.GL_FLOAT: (gl.glProgramUniform1f, float, 1),
+        gl.GL_FLOAT_VEC2: (gl.glProgramUniform2f, float, 2),
+        gl.GL_FLOAT_VEC3: (gl.glProgramUniform3f, float, 3),
+        gl.GL_FLOAT_VEC4: (gl.glProgramUniform4f, float, 4),
+        gl.GL_INT: (gl.glProgramUniform1i, int, 1),
+        gl.GL_INT_VEC2: (gl.glProgramUniform2i, int, 2),
+        gl.GL_INT_VEC3: (gl.glProgramUniform3i, int, 3),
+        gl.GL_INT_VEC4: (gl.glProgramUniform4i, int, 4),
+        gl.GL_UNSIGNED_INT: (gl.glProgramUniform1ui, int, 1),
+        gl.GL_UNSIGNED_INT_VEC2: (gl.glProgramUniform2ui, int, 2),
+        gl.GL_UNSIGNED_INT_VEC3: (gl.glProgramUniform3ui, int, 3),
+        gl.GL_UNSIGNED_INT_VEC4: (gl.glProgramUniform4ui, int, 4),
+        gl.GL_BOOL: (gl.glProgramUniform1i, int, 1),
+        gl.GL_BOOL_VEC2: (gl.glProgramUniform2i, int, 2),
+        gl.GL_BOOL_VEC3: (gl.glProgramUniform3i, int, 3),
+        gl.GL_BOOL_VEC4: (gl.glProgramUniform4i, int, 4),
+        gl.GL_FLOAT_MAT4: (gl.glProgramUniformMatrix4fv, float, 16),
+    }
+    # samplers and images take the texture unit / image unit as an int
+    TEXTURE_UNIT_TYPES = frozenset(int(getattr(gl, name)) for name in dir(gl)
+                                   if name.startswith(("GL_SAMPLER_", "GL_INT_SAMPLER_", "GL_UNSIGNED_INT_SAMPLER_",
+                                                       "GL_IMAGE_", "GL_INT_IMAGE_", "GL_UNSIGNED_INT_IMAGE_"))
+                                   and isinstance(getattr(gl, name), int))
+
     def __init__(self, vertex_directory=None, fragment_directory=None, compute_directory=None, shader_uniforms=None):
         print("[Shader] Initializing shader...")
         self.vertex_path = vertex_directory
         self.fragment_path = fragment_directory
         self.compute_path = compute_directory
         self.program = None
+        self.uniform_locations = {}
+        self.uniform_values = {}
+        self.uniform_blocks = {}
         self.uniforms = shader_uniforms or {}
         self.organize_uniforms()
         self.reload()
@@ -86,18 +124,66 @@ class Shader:
 
     def send_uniforms(self):
         """ Upload stored uniform values for this program. """
-        for name, value in self.uniforms_float.items():
-            loc = gl.glGetUniformLocation(self.program, name)
-            if loc != -1: gl.glUniform1f(loc, value)
-        for name, value in self.uniforms_int.items():
-            loc = gl.glGetUniformLocation(self.program, name)
-            if loc != -1: gl.glUniform1i(loc, value)
-        for name, value in self.uniforms_vec2.items():
-            loc = gl.glGetUniformLocation(self.program, name)
-            if loc != -1: gl.glUniform2fv(loc, 1, value)
-        for name, value in self.uniforms_vec3.items():
-            loc = gl.glGetUniformLocation(self.program, name)
-            if loc != -1: gl.glUniform3fv(loc, 1, value)
+        for uniforms in (self.uniforms_float, self.uniforms_int, self.uniforms_vec2, self.uniforms_vec3):
+            for name, value in uniforms.items():
+                self.set(name, value)
+
+    def introspect(self):
+        """ Cache locations and types of all active uniforms and the active uniform blocks. """
+        self.uniform_locations = {}
+        self.uniform_values = {}
+        self.uniform_blocks = {}
+
+        for index in range(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_UNIFORMS)):
+            name, _, uniform_type = gl.glGetActiveUniform(self.program, index)
+            name = name.decode() if isinstance(name, bytes) else name
+            if name.endswith("[0]"):
+                name = name[:-3]
+            location = gl.glGetUniformLocation(self.program, name)
+            # members of uniform blocks have no location
+            if location != -1:
+                self.uniform_locations[name] = (location, int(uniform_type))
+
+        value = np.zeros(1, dtype=np.int32)
+        for index in range(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_UNIFORM_BLOCKS)):
+            gl.glGetActiveUniformBlockiv(self.program, index, gl.GL_UNIFORM_BLOCK_NAME_LENGTH, value)
+            name = ctypes.create_string_buffer(int(value[0]) + 1)
+            gl.glGetActiveUniformBlockName(self.program, index, len(name), None, name)
+            gl.glGetActiveUniformBlockiv(self.program, index, gl.GL_UNIFORM_BLOCK_BINDING, value)
+            binding = int(value[0])
+            gl.glGetActiveUniformBlockiv(self.program, index, gl.GL_UNIFORM_BLOCK_DATA_SIZE, value)
+            self.uniform_blocks[name.value.decode()] = (binding, int(value[0]))
+
+    def set(self, name, value):
+        """ Upload a uniform by name, skipping unknown names and values that did not change. """
+        entry = self.uniform_locations.get(name)
+        if entry is None:
+            return False
+        if hasattr(value, "to_tuple"):
+            key = value.to_tuple()
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            key = tuple(np.ravel(value).tolist())
+        else:
+            key = value
+        if self.uniform_values.get(name) == key:
+            return False
+
+        location, uniform_type = entry
+        upload = self.UNIFORM_SETTERS.get(uniform_type)
+        if upload is None and uniform_type in self.TEXTURE_UNIT_TYPES:
+            upload = (gl.glProgramUniform1i, int, 1)
+        if upload is None:
+            raise ValueError(f"[Shader] Uniform '{name}' has GL type 0x{uniform_type:X}, Shader.set does not upload it")
+        setter, convert, components = upload
+        flat = np.ravel(key)
+        if len(flat) != components:
+            raise ValueError(f"[Shader] Uniform '{name}' takes {components} component(s), got {len(flat)}")
+        if components == 16:
+            setter(self.program, location, 1, gl.GL_FALSE, np.asarray(flat, dtype=np.float32))
+        else:
+            setter(self.program, location, *(convert(v) for v in flat))
+        self.uniform_values[name] = key
+        return True
 
     def dispatch(self, x, y=1, z=1):
         if not self.program or not self.compute_path:
@@ -107,6 +193,17 @@ class Shader:
         gl.glDispatchCompute(x, y, z)
         gl.glMemoryBarrier(gl.GL_SHADER_STORAGE_BARRIER_BIT | gl.GL_TEXTURE_FETCH_BARRIER_BIT) # type: ignore
 
+    def dispatch_indirect(self, buffer, offset=0):
+        """ Workgroup counts read on the GPU from three uints at offset bytes into buffer. """
+        if not self.program or not self.compute_path:
+            raise RuntimeError("No compute shader loaded")
+        gl.glUseProgram(self.program)
+        self.send_uniforms()
+        gl.glBindBuffer(gl.GL_DISPATCH_INDIRECT_BUFFER, buffer)
+        gl.glDispatchComputeIndirect(offset)
+        gl.glBindBuffer(gl.GL_DISPATCH_INDIRECT_BUFFER, 0)
+        gl.glMemoryBarrier(gl.GL_SHADER_STORAGE_BARRIER_BIT | gl.GL_TEXTURE_FETCH_BARRIER_BIT) # type: ignore
+
     def reload(self):
         try:
             if self.compute_path is not None:
@@ -129,6 +226,7 @@ class Shader:
                 prRed("[Shader] [Warning!] No Path could be found.")         
 
             # Immediately use and upload uniforms on load
+            self.introspect()
             gl.glUseProgram(self.program)
             self.send_uniforms()
 
@@ -136,11 +234,23 @@ class Shader:
             print(f"[Shader] Reload failed: {e}")
             self.program = None
 
-    @staticmethod
-    def load_source(path):
+    @classmethod
+    def register_source(cls, name, source):
+        cls.GENERATED_SOURCES[name] = source
+
+    @classmethod
+    def load_source(cls, path):
         print(f"[Shader] Loading source: {path}")
         with open(resource_path(path)) as f:
-            return f.read()
+            source = f.read()
+
+        def include(match):
+            name = match.group(1)
+            if name in cls.GENERATED_SOURCES:
+                return cls.GENERATED_SOURCES[name]
+            return cls.load_source(os.path.join(os.path.dirname(path), name))
+
+        return INCLUDE_PATTERN.sub(include, source)
 
     @staticmethod
     def compile_shader(shaderType, source):
@@ -202,6 +312,68 @@ class Shader:
             loaded[name] = cls(vertex, fragment, compute, uniforms)
         return loaded
 
-            
 
+class UniformBlock:
+    """ std140 uniform block, its GLSL declaration and a buffer that is only re-uploaded when a value changed. """
+    # glsl type: (base alignment, size, struct format)
+    STD140 = {
+        "float": (4, 4, "f"),
+        "int":   (4, 4, "i"),
+        "uint":  (4, 4, "I"),
+        "vec2":  (8, 8, "2f"),
+        "vec3":  (16, 12, "3f"),
+        "vec4":  (16, 16, "4f"),
+        "ivec3": (16, 12, "3i"),
+    }
+
+    def __init__(self, name, binding, fields):
+        self.name = name
+        self.binding = binding
+        self.fields = fields
+        self.offsets = {}
+        offset = 0
+        for field_name, field_type in fields:
+            align, size, _ = self.STD140[field_type]
+            offset = (offset + align - 1) // align * align
+            self.offsets[field_name] = offset
+            offset += size
+        self.size = (offset + 15) // 16 * 16
+        self.ubo = 0
+        self.data = None
+
+    @staticmethod
+    def declaration(name, binding, fields):
+        members = "\n".join(f"    {field_type} {field_name};" for field_name, field_type in fields)
+        return f"layout(std140, binding = {binding}) uniform {name} {{\n{members}\n}};\n"
+
+    def glsl(self):
+        return self.declaration(self.name, self.binding, self.fields)
+
+    def pack(self, values):
+        data = bytearray(self.size)
+        for field_name, field_type in self.fields:
+            fmt = self.STD140[field_type][2]
+            value = values[field_name]
+            if fmt[-1] in "iI":
+                components = [int(v) for v in np.ravel(value)] if fmt[0].isdigit() else [int(value)]
+            else:
+                components = [float(v) for v in np.ravel(value)] if fmt[0].isdigit() else [float(value)]
+            struct.pack_into("<" + fmt, data, self.offsets[field_name], *components)
+        return bytes(data)
 
+    def upload(self, values):
+        """ Packs values (a dict keyed by field name) and binds the block; returns True if data was uploaded. """
+        data = self.pack(values)
+        uploaded = False
+        if self.ubo == 0:
+            self.ubo = gl.glGenBuffers(1)
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+            gl.glBufferData(gl.GL_UNIFORM_BUFFER, self.size, data, gl.GL_DYNAMIC_DRAW)
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+            uploaded = True
+        elif data != self.data:
+            gl.glNamedBufferSubData(self.ubo, 0, self.size, data)
+            uploaded = True
+        self.data = data
+        gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, self.binding, self.ubo)
+        return uploaded
@@ -1,11 +1,10 @@
 #version 450
 
-struct Particle {
-    vec4 position_stress;
-    vec4 velocity_type;
-};
+#include "particle_layout.glsl"
 
 layout(std430, binding = 0) buffer ParticleBuffer { Particle particles[]; };
+layout(std430, binding = 16) buffer PreviousParticleBuffer { Particle previousParticles[]; };
+layout(std430, binding = 8) readonly buffer ParticleIds { uint particleIds[]; };
 
 uniform mat4 view;
 uniform mat4 projection;
@@ -14,16 +13,41 @@ uniform vec3 viewPos;
 
 out vec3 pInfo;
 uniform float PARTICLE_RADIUS;
+uniform float INTERPOLATION_ALPHA;
+uniform int gridSize;
+// batched universes are laid out side by side, UNIVERSE_COLUMNS per row UNIVERSE_SPACING apart
+uniform int UNIVERSE_COUNT;
+uniform int UNIVERSE_PARTICLES;
+uniform int UNIVERSE_COLUMNS;
+uniform float UNIVERSE_SPACING;
+
+vec3 universe_tile_offset() {
+    if (UNIVERSE_COUNT <= 1)
+        return vec3(0.0);
+    int universe = int(min(particleIds[gl_VertexID] / uint(UNIVERSE_PARTICLES), uint(UNIVERSE_COUNT - 1)));
+    int rows = (UNIVERSE_COUNT + UNIVERSE_COLUMNS - 1) / UNIVERSE_COLUMNS;
+    vec2 tile = vec2(universe % UNIVERSE_COLUMNS, universe / UNIVERSE_COLUMNS);
+    // centred on the origin, first universe top left
+    return vec3(tile.x - 0.5 * float(UNIVERSE_COLUMNS - 1), 0.5 * float(rows - 1) - tile.y, 0.0) * UNIVERSE_SPACING;
+}
 
 void main()
 {
     Particle p = particles[gl_VertexID];
+    vec3 position = position_of(p);
+    float stress = stress_of(p);
+
+    // blend between the last two simulation steps, except across a wrap around the world edge
+    vec3 previous = position_of(previousParticles[gl_VertexID]);
+    if (all(lessThan(abs(position - previous), vec3(float(gridSize) * 0.5))))
+        position = mix(previous, position, INTERPOLATION_ALPHA);
+    position += universe_tile_offset();
 
-    gl_Position = projection * view * vec4(p.position_stress.xyz, 1.0);
+    gl_Position = projection * view * vec4(position, 1.0);
 
-    float dist_to_camera = length(viewPos - p.position_stress.xyz);
-    float base_size = 2000. * ( PARTICLE_RADIUS * p.position_stress.w + PARTICLE_RADIUS);
+    float dist_to_camera = length(viewPos - position);
+    float base_size = 2000. * ( PARTICLE_RADIUS * stress + PARTICLE_RADIUS);
     gl_PointSize = base_size / (dist_to_camera);
     gl_PointSize = clamp(gl_PointSize, 2.0, base_size);
-    pInfo = vec3(p.velocity_type.w, p.position_stress.w, dist_to_camera);
+    pInfo = vec3(type_of(p), stress, dist_to_camera);
 }
@@ -0,0 +1,112 @@
+// Force accumulation and integration shared by particles.comp and particles_tiled.comp.
+// Expects particle_layout.glsl, sim_params.glsl, forceMatrix[] and interactionCount declared before it.
+
+const int MAX_POSSIBLE_TYPES = 30;
+
+// per-universe rules, one row for a single world; Particles.UNIVERSE_DTYPE on the CPU side
+struct UniverseRules {
+    float detectionRadius;
+    float tooCloseRadius;
+    float stepSize;
+    int activeTypes;
+};
+layout(std430, binding = 21) readonly buffer UniverseTable { UniverseRules universeTable[]; };
+
+// GLSL leaves % undefined for negative operands, so wrap through floor instead
+ivec3 wrap_cell(ivec3 cell) {
+    return cell - gridDims * ivec3(floor(vec3(cell) / vec3(gridDims)));
+}
+
+// rules of the universe being updated, select_universe sets them
+UniverseRules rules;
+int forceMatrixBase;
+
+void select_universe(int universe) {
+    rules = universeTable[universe];
+    forceMatrixBase = universe * MAX_POSSIBLE_TYPES * MAX_POSSIBLE_TYPES;
+}
+
+int neighbor_cell_search_span() {
+    if (cellSize > 0.0001)
+        return int(ceil(rules.detectionRadius / cellSize));
+    return rules.detectionRadius > 0.0001 ? 1 : 0;
+}
+
+// state of the particle being updated, begin_particle resets it
+vec3 selfPosition;
+vec3 selfVelocity;
+float selfTypeValue;
+int selfType;
+bool selfTypeValid;
+vec3 velocityAdjustment;
+float particlesInteractions;
+
+void begin_particle(Particle self) {
+    selfPosition = position_of(self);
+    selfVelocity = velocity_of(self);
+    selfTypeValue = type_of(self);
+    int roundedType = int(round(selfTypeValue));
+    selfTypeValid = roundedType >= 0 && roundedType < rules.activeTypes;
+    selfType = clamp(roundedType, 0, MAX_POSSIBLE_TYPES - 1);
+    velocityAdjustment = vec3(0.0);
+    particlesInteractions = 0.0;
+}
+
+void accumulate_neighbor(vec3 otherPosition, float otherTypeValue) {
+    int otherType = int(round(otherTypeValue));
+    if (otherType < 0 || otherType >= rules.activeTypes)
+        return;
+
+    vec3 relativeDistance = otherPosition - selfPosition;
+    float dist = length(relativeDistance);
+    vec3 dir = normalize(relativeDistance);
+    float forceMag = 1.0 / (dist * dist);
+
+    // forceMatrix[universe][acting * MAX_POSSIBLE_TYPES + receiving], precomputed on the CPU
+    if (dist > rules.tooCloseRadius && dist < rules.detectionRadius) {
+        particlesInteractions += 1.0;
+        velocityAdjustment += forceMatrix[forceMatrixBase + otherType * MAX_POSSIBLE_TYPES + selfType] * dir * forceMag;
+    } else if (dist < rules.tooCloseRadius) {
+        particlesInteractions += 1.0;
+        float strongRepel = 1.0 / (dist * dist * dist + 0.00001);
+        velocityAdjustment -= dir * strongRepel;
+    }
+}
+
+bool interactions_full() {
+    return particlesInteractions > MAX_PARTICLE_INTERACTIONS;
+}
+
+Particle finish_particle() {
+    float particle_stress = 0.0;
+    float dt = deltaTime * rules.stepSize;
+
+    if (!selfTypeValid)
+        velocityAdjustment = vec3(0.0);
+
+    if (length(velocityAdjustment) > 25.0)
+        velocityAdjustment = normalize(velocityAdjustment) * 25.0;
+    if (any(isnan(velocityAdjustment)) || any(isinf(velocityAdjustment)))
+        velocityAdjustment = vec3(0.0);
+
+    float baseDamping = 0.93;
+    float damping = clamp(pow(baseDamping, rules.stepSize), 0.6, 0.99);
+    vec3 new_velocity = selfVelocity * damping  + velocityAdjustment * dt;
+
+    particle_stress += length(velocityAdjustment * 0.001);
+
+    vec3 new_position = selfPosition + new_velocity * dt;
+
+    if (any(greaterThanEqual(abs(new_position), vec3(gridSize) / 2.0))) {
+        new_position = mod(new_position + vec3(gridSize) / 2.0, vec3(gridSize)) - vec3(gridSize) / 2.0;
+        new_position *= 0.95;
+        new_velocity *= 0.95;
+    }
+
+    // profiler only, one atomic per invocation
+    if (COUNT_INTERACTIONS != 0)
+        atomicAdd(interactionCount, uint(particlesInteractions));
+
+    float stress = particle_stress * 25.0 * (particlesInteractions / float(MAX_PARTICLE_INTERACTIONS));
+    return pack_particle(new_position, new_velocity, selfTypeValue, stress);
+}
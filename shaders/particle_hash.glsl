@@ -0,0 +1,49 @@
+// Open addressing table of the occupied world cells, shared by particles_hash.comp and particles.comp.
+// Expects sim_params.glsl and hashKeys[] (hashCapacity entries, cleared to HASH_EMPTY) declared before it.
+
+const uint HASH_EMPTY = 0xFFFFFFFFu;
+
+// world cells per axis, Particles keeps cells^3 * UNIVERSE_COUNT below HASH_EMPTY so every key fits a uint
+int hash_axis_cells() {
+    return int(ceil(float(gridSize) / cellSize));
+}
+
+// cells of the whole world rather than of a wrapped grid, so far apart clusters never share a cell
+ivec3 hash_cell(vec3 position) {
+    ivec3 cell = ivec3(floor((position + 0.5 * float(gridSize)) / cellSize));
+    return clamp(cell, ivec3(0), ivec3(hash_axis_cells() - 1));
+}
+
+bool hash_cell_inside(ivec3 cell) {
+    return all(greaterThanEqual(cell, ivec3(0))) && all(lessThan(cell, ivec3(hash_axis_cells())));
+}
+
+// batched universes stack along z, each keeps its own cells
+uint hash_key(ivec3 cell, int universe) {
+    uint cells = uint(hash_axis_cells());
+    return ((uint(universe) * cells + uint(cell.z)) * cells + uint(cell.y)) * cells + uint(cell.x);
+}
+
+// neighbouring keys differ in their low bits only, mix them before masking
+uint hash_slot(uint key) {
+    key ^= key >> 16;
+    key *= 0x7feb352du;
+    key ^= key >> 15;
+    key *= 0x846ca68bu;
+    key ^= key >> 16;
+    return key & (hashCapacity - 1u);
+}
+
+// slot holding key, -1 if the cell is empty; the table is at most half full so the probe ends
+int find_hash_slot(uint key) {
+    uint slot = hash_slot(key);
+    for (uint probe = 0u; probe < hashCapacity; ++probe) {
+        uint stored = hashKeys[slot];
+        if (stored == key)
+            return int(slot);
+        if (stored == HASH_EMPTY)
+            return -1;
+        slot = (slot + 1u) & (hashCapacity - 1u);
+    }
+    return -1;
+}
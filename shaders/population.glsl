@@ -0,0 +1,14 @@
+// GPU driven population: emitters and kill zones change the particle count on the GPU. The live count and
+// the indirect arguments sized from it are rewritten by particles_population.comp once a step.
+// Expects sim_params.glsl before it; the layout is mirrored by the POPULATION_* offsets in Particles.
+layout(std430, binding = 22) buffer Population {
+    uint liveCount;
+    uint physicsGroups[3];
+    uint particleGroups[3];
+    uint drawCommand[4];
+};
+
+// particles a pass covers, PARTICLE_COUNT while the CPU owns the count
+uint particle_count() {
+    return GPU_POPULATION != 0 ? liveCount : uint(PARTICLE_COUNT);
+}
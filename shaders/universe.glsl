@@ -0,0 +1,13 @@
+// Batched universes: UNIVERSE_COUNT independent worlds of UNIVERSE_PARTICLES particles share the particle
+// buffers. A particle's universe follows from its spawn id, which every reorder carries along, and each
+// universe bins into its own block of cells so neighbour searches never cross into another one.
+// Expects sim_params.glsl before it.
+
+int universe_of(uint particleId) {
+    return int(min(particleId / uint(UNIVERSE_PARTICLES), uint(UNIVERSE_COUNT - 1)));
+}
+
+// first dense cell of the universe, the blocks are gridDims cells each
+int universe_cell_offset(int universe) {
+    return universe * gridDims.x * gridDims.y * gridDims.z;
+}
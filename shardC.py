@@ -0,0 +1,285 @@
+""" CONTAINS
+        ShardedCPUBackend Class, the NumPy kernel split into slabs of cell rows balanced by particle count,
+        one worker process per slab """
+
+import os
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+from backendC import ParticleBackend, CPUBackend
+
+
+class SharedArray:
+    """ NumPy array over a named shared memory block, workers attach by name instead of receiving a pickle. """
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def slab_bounds(row_counts, shards):
+    """ Cell row range [bounds[s], bounds[s + 1]) owned by each shard, cut where the running particle count
+        crosses each shard's share. Every slab keeps at least one row. """
+    rows = len(row_counts)
+    cumulative = np.cumsum(row_counts)
+    if rows == 0 or cumulative[-1] == 0:
+        return np.linspace(0, rows, shards + 1).round().astype(np.int64)
+    targets = cumulative[-1] * np.arange(1, shards) / shards
+    cuts = np.searchsorted(cumulative, targets, side="left") + 1
+    # the row that crosses a share goes to whichever side leaves the cut closer to it
+    before = np.where(cuts > 1, cumulative[np.maximum(cuts - 2, 0)], 0)
+    cuts = np.where(targets - before < cumulative[cuts - 1] - targets, cuts - 1, cuts)
+    # strictly increasing, with a row left for every slab
+    lift = np.arange(shards - 1)
+    cuts = np.clip(cuts, 1 + lift, rows - shards + 1 + lift)
+    cuts = np.maximum.accumulate(cuts - lift) + lift
+    return np.concatenate([[0], cuts, [rows]]).astype(np.int64)
+
+
+def cell_row(positions, params):
+    """ Row of cells along x a particle bins into, (z, y) in z major order like CPUBackend.cell_keys. """
+    gridDims = CPUBackend.grid_dims(params)
+    cells = np.floor((positions[:, 1:3] + np.float32(1.0)) / np.float32(params["cellSize"])).astype(np.int64)
+    cells = CPUBackend.wrap_cell(cells, gridDims[1:3])
+    return cells[:, 1] * gridDims[1] + cells[:, 0]
+
+
+def row_count(params):
+    return int(params["gridDims"][1]) * int(params["gridDims"][2])
+
+
+def halo_runs(begin, end, span, params):
+    """ Contiguous [begin, end) row runs holding cells within span of rows [begin, end), wrapped, excluding
+        the rows themselves. """
+    height, depth = int(params["gridDims"][1]), int(params["gridDims"][2])
+    z, y = np.divmod(np.arange(begin, end), height)
+    axis = np.arange(-span, span + 1)
+    near = ((z[:, None, None] + axis[:, None]) % depth) * height + (y[:, None, None] + axis[None, :]) % height
+    rows = np.unique(near)
+    rows = rows[(rows < begin) | (rows >= end)]
+    # split wherever consecutive halo rows are not adjacent
+    breaks = np.nonzero(np.diff(rows) != 1)[0] + 1
+    return [(int(run[0]), int(run[-1]) + 1) for run in np.split(rows, breaks) if len(run)]
+
+
+class ShardWorker:
+    """ Runs in the worker process. Every step: advance own rows against own + halo rows, then a
+        distributed counting sort moves particles into the slab that owns their cell row next step. """
+
+    def __init__(self, shard, shards, specs, barrier):
+        self.shard = shard
+        self.shards = shards
+        self.barrier = barrier
+        self.state = [SharedArray.attach(spec) for spec in specs["state"]]
+        self.ids = [SharedArray.attach(spec) for spec in specs["ids"]]
+        self.cell_row = SharedArray.attach(specs["cell_row"])
+        self.send_counts = SharedArray.attach(specs["send_counts"])
+        self.kernel = CPUBackend()
+
+    def step(self, current, rowStart, bounds, nextBounds, params, force_matrix):
+        """ bounds are the slabs the current buffer is split by, nextBounds the ones the next buffer is
+            sorted into, so the parent can rebalance without an extra exchange. """
+        state, next_state = self.state[current].array, self.state[1 - current].array
+        ids, next_ids = self.ids[current].array, self.ids[1 - current].array
+        cell_rows = self.cell_row.array
+        begin, end = rowStart[self.shard], rowStart[self.shard + 1]
+
+        # each shard's particles are sorted by cell row, so a halo run is one searchsorted slice per shard it touches
+        halo = []
+        span = CPUBackend.search_span(params)
+        if self.shards > 1:
+            for run_begin, run_end in halo_runs(bounds[self.shard], bounds[self.shard + 1], span, params):
+                for other in range(self.shards):
+                    if other == self.shard or bounds[other + 1] <= run_begin or bounds[other] >= run_end:
+                        continue
+                    rows = cell_rows[rowStart[other]:rowStart[other + 1]]
+                    first = rowStart[other] + np.searchsorted(rows, run_begin, side="left")
+                    last = rowStart[other] + np.searchsorted(rows, run_end, side="left")
+                    halo.append(state[first:last])
+        local = np.concatenate([state[begin:end]] + halo) if halo else state[begin:end].copy()
+        count = end - begin
+        self.kernel.advance(local, count, params, force_matrix, source_count=len(local))
+        advanced = local[:count]
+        advanced_ids = ids[begin:end]
+
+        destination = np.searchsorted(nextBounds, cell_row(advanced, params), side="right") - 1
+        self.send_counts.array[self.shard] = np.bincount(destination, minlength=self.shards)
+        self.barrier.wait()
+
+        counts = self.send_counts.array
+        nextRowStart = np.zeros(self.shards + 1, dtype=np.int64)
+        np.cumsum(counts.sum(axis=0), out=nextRowStart[1:])
+        offsets = nextRowStart[:-1] + counts[:self.shard].sum(axis=0)
+        order = np.argsort(destination, kind="stable")
+        sent = np.zeros(self.shards + 1, dtype=np.int64)
+        np.cumsum(counts[self.shard], out=sent[1:])
+        for target in np.nonzero(counts[self.shard])[0]:
+            rows = order[sent[target]:sent[target + 1]]
+            next_state[offsets[target]:offsets[target] + len(rows)] = advanced[rows]
+            next_ids[offsets[target]:offsets[target] + len(rows)] = advanced_ids[rows]
+        self.barrier.wait()
+
+        # everyone is past the halo reads, so the shared cell row column can be rewritten
+        begin, end = nextRowStart[self.shard], nextRowStart[self.shard + 1]
+        row = cell_row(next_state[begin:end], params)
+        order = np.argsort(row, kind="stable")
+        next_state[begin:end] = next_state[begin:end][order]
+        next_ids[begin:end] = next_ids[begin:end][order]
+        cell_rows[begin:end] = row[order]
+        return nextRowStart
+
+    def close(self):
+        for shared in self.state + self.ids + [self.cell_row, self.send_counts]:
+            shared.close()
+
+
+def shard_main(shard, shards, specs, barrier, connection):
+    worker = ShardWorker(shard, shards, specs, barrier)
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == "close":
+                break
+            connection.send(worker.step(*message[1:]))
+    finally:
+        worker.close()
+
+
+class ShardedCPUBackend(ParticleBackend):
+    """ CPUBackend split across processes: each worker owns a slab of consecutive cell rows, state lives in
+        shared memory shaped like particle_data and only halo rows are read across slabs. The slabs are
+        re-cut by particle count whenever the largest outgrows the mean by imbalanceTolerance. """
+    name = "cpu_sharded"
+    imbalanceTolerance = 0.1
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = []
+        self.connections = []
+        self.shared = None
+        # state held in the parent until the first step knows the grid the shards are cut from
+        self.pending = np.zeros((0, 8), dtype=np.float32)
+        self.count = 0
+        self.shards = 0
+        self.current = 0
+
+    def load(self, particle_data):
+        self.close()
+        self.pending = np.array(particle_data, dtype=np.float32, copy=True)
+        self.count = len(self.pending)
+
+    def shard_count(self, params):
+        # slabs are at least one cell row, a halo reaching past the next slab reads from every slab it touches
+        return max(1, min(self.workers, row_count(params)))
+
+    def start(self, params):
+        """ Sizes the shards for this grid, then hands the loaded state to the workers. """
+        self.close()
+        particle_data = self.pending
+        self.shards = self.shard_count(params)
+        self.shared = {
+            "state": [SharedArray(particle_data.shape, np.float32) for _ in range(2)],
+            "ids": [SharedArray((self.count,), np.int64) for _ in range(2)],
+            "cell_row": SharedArray((self.count,), np.int64),
+            "send_counts": SharedArray((self.shards, self.shards), np.int64),
+        }
+        self.current = 0
+        self.shared["state"][0].array[:] = particle_data
+        self.shared["ids"][0].array[:] = np.arange(self.count)
+        self.partition(params)
+
+        specs = {key: [a.spec for a in value] if isinstance(value, list) else value.spec
+                 for key, value in self.shared.items()}
+        # spawn, a forked child would inherit the parent's GL context and driver threads
+        context = mp.get_context("spawn")
+        self.barrier = context.Barrier(self.shards)
+        for shard in range(self.shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=shard_main, args=(shard, self.shards, specs, self.barrier, child), daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.connections.append(parent)
+        self.pending = None
+
+    def partition(self, params):
+        """ Sorts the current buffer into slabs of this grid's cell rows, in place in shared memory. """
+        state = self.shared["state"][self.current].array
+        ids = self.shared["ids"][self.current].array
+        row = cell_row(state, params)
+        self.bounds = slab_bounds(np.bincount(row, minlength=row_count(params)), self.shards)
+        self.nextBounds = self.bounds
+        slab = np.searchsorted(self.bounds, row, side="right") - 1
+        order = np.lexsort((row, slab))
+        state[:] = state[order]
+        ids[:] = ids[order]
+        self.shared["cell_row"].array[:] = row[order]
+        self.rowStart = np.zeros(self.shards + 1, dtype=np.int64)
+        np.cumsum(np.bincount(slab, minlength=self.shards), out=self.rowStart[1:])
+        self.layout = (tuple(params["gridDims"]), params["cellSize"])
+
+    def read(self):
+        if self.shared is None:
+            return self.pending.copy()
+        data = self.shared["state"][self.current].array
+        ordered = np.empty_like(data)
+        ordered[self.shared["ids"][self.current].array] = data
+        return ordered
+
+    def step(self, params, force_matrix):
+        if self.count == 0:
+            return
+        if self.shared is None or self.shard_count(params) != self.shards:
+            self.start(params)
+        elif self.layout != (tuple(params["gridDims"]), params["cellSize"]):
+            # the workers sit in recv between steps, a new grid only re-sorts the shared state under them
+            self.partition(params)
+        for connection in self.connections:
+            connection.send(("step", self.current, self.rowStart, self.bounds, self.nextBounds, params, force_matrix))
+        for connection in self.connections:
+            self.rowStart = connection.recv()
+        self.current = 1 - self.current
+        self.bounds = self.nextBounds
+        self.rebalance(params)
+
+    def rebalance(self, params):
+        """ Picks the slabs the next step sorts into, re-cut from the cell row column once one slab holds
+            more than its share. """
+        if np.diff(self.rowStart).max() <= (1.0 + self.imbalanceTolerance) * self.count / self.shards:
+            return
+        counts = np.bincount(self.shared["cell_row"].array, minlength=row_count(params))
+        self.nextBounds = slab_bounds(counts, self.shards)
+
+    def close(self):
+        if self.shared is not None:
+            self.pending = self.read()
+        for connection in self.connections:
+            connection.send(("close",))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+        if self.shared is not None:
+            for value in self.shared.values():
+                for shared in value if isinstance(value, list) else [value]:
+                    shared.close()
+            self.shared = None
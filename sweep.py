@@ -0,0 +1,316 @@
+""" Parameter sweep: runs every combination of a parameter grid headlessly and collects summary metrics.
+
+    python sweep.py config/sweep_example.json --out out/sweep01 --jobs 16
+    python sweep.py config/sweep_example.json --out out/sweep01 --mode gpu --thumbnails
+    python sweep.py config/sweep_example.json --out out/sweep01 --mode gpu --batch 32
+
+The grid file (JSON, or YAML when PyYAML is installed) maps Particles attributes to value lists,
+optionally as {"grid": {...}, "fixed": {...}, "steps": 300}. Finished runs are appended to
+results.jsonl as they complete, rerunning the same command skips them and picks up the rest.
+
+cellSize only sizes the CPU kernel's grid. The GPU derives its cell grid from the detection radius and
+the particle bounds (Particles.autoGrid) and ignores it; neither changes which neighbours are found.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+
+import numpy as np
+
+from backendC import CPUBackend, spawn_particles, hashed_force_matrix
+
+# Particles attributes a sweep may set, with the defaults Particles starts from
+SWEEP_DEFAULTS = {
+    "randomSeed": 11,
+    "numTypes": 4,
+    "detectionRadius": 1.2,
+    "tooCloseRadius": 1.1,
+    "stepSize": 0.8,
+    "particleCount": 5_000,
+    "spawnGridSize": 15,
+    "gridSize": 100,
+    "cellSize": 1.0,
+    "maxInteractions": 500,
+    "simulationRate": 20.0,
+    "spawnSeed": 0,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run every combination of a parameter grid headlessly.")
+    parser.add_argument("grid", help="JSON or YAML parameter grid")
+    parser.add_argument("--out", default="out/sweep")
+    parser.add_argument("--mode", choices=("cpu", "gpu"), default="cpu",
+                        help="cpu: NumPy kernel in a process pool, gpu: runs queued on one offscreen context")
+    parser.add_argument("--jobs", type=int, default=None, help="pool size for --mode cpu, defaults to all cores")
+    parser.add_argument("--steps", type=int, default=None, help="overrides the grid file, default 300")
+    parser.add_argument("--thumbnails", action="store_true", help="write a top-down PNG of every final state")
+    parser.add_argument("--backend", default="egl", help="offscreen GL backend for --mode gpu")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="--mode gpu: runs stepped together as batched universes, when they differ in their rules only")
+    return parser.parse_args(argv)
+
+
+def load_grid(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("[Sweep] YAML grids need PyYAML, pip install pyyaml or use JSON")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if "grid" not in spec:
+        spec = {"grid": spec}
+    unknown = set(spec["grid"]) | set(spec.get("fixed", {}))
+    unknown -= set(SWEEP_DEFAULTS)
+    if unknown:
+        raise SystemExit(f"[Sweep] Unknown parameters: {', '.join(sorted(unknown))}")
+    return spec
+
+
+def expand(spec):
+    """ One config per grid combination, fixed values and defaults filled in. """
+    grid = spec["grid"]
+    names = sorted(grid)
+    base = dict(SWEEP_DEFAULTS, **spec.get("fixed", {}))
+    for values in itertools.product(*(grid[name] if isinstance(grid[name], list) else [grid[name]] for name in names)):
+        yield dict(base, **dict(zip(names, values)))
+
+
+def run_id(config, steps, mode):
+    key = json.dumps(dict(config, steps=steps, mode=mode), sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def sim_params(config):
+    # what Particles.sim_param_values sends for the same attributes
+    return {
+        "PARTICLE_COUNT": config["particleCount"],
+        "gridSize": config["gridSize"],
+        # the fixed gridSize^3 cell grid, the neighbours found do not depend on its shape
+        "gridDims": (config["gridSize"],) * 3,
+        "cellSize": config["cellSize"],
+        "deltaTime": 1.0 / config["simulationRate"],
+        "stepSize": config["stepSize"],
+        "DETECTION_RADIUS": config["detectionRadius"],
+        "TOO_CLOSE_RADIUS": config["tooCloseRadius"],
+        "ACTIVE_TYPES": config["numTypes"],
+        "MAX_PARTICLE_INTERACTIONS": config["maxInteractions"],
+        "PARTITION_MODE": 0,
+    }
+
+
+def measure(particle_data, numTypes, detectionRadius):
+    """ Kinetic energy, stress and per-type clustering of one state. """
+    positions = particle_data[:, 0:3]
+    velocities = particle_data[:, 4:7].astype(np.float64)
+    stress = particle_data[:, 3]
+    types = np.rint(particle_data[:, 7]).astype(np.int64)
+
+    # Lloyd's mean crowding on a detection-radius grid: same-type crowding relative to what the
+    # type's share of the overall crowding predicts, 1 = mixed, above 1 = the type clumps together
+    _, cell = np.unique(np.floor(positions / np.float32(detectionRadius)).astype(np.int64), axis=0, return_inverse=True)
+    cell = cell.ravel()
+
+    def crowding(cells):
+        occupancy = np.bincount(cells).astype(np.float64)
+        return float((occupancy * (occupancy - 1)).sum() / max(len(cells), 1))
+
+    overall = crowding(cell)
+    clustering = []
+    for t in range(numTypes):
+        members = cell[types == t]
+        expected = overall * len(members) / max(len(cell), 1)
+        clustering.append(crowding(members) / expected if expected > 0 else 0.0)
+
+    return {
+        "kinetic_energy": float(0.5 * np.einsum("ij,ij->i", velocities, velocities).mean()) if len(velocities) else 0.0,
+        "mean_speed": float(np.linalg.norm(velocities, axis=1).mean()) if len(velocities) else 0.0,
+        "mean_stress": float(stress.mean()) if len(stress) else 0.0,
+        "max_stress": float(stress.max()) if len(stress) else 0.0,
+        "crowding": overall,
+        "clustering": clustering,
+        "finite": bool(np.isfinite(particle_data).all()),
+    }
+
+
+def thumbnail(particle_data, numTypes, path, size=160):
+    """ Top-down additive splat of the positions, coloured by type. """
+    from PIL import Image
+    import colorsys
+    palette = np.array([colorsys.hsv_to_rgb(t / max(numTypes, 1), 0.75, 1.0) for t in range(max(numTypes, 1))])
+    positions = particle_data[:, 0:2]
+    extent = max(float(np.abs(positions).max()) if len(positions) else 1.0, 1e-6)
+    pixel = np.clip(((positions / extent + 1.0) * 0.5 * (size - 1)).astype(np.int64), 0, size - 1)
+    types = np.clip(np.rint(particle_data[:, 7]).astype(np.int64), 0, len(palette) - 1)
+    image = np.zeros((size, size, 3))
+    np.add.at(image, (size - 1 - pixel[:, 1], pixel[:, 0]), palette[types])
+    image = np.log1p(image) / max(np.log1p(image).max(), 1e-6)
+    Image.fromarray((image * 255).astype(np.uint8)).save(path)
+
+
+def run_cpu(config, steps, thumbnail_path=None):
+    start = time.perf_counter()
+    np.random.seed(config["spawnSeed"])
+    half = config["spawnGridSize"] / 2
+    backend = CPUBackend()
+    backend.load(spawn_particles(config["particleCount"], (half, half, half), config["numTypes"]))
+    params = sim_params(config)
+    matrix = hashed_force_matrix(config["randomSeed"], config["numTypes"], config["gridSize"])
+    for _ in range(steps):
+        backend.step(params, matrix)
+    particle_data = backend.read()
+    return finish(config, steps, "cpu", particle_data, time.perf_counter() - start, thumbnail_path)
+
+
+def finish(config, steps, mode, particle_data, seconds, thumbnail_path):
+    result = {"run": run_id(config, steps, mode), "mode": mode, "steps": steps, "seconds": seconds, "params": config}
+    result.update(measure(particle_data, config["numTypes"], config["detectionRadius"]))
+    if thumbnail_path is not None:
+        thumbnail(particle_data, config["numTypes"], thumbnail_path)
+        result["thumbnail"] = os.path.basename(thumbnail_path)
+    return result
+
+
+class GPUQueue:
+    """ Runs configs on a single offscreen context and Particles instance, batches of them as universes
+        stepped by the same dispatches. """
+
+    def __init__(self, backend):
+        from contextC import select_backend, OffscreenContext
+        select_backend(backend)
+        self.context = OffscreenContext(64, 64, backend)
+        import particlesC
+        from loadC import Load
+        from shaderC import Shader
+        shaders = Shader.load_all_shaders(Load.load_shader_repository("config/repository_shaders.json"))
+        self.particles = particlesC.Particles(shaders)
+
+    def batches(self, configs, size):
+        """ Groups of at most size configs that only differ in per-universe rules, in order. """
+        groups = {}
+        for config in configs:
+            shared = tuple(sorted((name, value) for name, value in config.items() if name not in self.particles.UNIVERSE_FIELDS))
+            groups.setdefault(shared, []).append(config)
+        return [group[i:i + size] for group in groups.values() for i in range(0, len(group), size)]
+
+    def run(self, configs, steps, thumbnail_paths):
+        """ Steps the configs as universes of one batch, the shared values come from the first. Every run
+            starts from the same state, so a config's metrics do not depend on where it sits in the queue. """
+        import OpenGL.GL as gl
+        particles = self.particles
+        first = configs[0]
+        start = time.perf_counter()
+        # step counts pick the partition and bounds refresh steps, bounds in flight belong to the last run
+        particles.scheduler.reset()
+        particles.scheduler.simulationRate = first["simulationRate"]
+        particles.deltaTime = particles.scheduler.fixedDeltaTime
+        if particles.boundsFence is not None:
+            gl.glDeleteSync(particles.boundsFence)
+            particles.boundsFence = None
+        particles.gridBounds = None
+        # re-binned every step like the CPU kernel, linked lists rebuilt every partitionInterval steps miss
+        # neighbours that changed cells in between
+        particles.partitionMode = "counting_sort"
+        particles.partitionInterval = 1
+        for name in ("spawnGridSize", "maxInteractions"):
+            setattr(particles, name, first[name])
+        if particles.gridSize != first["gridSize"]:
+            particles.gridSize = first["gridSize"]
+            particles.update_grid_size()
+        particles.set_universes([{name: config[name] for name in particles.UNIVERSE_FIELDS} for config in configs],
+                                first["particleCount"])
+        for _ in range(steps):
+            particles.simulate_step()
+        blocks = particles.split_universes(particles.read_particles())
+        seconds = time.perf_counter() - start
+        results = [finish(config, steps, "gpu", block, seconds, path) for config, block, path in zip(configs, blocks, thumbnail_paths)]
+        for result in results:
+            result["batch"] = len(configs)
+        return results
+
+    def close(self):
+        self.context.destroy()
+
+
+def completed_runs(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {json.loads(line)["run"] for line in f if line.strip()}
+
+
+def write_table(results_path, table_path):
+    """ Flattens results.jsonl into one CSV row per run. """
+    import csv
+    rows = []
+    with open(results_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            row = {key: value for key, value in result.items() if key not in ("params", "clustering")}
+            row.update(result["params"])
+            row.update({f"clustering_{t}": value for t, value in enumerate(result["clustering"])})
+            rows.append(row)
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(table_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(args):
+    spec = load_grid(args.grid)
+    steps = args.steps if args.steps is not None else spec.get("steps", 300)
+    os.makedirs(args.out, exist_ok=True)
+    results_path = os.path.join(args.out, "results.jsonl")
+    done = completed_runs(results_path)
+    configs = list(expand(spec))
+    total = len(configs)
+    configs = [config for config in configs if run_id(config, steps, args.mode) not in done]
+    print(f"[Sweep] {total} runs, {total - len(configs)} already done, {len(configs)} to go ({args.mode})")
+
+    def thumbnail_path(config):
+        return os.path.join(args.out, f"{run_id(config, steps, args.mode)}.png") if args.thumbnails else None
+
+    finished = total - len(configs)
+    with open(results_path, "a") as results:
+        def record(result):
+            nonlocal finished
+            finished += 1
+            results.write(json.dumps(result) + "\n")
+            # flushed per run, a killed sweep loses at most the runs still in flight
+            results.flush()
+            print(f"[Sweep] {finished}/{total} {result['run']} in {result['seconds']:.1f}s, "
+                  f"KE {result['kinetic_energy']:.3g}, stress {result['mean_stress']:.3g}")
+
+        if configs and args.mode == "gpu":
+            queue = GPUQueue(args.backend)
+            for batch in queue.batches(configs, max(args.batch, 1)):
+                for result in queue.run(batch, steps, [thumbnail_path(config) for config in batch]):
+                    record(result)
+            queue.close()
+        elif configs:
+            import multiprocessing as mp
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            jobs = args.jobs or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=mp.get_context("spawn")) as pool:
+                futures = [pool.submit(run_cpu, config, steps, thumbnail_path(config)) for config in configs]
+                for future in as_completed(futures):
+                    record(future.result())
+
+    if os.path.exists(results_path):
+        write_table(results_path, os.path.join(args.out, "results.csv"))
+    print(f"[Sweep] results -> {os.path.join(args.out, 'results.csv')}")
+
+
+if __name__ == "__main__":
+    run(parse_args())
+    sys.exit(0)
@@ -0,0 +1,45 @@
+""" Short GPU/CPU conformance runs through headless.py, skipped where no EGL context can be created. """
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = ("from contextC import select_backend; select_backend('egl'); "
+         "from contextC import OffscreenContext; OffscreenContext(64, 64, 'egl').destroy()")
+
+
+def headless(*argv):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "headless.py"), *argv], cwd=ROOT,
+                          capture_output=True, text=True, timeout=900)
+
+
+@pytest.fixture(scope="module")
+def egl():
+    # the GL platform is picked at import time, so the probe runs in its own interpreter
+    probe = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    if probe.returncode != 0:
+        pytest.skip(f"no EGL context: {probe.stderr.strip().splitlines()[-1:] or probe.returncode}")
+
+
+def conformance(tmp_path, *argv):
+    result = headless("--conformance", "5", "--particles", "2000", "--out", str(tmp_path), *argv)
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+    with open(tmp_path / "conformance.json") as f:
+        return json.load(f), result.stdout
+
+
+def test_counting_sort(egl, tmp_path):
+    report, _ = conformance(tmp_path, "--partition-mode", "counting_sort")
+    assert report["failures"] == 0
+    assert report["max_error"] <= report["tolerance"]
+
+
+def test_linked_list_is_checked_as_counting_sort(egl, tmp_path):
+    report, stdout = conformance(tmp_path, "--partition-mode", "linked_list")
+    assert "checking counting_sort instead" in stdout
+    assert report["partition_mode"] == "counting_sort"
+    assert report["failures"] == 0